@@ -0,0 +1,77 @@
+"""
+Compares the vectorized single pass cause code resolver against the per list .loc/.map cascade it replaced.
+
+Usage: python -m benchmarks.bench_cause_resolution --rows 3000000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from benchmarks import synthetic_morticd10
+from pipeline.ingest import icd10_mortality_rates_processor
+from pipeline.parsers import icd_10_code_parsers
+
+
+def legacy_resolve_causes(mortality_df, condensed_dict, cause_code_3_char_dict, portugal_dict):
+    """
+    The cascade of boolean mask passes used before resolve_causes, one pass per ICD10 list.
+    """
+    mortality_df = mortality_df.copy()
+    mortality_df.loc[mortality_df['list'] == '101', 'cause'] = \
+        mortality_df.loc[mortality_df['list'] == '101', 'cause'].map(condensed_dict)
+    mortality_df.loc[mortality_df['list'] == '103', 'cause'] = \
+        mortality_df.loc[mortality_df['list'] == '103', 'cause'].map(cause_code_3_char_dict)
+    mortality_df.loc[mortality_df['list'] == '104', 'cause'] = \
+        mortality_df.loc[mortality_df['list'] == '104', 'cause'].map(lambda x: x[:3]).map(cause_code_3_char_dict)
+    mortality_df.loc[mortality_df['list'] == '10M', 'cause'] = \
+        mortality_df.loc[mortality_df['list'] == '10M', 'cause'].map(lambda x: x[:3]).map(cause_code_3_char_dict)
+    mortality_df.loc[mortality_df['list'] == 'UE1', 'cause'] = \
+        mortality_df.loc[mortality_df['list'] == 'UE1', 'cause'].map(portugal_dict)
+    return mortality_df['cause']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=3000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    condensed_dict = icd_10_code_parsers.get_condensed_cause_code_dict()
+    cause_code_3_char_dict = icd_10_code_parsers.get_3_char_cause_code_dict()
+    portugal_dict = icd_10_code_parsers.get_portugal_condensed_cause_code_dict()
+    cause_code_index = icd_10_code_parsers.get_3_char_cause_code_index()
+    cause_dimension = icd_10_code_parsers.build_cause_dimension(condensed_dict, cause_code_index, portugal_dict)
+    cause_lookup = icd_10_code_parsers.build_cause_id_lookup(
+        icd_10_code_parsers.build_cause_code_lookup(condensed_dict, portugal_dict), cause_dimension)
+    cause_code_index_ids = icd_10_code_parsers.get_cause_ids(cause_dimension, cause_code_index.causes)
+    mortality_df = synthetic_morticd10.synthetic_list_cause_codes(args.rows, synthetic_morticd10.get_code_tables(),
+                                                                  np.random.default_rng(0))
+    mortality_df = mortality_df.rename(columns=str.lower).astype(str)
+
+    implementations = {
+        'legacy .loc/.map cascade':
+            lambda: legacy_resolve_causes(mortality_df, condensed_dict, cause_code_3_char_dict, portugal_dict),
+        'resolve_causes':
+            lambda: icd10_mortality_rates_processor.resolve_causes(mortality_df['list'], mortality_df['cause'],
+                                                                   cause_lookup, cause_code_index,
+                                                                   cause_code_index_ids),
+    }
+
+    results = {}
+    for name, implementation in implementations.items():
+        timings = []
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            results[name] = implementation()
+            timings.append(time.perf_counter() - start_time)
+        print(f"{name:<30} {args.rows:>10} rows  best of {args.repeat}: {min(timings):.3f}s")
+
+    # resolve_causes gives cause ids, which are compared by the names they stand for
+    pd.testing.assert_series_equal(pd.Series(cause_dimension.reindex(results['resolve_causes']).to_numpy(),
+                                             name='cause'),
+                                   results['legacy .loc/.map cascade'].astype(object),
+                                   check_dtype=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compares DataFrame.to_sql(method='multi') against the COPY based postgres_loader on a synthetic frame the size of a
+processed Morticd10 part.
+
+Requires a running who database (see postgres/postgres-run.sh). Rows are written to a scratch copy of the
+mortality_facts table which is dropped afterwards.
+
+Usage: python -m benchmarks.bench_postgres_loader --rows 1000000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from definitions import DATABASE_URL
+from pipeline.loaders import postgres_loader
+from pipeline.parsers import code_dictionary_cache
+from pipeline.parsers import icd_10_code_parsers
+
+
+BENCH_TABLE = 'mortality_rates_bench'
+
+
+def synthetic_mortality_rates(n_rows, seed=0):
+    """
+    Creates a processed mortality rates DataFrame with unique (country_id, year, cause_id, sex) keys drawn from the
+    bundled code tables.
+
+    :param n_rows: int
+    :param seed: int
+    :return: DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    code_dictionaries = code_dictionary_cache.get_code_dictionaries()
+    countries = np.array(sorted(code_dictionaries['country']), dtype=np.int16)
+    causes = icd_10_code_parsers.build_cause_dimension(code_dictionaries['condensed'], code_dictionaries['3_char'],
+                                                       code_dictionaries['portugal']).index.to_numpy(np.int16)
+    years = np.arange(1979, 2020)
+    sexes = np.array(['m', 'f', 'u'], dtype=object)
+
+    shape = (len(countries), len(years), len(causes), len(sexes))
+    n_rows = min(n_rows, int(np.prod(shape)))
+    country_idx, year_idx, cause_idx, sex_idx = np.unravel_index(
+        rng.choice(int(np.prod(shape)), size=n_rows, replace=False), shape)
+
+    return pd.DataFrame({'country_id': countries[country_idx],
+                         'year': years[year_idx],
+                         'cause_id': causes[cause_idx],
+                         'sex': sexes[sex_idx],
+                         'deaths': rng.poisson(40, size=n_rows)})
+
+
+def create_bench_table(conn):
+    """
+    Creates the scratch table as a plain (unpartitioned) copy of the columns and primary key of mortality_facts.
+
+    :param conn: SQLAlchemy connection
+    """
+    conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+    conn.execute(text(f"CREATE TABLE {BENCH_TABLE} (LIKE mortality_facts INCLUDING DEFAULTS)"))
+    conn.execute(text(f"ALTER TABLE {BENCH_TABLE} ADD PRIMARY KEY (country_id, year, cause_id, sex)"))
+
+
+def time_load(name, load, engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {BENCH_TABLE}"))
+    start_time = time.perf_counter()
+    load()
+    seconds = time.perf_counter() - start_time
+    return name, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db-url', default=DATABASE_URL)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=postgres_loader.DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    df = synthetic_mortality_rates(args.rows)
+    engine = create_engine(args.db_url)
+    with engine.begin() as conn:
+        create_bench_table(conn)
+
+    try:
+        results = [
+            time_load('to_sql(method=multi)',
+                      lambda: df.to_sql(BENCH_TABLE, con=engine, if_exists='append', index=False, method='multi'),
+                      engine),
+            time_load(f'copy_dataframe(batch_size={args.batch_size})',
+                      lambda: postgres_loader.copy_dataframe(df, BENCH_TABLE, engine, batch_size=args.batch_size),
+                      engine),
+        ]
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+
+    for name, seconds in results:
+        print(f"{name:<40} {len(df):>10} rows {seconds:>8.2f}s {len(df) / seconds:>12.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Load tests the query service with concurrent requests and reports p50/p99 latency, throughput, 429 responses and how
+many requests were coalesced.
+
+Without --url a service is started on a free local port over --db-url, or over a SQLite stand-in of the who database
+filled with synthetic mortality rates (generated once into data/benchmarks) if no --db-url is given.
+
+Usage: python -m benchmarks.load_test_query_service --requests 5000 --concurrency 100 [--db-url URL | --url URL]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import aiohttp
+import numpy as np
+from sqlalchemy import create_engine, text
+from definitions import DATA_DIR
+from benchmarks.bench_postgres_loader import synthetic_mortality_rates
+from pipeline.api import query_service
+from pipeline.ingest import icd10_mortality_rates_processor
+
+
+STAND_IN_DIR = DATA_DIR + '/benchmarks'
+
+# Share of each endpoint in the request mix
+ENDPOINT_WEIGHTS = {'top_causes': 0.4, 'deaths': 0.4, 'cause_time_series': 0.2}
+
+SERVICE_START_TIMEOUT_SECONDS = 30
+
+
+def create_sqlite_stand_in(path, n_rows, seed=0):
+    """
+    Writes synthetic mortality rates into a SQLite database with the mortality_rates and top_causes_by_country_year
+    relations the service queries.
+
+    :param path: str
+    :param n_rows: int
+    :param seed: int
+    """
+    mortality_df = icd10_mortality_rates_processor.with_names(synthetic_mortality_rates(n_rows, seed=seed),
+                                                              icd10_mortality_rates_processor.get_code_lookups())
+    engine = create_engine(f"sqlite:///{path}")
+    mortality_df.to_sql('mortality_rates', engine, index=False, chunksize=100000)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE UNIQUE INDEX mortality_rates_key ON mortality_rates (country, year, cause, sex)"))
+        conn.execute(text("CREATE INDEX mortality_rates_cause_year_idx ON mortality_rates (cause, year)"))
+        conn.execute(text("CREATE TABLE top_causes_by_country_year AS "
+                          "SELECT country, year, rank, cause, deaths FROM ("
+                          "SELECT country, year, cause, sum(deaths) AS deaths, row_number() OVER "
+                          "(PARTITION BY country, year ORDER BY sum(deaths) DESC, cause) AS rank "
+                          "FROM mortality_rates WHERE cause <> 'All causes' GROUP BY country, year, cause"
+                          ") WHERE rank <= 10"))
+        conn.execute(text("CREATE UNIQUE INDEX top_causes_by_country_year_key "
+                          "ON top_causes_by_country_year (country, year, rank)"))
+    engine.dispose()
+
+
+def request_paths(n_requests, duplicate_share, seed=0):
+    """
+    Draws a mix of requests over the countries and causes of the code tables. A duplicate_share of the requests ask
+    the same few hot questions, like dashboards refreshing at once.
+
+    :param n_requests: int
+    :param duplicate_share: float
+    :param seed: int
+    :return: List[str]
+    """
+    rng = np.random.default_rng(seed)
+    code_lookups = icd10_mortality_rates_processor.get_code_lookups()
+    countries = np.array(sorted(code_lookups['country'].values()), dtype=object)
+    causes = code_lookups['cause_dimension'].to_numpy()
+    years = np.arange(1979, 2020)
+
+    def random_path():
+        endpoint = rng.choice(list(ENDPOINT_WEIGHTS), p=list(ENDPOINT_WEIGHTS.values()))
+        if endpoint == 'cause_time_series':
+            return f"/cause_time_series?cause={rng.choice(causes)}&country={rng.choice(countries)}"
+        return f"/{endpoint}?country={rng.choice(countries)}&year={rng.choice(years)}"
+
+    hot_paths = [random_path() for _ in range(5)]
+    return [hot_paths[rng.integers(len(hot_paths))] if rng.random() < duplicate_share else random_path()
+            for _ in range(n_requests)]
+
+
+async def run_load(base_url, paths, concurrency):
+    """
+    Sends the requests from concurrency clients at once.
+
+    :param base_url: str
+    :param paths: List[str]
+    :param concurrency: int
+    :return: Tuple(List[(status, seconds)], float wall seconds, dict service stats)
+    """
+    queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+    results = []
+
+    async def client(session):
+        while not queue.empty():
+            path = queue.get_nowait()
+            start_time = time.perf_counter()
+            async with session.get(base_url + path) as response:
+                await response.read()
+            results.append((response.status, time.perf_counter() - start_time))
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        start_time = time.perf_counter()
+        await asyncio.gather(*[client(session) for _ in range(concurrency)])
+        wall_seconds = time.perf_counter() - start_time
+        async with session.get(base_url + '/stats') as response:
+            stats = await response.json()
+    return results, wall_seconds, stats
+
+
+def start_service(db_url, max_active, max_queued):
+    """
+    Starts the query service in a subprocess on a free local port and waits until it answers.
+
+    :return: Tuple(Popen, str base URL)
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen([sys.executable, '-m', 'pipeline.api.query_service', '--db-url', db_url,
+                                '--port', str(port), '--max-active', str(max_active),
+                                '--max-queued', str(max_queued)])
+    base_url = f"http://127.0.0.1:{port}"
+
+    async def wait_until_up():
+        deadline = time.monotonic() + SERVICE_START_TIMEOUT_SECONDS
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    async with session.get(base_url + '/stats'):
+                        return
+                except aiohttp.ClientConnectionError:
+                    if time.monotonic() > deadline or process.poll() is not None:
+                        raise RuntimeError("Query service didn't start")
+                    await asyncio.sleep(0.1)
+
+    try:
+        asyncio.run(wait_until_up())
+    except BaseException:
+        process.terminate()
+        raise
+    return process, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None, help="Base URL of a running query service.")
+    parser.add_argument('--db-url', default=None, help="SQLAlchemy URL of the database of the started service.")
+    parser.add_argument('--stand-in-rows', type=int, default=1000000,
+                        help="Rows of the SQLite stand-in used without --url and --db-url.")
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duplicate-share', type=float, default=0.5,
+                        help="Share of requests asking the same few questions, which the service coalesces.")
+    parser.add_argument('--max-active', type=int, default=query_service.DEFAULT_MAX_ACTIVE)
+    parser.add_argument('--max-queued', type=int, default=query_service.DEFAULT_MAX_QUEUED)
+    args = parser.parse_args()
+
+    process = None
+    base_url = args.url
+    if base_url is None:
+        db_url = args.db_url
+        if db_url is None:
+            stand_in_path = f"{STAND_IN_DIR}/who_stand_in-{args.stand_in_rows}.sqlite"
+            if not os.path.exists(stand_in_path):
+                print(f"Generating SQLite stand-in with {args.stand_in_rows} rows into {stand_in_path}...")
+                os.makedirs(STAND_IN_DIR, exist_ok=True)
+                create_sqlite_stand_in(stand_in_path + '.tmp', args.stand_in_rows)
+                os.replace(stand_in_path + '.tmp', stand_in_path)
+            db_url = f"sqlite:///{stand_in_path}"
+        process, base_url = start_service(db_url, args.max_active, args.max_queued)
+
+    try:
+        results, wall_seconds, stats = asyncio.run(run_load(base_url,
+                                                            request_paths(args.requests, args.duplicate_share),
+                                                            args.concurrency))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    statuses = np.array([status for status, _ in results])
+    latencies_ms = np.array([seconds for status, seconds in results if status == 200]) * 1000
+    print(f"{len(results)} requests from {args.concurrency} clients in {wall_seconds:.2f}s, "
+          f"{len(results) / wall_seconds:.0f} requests/sec")
+    if len(latencies_ms):
+        print(f"200 OK: {len(latencies_ms)}  p50 {np.percentile(latencies_ms, 50):.2f}ms  "
+              f"p99 {np.percentile(latencies_ms, 99):.2f}ms  max {latencies_ms.max():.2f}ms")
+    print(f"429 Too Many Requests: {(statuses == 429).sum()}  other: {((statuses != 200) & (statuses != 429)).sum()}")
+    print(f"Service: {stats['executed']} queries executed, {stats['coalesced']} requests coalesced, "
+          f"{stats['rejected']} rejected")
+
+
+if __name__ == "__main__":
+    main()
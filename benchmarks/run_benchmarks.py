@@ -0,0 +1,220 @@
+"""
+Runs the benchmark suite offline on a seeded synthetic Morticd10 file and saves the timings as JSON, so runs can be
+compared across commits.
+
+Covers building the code dictionaries and lookups, reading the csv, code mapping, aggregation and merging of chunks,
+and with --db-url loading the processed data into a scratch table of the who database.
+
+Usage: python -m benchmarks.run_benchmarks --rows 1000000 [--db-url URL] [--compare data/benchmarks/results/<run>.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from definitions import DATA_DIR, ROOT_DIR
+from benchmarks import synthetic_morticd10
+from benchmarks.bench_postgres_loader import BENCH_TABLE, create_bench_table
+from pipeline import instrumentation
+from pipeline.ingest import icd10_mortality_rates_processor
+from pipeline.parsers import code_dictionary_cache
+from pipeline.parsers import icd_10_code_parsers
+
+
+BENCHMARK_DIR = DATA_DIR + '/benchmarks'
+
+PROCESSING_STAGES = ['read_csv', 'code_mapping', 'aggregate', 'merge']
+
+
+def git_commit():
+    """
+    :return: {'sha': str, 'dirty': bool} dict of the checked out commit, or None outside of a git checkout
+    """
+    try:
+        sha = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True,
+                             check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_DIR,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return {'sha': sha, 'dirty': bool(status.strip())}
+
+
+def result(timings, rows=None):
+    """
+    :param timings: List[float] seconds of each repeat
+    :param rows: int, rows processed per repeat
+    :return: dict of a benchmark result, timed by its best repeat
+    """
+    seconds = min(timings)
+    return {'seconds': seconds, 'timings': timings, 'rows': rows,
+            'rows_per_second': rows / seconds if rows is not None and seconds > 0 else None}
+
+
+def time_repeats(function, repeat):
+    """
+    :param function: Callable[[], T]
+    :param repeat: int
+    :return: Tuple(List[float] seconds of each call, T result of the last call)
+    """
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        value = function()
+        timings.append(time.perf_counter() - start_time)
+    return timings, value
+
+
+def bench_code_tables(repeat):
+    """
+    Benchmarks parsing the bundled code tables and building the lookups used by the processor.
+
+    :param repeat: int
+    :return: {benchmark name: result} dict
+    """
+    code_dictionaries = code_dictionary_cache.build_code_dictionaries()
+    benchmarks = {
+        'build_code_dictionaries': code_dictionary_cache.build_code_dictionaries,
+        'get_3_char_cause_code_index': icd_10_code_parsers.get_3_char_cause_code_index,
+        'build_cause_code_lookup': lambda: icd_10_code_parsers.build_cause_code_lookup(code_dictionaries['condensed'],
+                                                                                      code_dictionaries['portugal']),
+    }
+    return {name: result(time_repeats(function, repeat)[0]) for name, function in benchmarks.items()}
+
+
+def bench_processing(zip_path, rows, chunksize, repeat):
+    """
+    Benchmarks processing a zipped Morticd10 file, timing every stage of the processor.
+
+    :param zip_path: str
+    :param rows: int, rows in the file
+    :param chunksize: int
+    :param repeat: int
+    :return: Tuple({benchmark name: result} dict, processed DataFrame)
+    """
+    code_lookups = icd10_mortality_rates_processor.get_code_lookups()
+    stage_timings = {stage: [] for stage in PROCESSING_STAGES}
+    stage_rows = {}
+
+    def process():
+        report = instrumentation.RunReport()
+        with instrumentation.recording(report):
+            processed_df = icd10_mortality_rates_processor.process_zip(zip_path, code_lookups, chunksize=chunksize)
+        for stage in PROCESSING_STAGES:
+            stage_metrics = report.stages.get(stage, {'wall_seconds': 0.0, 'rows_in': 0, 'rows_out': 0})
+            stage_timings[stage].append(stage_metrics['wall_seconds'])
+            stage_rows[stage] = stage_metrics['rows_in'] or stage_metrics['rows_out']
+        return processed_df
+
+    timings, processed_df = time_repeats(process, repeat)
+    results = {'process_zip': result(timings, rows)}
+    results.update({stage: result(stage_timings[stage], stage_rows[stage]) for stage in PROCESSING_STAGES})
+    return results, processed_df
+
+
+def bench_db_load(processed_df, db_url, batch_size, repeat):
+    """
+    Benchmarks the COPY load and an upsert of unchanged rows into a scratch copy of the mortality_facts table, which
+    is dropped afterwards.
+
+    :param processed_df: DataFrame
+    :param db_url: str
+    :param batch_size: int
+    :param repeat: int
+    :return: {benchmark name: result} dict
+    """
+    from sqlalchemy import create_engine, text
+    from pipeline.loaders import postgres_loader
+
+    engine = create_engine(db_url)
+    with engine.begin() as conn:
+        create_bench_table(conn)
+
+    def copy():
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {BENCH_TABLE}"))
+        return postgres_loader.copy_dataframe(processed_df, BENCH_TABLE, engine, batch_size=batch_size)['seconds']
+
+    def upsert():
+        return postgres_loader.upsert_dataframe(processed_df, BENCH_TABLE, engine,
+                                                key_columns=icd10_mortality_rates_processor.AGGREGATION_KEYS,
+                                                batch_size=batch_size)['seconds']
+
+    try:
+        # Only the loads are timed, not truncating the table in between
+        copy_timings = [copy() for _ in range(repeat)]
+        upsert_timings = [upsert() for _ in range(repeat)]
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+    return {'copy_dataframe': result(copy_timings, len(processed_df)),
+            'upsert_dataframe_unchanged': result(upsert_timings, len(processed_df))}
+
+
+def print_results(results, previous_results=None):
+    """
+    Prints the best time of every benchmark, and its ratio to a previous run if given.
+
+    :param results: {benchmark name: result} dict
+    :param previous_results: {benchmark name: result} dict of a previous run
+    """
+    for name, benchmark in results.items():
+        line = f"{name:<30} {benchmark['seconds']:>10.3f}s"
+        if benchmark['rows_per_second'] is not None:
+            line += f" {benchmark['rows_per_second']:>14.0f} rows/sec"
+        previous = (previous_results or {}).get(name)
+        if previous is not None and previous['seconds'] > 0:
+            line += f"   {benchmark['seconds'] / previous['seconds']:>6.2f}x of previous {previous['seconds']:.3f}s"
+        print(line)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help="Rows of the synthetic Morticd10 file.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunksize', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--db-url', default=None,
+                        help="SQLAlchemy URL of the who database, the database load is only benchmarked if given.")
+    parser.add_argument('--batch-size', type=int, default=100000)
+    parser.add_argument('--output', default=None,
+                        help="Path of the JSON results, data/benchmarks/results/<time>-<commit>.json by default.")
+    parser.add_argument('--compare', default=None, help="JSON results of a previous run to compare against.")
+    args = parser.parse_args(args)
+
+    # Generated files are kept, generating 1e8 rows takes a while
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    zip_path = f"{BENCHMARK_DIR}/Morticd10_synthetic-{args.rows}-{args.seed}.zip"
+    if not os.path.exists(zip_path):
+        print(f"Generating {args.rows} rows into {zip_path}...")
+        synthetic_morticd10.write_morticd10_zip(zip_path + '.tmp', args.rows, seed=args.seed)
+        os.replace(zip_path + '.tmp', zip_path)
+
+    results = bench_code_tables(args.repeat)
+    processing_results, processed_df = bench_processing(zip_path, args.rows, args.chunksize, args.repeat)
+    results.update(processing_results)
+    if args.db_url:
+        results.update(bench_db_load(processed_df, args.db_url, args.batch_size, args.repeat))
+
+    previous_results = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous_results = json.load(f)['results']
+    print_results(results, previous_results)
+
+    commit = git_commit()
+    created_at = datetime.now(timezone.utc)
+    output_path = args.output or (f"{BENCHMARK_DIR}/results/{created_at.strftime('%Y%m%dT%H%M%S')}-"
+                                  f"{commit['sha'][:8] if commit else 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump({'commit': commit, 'created_at': created_at.isoformat(), 'rows': args.rows, 'seed': args.seed,
+                   'chunksize': args.chunksize, 'repeat': args.repeat, 'python': platform.python_version(),
+                   'platform': platform.platform(), 'results': results}, f, indent=2)
+    print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Seeded generator of synthetic Morticd10 files, with the columns of the WHO files and country and cause codes drawn from
+the bundled code tables.
+
+Usage: python -m benchmarks.synthetic_morticd10 --rows 10000000 data/benchmarks/Morticd10_synthetic.zip
+"""
+import argparse
+import zipfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv
+from pipeline.parsers import code_dictionary_cache
+
+
+MORTICD10_COLUMNS = (['Country', 'Admin1', 'SubDiv', 'Year', 'List', 'Cause', 'Sex', 'Frmat', 'IM_Frmat'] +
+                     [f'Deaths{column}' for column in range(1, 27)] +
+                     [f'IM_Deaths{column}' for column in range(1, 5)])
+
+# Approximate share of rows per ICD10 list in the Morticd10 files
+LIST_WEIGHTS = {'101': 0.1, '103': 0.3, '104': 0.55, '10M': 0.04, 'UE1': 0.01}
+
+SEX_WEIGHTS = {1: 0.49, 2: 0.49, 9: 0.02}
+
+# Age formats (see Annex Table 1 of the documentation) and the Deaths2..Deaths26 columns they report, combined groups
+# are recorded under their first column
+FORMAT_COLUMNS = {'00': list(range(2, 27)),
+                  '01': list(range(2, 24)) + [26],
+                  '02': [2, 3] + list(range(7, 24)) + [26],
+                  '07': [2, 3] + list(range(7, 22, 2)) + [26]}
+FORMAT_WEIGHTS = {'00': 0.15, '01': 0.5, '02': 0.25, '07': 0.1}
+
+YEARS = np.arange(1990, 2020)
+
+# Rows generated and written at a time, bounding memory whatever the number of rows
+DEFAULT_CHUNK_ROWS = 1000000
+
+
+def get_code_tables():
+    """
+    Codes the synthetic data is drawn from.
+
+    :return: {'country': ndarray of country codes, list name: ndarray of cause codes} dict
+    """
+    code_dictionaries = code_dictionary_cache.get_code_dictionaries()
+    codes_3_char = np.array(list(code_dictionaries['3_char'].to_dict()), dtype=object)
+    return {'country': np.array(sorted(code_dictionaries['country']), dtype=np.int16),
+            '101': np.array(list(code_dictionaries['condensed']), dtype=object),
+            '103': codes_3_char,
+            '104': np.array([code + str(digit) for code in codes_3_char for digit in range(10)], dtype=object),
+            '10M': codes_3_char + 'X',
+            'UE1': np.array(list(code_dictionaries['portugal']), dtype=object)}
+
+
+def synthetic_list_cause_codes(n_rows, code_tables, rng):
+    """
+    Draws list and cause code columns with the list mix of LIST_WEIGHTS.
+
+    :param n_rows: int
+    :param code_tables: as returned by get_code_tables
+    :param rng: numpy Generator
+    :return: DataFrame with List and Cause columns
+    """
+    lists = rng.choice(list(LIST_WEIGHTS), size=n_rows, p=list(LIST_WEIGHTS.values()))
+    causes = np.empty(n_rows, dtype=object)
+    for list_name in LIST_WEIGHTS:
+        mask = lists == list_name
+        causes[mask] = rng.choice(code_tables[list_name], size=mask.sum())
+    return pd.DataFrame({'List': lists, 'Cause': causes})
+
+
+def synthetic_morticd10_chunk(n_rows, code_tables, rng):
+    """
+    Generates rows in the layout of the raw Morticd10 files. Deaths per age column grow with age, Deaths1 is their
+    total, and columns an age format doesn't report are blank.
+
+    :param n_rows: int
+    :param code_tables: as returned by get_code_tables
+    :param rng: numpy Generator
+    :return: DataFrame with MORTICD10_COLUMNS
+    """
+    formats = rng.choice(list(FORMAT_WEIGHTS), size=n_rows, p=list(FORMAT_WEIGHTS.values()))
+    age_columns = np.arange(2, 27)
+    deaths_by_age = rng.poisson(np.linspace(0.5, 20, len(age_columns)), size=(n_rows, len(age_columns)))
+    reported = np.zeros((n_rows, len(age_columns)), dtype=bool)
+    for age_format, columns in FORMAT_COLUMNS.items():
+        reported[np.ix_(formats == age_format, np.asarray(columns) - 2)] = True
+    deaths_by_age = np.where(reported, deaths_by_age, np.nan)
+
+    chunk_df = pd.DataFrame({'Country': rng.choice(code_tables['country'], size=n_rows),
+                             'Admin1': None,
+                             'SubDiv': None,
+                             'Year': rng.choice(YEARS, size=n_rows)})
+    chunk_df = chunk_df.join(synthetic_list_cause_codes(n_rows, code_tables, rng))
+    chunk_df['Sex'] = rng.choice(list(SEX_WEIGHTS), size=n_rows, p=list(SEX_WEIGHTS.values()))
+    chunk_df['Frmat'] = formats
+    chunk_df['IM_Frmat'] = '08'
+    chunk_df['Deaths1'] = np.nansum(deaths_by_age, axis=1).astype(np.int64)
+    for index, column in enumerate(age_columns):
+        chunk_df[f'Deaths{column}'] = pd.array(deaths_by_age[:, index], dtype='Int64')
+    chunk_df['IM_Deaths1'] = chunk_df['Deaths2']
+    for column in range(2, 5):
+        chunk_df[f'IM_Deaths{column}'] = None
+    return chunk_df[MORTICD10_COLUMNS]
+
+
+def write_morticd10_csv(csv_file, n_rows, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Writes a synthetic Morticd10 csv, chunk_rows rows at a time. The same seed and chunk_rows always give the same file.
+
+    Chunks are written with the pyarrow csv writer, which is several times faster than DataFrame.to_csv. None of the
+    generated values contain commas or quotes, so they are written unquoted like in the WHO files.
+
+    :param csv_file: binary file object
+    :param n_rows: int
+    :param seed: int
+    :param chunk_rows: int
+    """
+    rng = np.random.default_rng(seed)
+    code_tables = get_code_tables()
+    csv_file.write((','.join(MORTICD10_COLUMNS) + '\n').encode())
+    write_options = pyarrow.csv.WriteOptions(include_header=False, quoting_style='none')
+    for chunk_start in range(0, n_rows, chunk_rows):
+        chunk_df = synthetic_morticd10_chunk(min(chunk_rows, n_rows - chunk_start), code_tables, rng)
+        pyarrow.csv.write_csv(pa.Table.from_pandas(chunk_df, preserve_index=False), csv_file,
+                              write_options=write_options)
+
+
+def write_morticd10_zip(zip_path, n_rows, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Writes a synthetic Morticd10 csv into a zip archive like the ones published by the WHO, streaming it into the
+    archive so it never has to fit in memory. The fastest compression level is used, since compression takes most of
+    the time to generate large files.
+
+    :param zip_path: str
+    :param n_rows: int
+    :param seed: int
+    :param chunk_rows: int
+    """
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zip_ref, \
+            zip_ref.open('Morticd10_synthetic', 'w', force_zip64=True) as csv_file:
+        write_morticd10_csv(csv_file, n_rows, seed=seed, chunk_rows=chunk_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('zip_path')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_morticd10_zip(args.zip_path, args.rows, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,5 +6,24 @@ RESOURCES_DIR = ROOT_DIR + "/resources"
 ICD_10_CAUSE_CODES_PATH = RESOURCES_DIR + r"/ICD10_list_101_103_cause_codes.csv"
 ICD_10_PORTUGAL_CAUSE_CODES_PATH = RESOURCES_DIR + r"/ICD10_list_UE1_cause_codes.csv"
 COUNTRY_CODES_PATH = RESOURCES_DIR + "/country_codes/country_codes"
+POPULATION_PATH = RESOURCES_DIR + "/pop/pop"
+AVAILABILITY_PATH = RESOURCES_DIR + "/availability/list_ctry_yrs_15Dec2019.xls"
 
 TEST_RESOURCES = RESOURCES_DIR + '/test_files'
+
+DATABASE_URL = 'postgresql://postgres@localhost:37780/who'
+
+ICD10_MORTALITY_DATA_URLS = ["https://www.who.int/healthinfo/statistics/Morticd10_part1.zip",
+                             "https://www.who.int/healthinfo/statistics/Morticd10_part2.zip"]
+
+DATA_DIR = ROOT_DIR + '/data'
+SNAPSHOT_DIR = DATA_DIR + '/mortality_rates_snapshot'
+DOWNLOAD_DIR = DATA_DIR + '/downloads'
+RUN_REPORT_DIR = DATA_DIR + '/run_reports'
+CUBE_DIR = DATA_DIR + '/mortality_cube'
+STAGE_DIR = DATA_DIR + '/stages'
+
+CACHE_DIR = ROOT_DIR + '/.cache'
+CODE_DICTIONARY_CACHE_DIR = CACHE_DIR + '/code_dictionaries'
+ENRICHMENT_CACHE_PATH = CACHE_DIR + '/enrichment.sqlite'
+RESULT_CACHE_PATH = CACHE_DIR + '/query_results.sqlite'
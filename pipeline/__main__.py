@@ -0,0 +1,4 @@
+from pipeline import cli
+
+
+cli.main()
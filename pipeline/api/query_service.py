@@ -0,0 +1,292 @@
+"""
+asyncio HTTP service answering questions over the mortality_rates view, e.g.
+GET /top_causes?country=Algeria&year=2008 for "what was the most common cause of death in Algeria in 2008".
+
+With --coverage, questions about country-years the availability file records without any list are answered with 404
+{"error": "no coverage"} without querying the database.
+
+Usage: python -m pipeline.api.query_service [--db-url URL] [--port 8080] [--coverage]
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+from contextlib import asynccontextmanager
+from aiohttp import web
+from definitions import DATABASE_URL
+from pipeline.query import mortality_queries
+from pipeline.query.async_query_engine import AsyncQueryEngine, create_pooled_async_engine
+from pipeline.query.mortality_queries import CauseDeaths, MortalityRate, SexDeaths, YearDeaths, no_coverage
+
+
+module_logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8080
+
+# Queries run at once, matching the connection pool, and requests waiting for one of them. Requests beyond both are
+# answered with 429 straight away rather than queueing without bound
+DEFAULT_MAX_ACTIVE = 10
+DEFAULT_MAX_QUEUED = 100
+RETRY_AFTER_SECONDS = 1
+
+# Rows fetched and written to the response at a time when streaming
+STREAM_BATCH_SIZE = 5000
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdmissionControl:
+    """
+    Caps the number of queries running at once at max_active, with at most max_queued requests waiting for a slot.
+    Requests arriving when all slots and the queue are taken are rejected with Overloaded.
+    """
+
+    def __init__(self, max_active=DEFAULT_MAX_ACTIVE, max_queued=DEFAULT_MAX_QUEUED):
+        self.slots = asyncio.Semaphore(max_active)
+        self.max_admitted = max_active + max_queued
+        self.admitted = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def admit(self):
+        if self.admitted >= self.max_admitted:
+            self.rejected += 1
+            raise Overloaded()
+        self.admitted += 1
+        try:
+            async with self.slots:
+                yield
+        finally:
+            self.admitted -= 1
+
+
+class RequestCoalescer:
+    """
+    Runs identical requests which are in flight at the same time only once, every caller awaiting the same result.
+    """
+
+    def __init__(self):
+        self.in_flight = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def run(self, key, make_coroutine):
+        """
+        :param key: hashable key of the request
+        :param make_coroutine: Callable[[], Awaitable], called only when no identical request is in flight
+        :return: result of the coroutine
+        """
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(make_coroutine())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done_task: self._done(key, done_task))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        # A caller going away must not cancel the request for the other callers
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        self.in_flight.pop(key, None)
+        # Retrieve the exception, so it isn't reported as unhandled when every caller went away
+        if not task.cancelled():
+            task.exception()
+
+
+class QueryService:
+    """
+    Handlers of the HTTP endpoints. Small results are coalesced and admitted through AdmissionControl, large results
+    are streamed while holding an admission slot.
+    """
+
+    def __init__(self, query_engine, admission, coalescer):
+        """
+        :param query_engine: AsyncQueryEngine
+        :param admission: AdmissionControl
+        :param coalescer: RequestCoalescer
+        """
+        self.query_engine = query_engine
+        self.admission = admission
+        self.coalescer = coalescer
+
+    async def execute(self, query, params):
+        async def admitted_execute():
+            async with self.admission.admit():
+                return await self.query_engine.execute(query, params)
+        return await self.coalescer.run((query.name, tuple(sorted(params.items()))), admitted_execute)
+
+    def check_coverage(self, country, year=None):
+        """
+        Rejects questions about a country (and year) the coverage index of the query engine rules out with 404.
+
+        :param country: str, None for all countries
+        :param year: int, None for any year
+        """
+        if no_coverage(self.query_engine, country, year):
+            raise web.HTTPNotFound(text=json.dumps({'error': 'no coverage'}), content_type='application/json')
+
+    async def top_causes(self, request):
+        params = {'country': required(request, 'country'), 'year': integer(request, 'year', required=True),
+                  'n': integer(request, 'n', default=10)}
+        self.check_coverage(params['country'], params['year'])
+        rows = await self.execute(mortality_queries.TOP_CAUSES, params)
+        return web.json_response([CauseDeaths(*row)._asdict() for row in rows])
+
+    async def deaths_by_sex(self, request):
+        params = {'country': required(request, 'country'), 'year': integer(request, 'year', required=True),
+                  'cause': request.query.get('cause')}
+        self.check_coverage(params['country'], params['year'])
+        rows = await self.execute(mortality_queries.DEATHS_BY_SEX, params)
+        return web.json_response([SexDeaths(sex, int(deaths))._asdict() for sex, deaths in rows])
+
+    async def deaths(self, request):
+        params = {'country': required(request, 'country'), 'year': integer(request, 'year', required=True),
+                  'cause': request.query.get('cause')}
+        sex = request.query.get('sex')
+        self.check_coverage(params['country'], params['year'])
+        rows = await self.execute(mortality_queries.DEATHS_BY_SEX, params)
+        return web.json_response({'deaths': sum(int(deaths) for row_sex, deaths in rows if sex in (None, row_sex))})
+
+    async def cause_time_series(self, request):
+        params = {'cause': required(request, 'cause'), 'country': request.query.get('country')}
+        self.check_coverage(params['country'])
+        rows = await self.execute(mortality_queries.CAUSE_TIME_SERIES, params)
+        return web.json_response([YearDeaths(year, int(deaths))._asdict() for year, deaths in rows])
+
+    async def mortality_rates(self, request):
+        """
+        Streams the mortality rates of a country and/or year as a JSON array or CSV (format=csv), writing each batch
+        of rows as it is fetched instead of building the whole response in memory.
+        """
+        params = {'country': request.query.get('country'), 'year': integer(request, 'year')}
+        output_format = request.query.get('format', 'json')
+        if output_format not in ('json', 'csv'):
+            raise web.HTTPBadRequest(text=f"Unknown format {output_format}, expected json or csv")
+        self.check_coverage(params['country'], params['year'])
+
+        async with self.admission.admit():
+            response = web.StreamResponse(headers={'Content-Type': 'text/csv' if output_format == 'csv'
+                                                   else 'application/json'})
+            await response.prepare(request)
+            if output_format == 'csv':
+                await response.write(','.join(MortalityRate._fields).encode() + b'\r\n')
+            else:
+                await response.write(b'[')
+            first_batch = True
+            async for rows in self.query_engine.stream(mortality_queries.MORTALITY_RATES, params,
+                                                       batch_size=STREAM_BATCH_SIZE):
+                if output_format == 'csv':
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(rows)
+                    chunk = buffer.getvalue()
+                else:
+                    chunk = ('' if first_batch else ',') + ','.join(json.dumps(MortalityRate(*row)._asdict())
+                                                                     for row in rows)
+                first_batch = False
+                await response.write(chunk.encode())
+            if output_format == 'json':
+                await response.write(b']')
+            await response.write_eof()
+        return response
+
+    async def stats(self, request):
+        return web.json_response({'latency': self.query_engine.latency_stats(),
+                                  'executed': self.coalescer.executed,
+                                  'coalesced': self.coalescer.coalesced,
+                                  'rejected': self.admission.rejected,
+                                  'admitted': self.admission.admitted})
+
+
+def required(request, name):
+    """
+    :param request: aiohttp Request
+    :param name: str
+    :return: str, value of a required query string parameter
+    """
+    if name not in request.query:
+        raise web.HTTPBadRequest(text=f"Missing parameter {name}")
+    return request.query[name]
+
+
+def integer(request, name, required=False, default=None):
+    """
+    :param request: aiohttp Request
+    :param name: str
+    :param required: bool
+    :param default: int, value of an optional parameter which is missing
+    :return: int value of a query string parameter
+    """
+    if name not in request.query:
+        if required:
+            raise web.HTTPBadRequest(text=f"Missing parameter {name}")
+        return default
+    try:
+        return int(request.query[name])
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"Parameter {name} must be an integer")
+
+
+@web.middleware
+async def overload_middleware(request, handler):
+    try:
+        return await handler(request)
+    except Overloaded:
+        return web.json_response({'error': 'overloaded'}, status=429,
+                                 headers={'Retry-After': str(RETRY_AFTER_SECONDS)})
+
+
+def create_app(query_engine, max_active=DEFAULT_MAX_ACTIVE, max_queued=DEFAULT_MAX_QUEUED):
+    """
+    :param query_engine: AsyncQueryEngine, disposed when the app shuts down
+    :param max_active: int, queries run at once
+    :param max_queued: int, requests waiting for a query slot before further requests get 429
+    :return: aiohttp Application
+    """
+    service = QueryService(query_engine, AdmissionControl(max_active, max_queued), RequestCoalescer())
+    app = web.Application(middlewares=[overload_middleware])
+    app.router.add_get('/top_causes', service.top_causes)
+    app.router.add_get('/deaths', service.deaths)
+    app.router.add_get('/deaths_by_sex', service.deaths_by_sex)
+    app.router.add_get('/cause_time_series', service.cause_time_series)
+    app.router.add_get('/mortality_rates', service.mortality_rates)
+    app.router.add_get('/stats', service.stats)
+
+    async def dispose_engine(app):
+        await query_engine.dispose()
+    app.on_cleanup.append(dispose_engine)
+    return app
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db-url', default=DATABASE_URL, help="SQLAlchemy URL of the who database.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-active', type=int, default=DEFAULT_MAX_ACTIVE,
+                        help="Queries run at once, also the size of the connection pool.")
+    parser.add_argument('--max-queued', type=int, default=DEFAULT_MAX_QUEUED,
+                        help="Requests waiting for a query slot before further requests are answered with 429.")
+    parser.add_argument('--coverage', action='store_true',
+                        help="Answer questions about country-years the availability file records without any list "
+                             "with 404 without querying. Off by default, since the file may lag behind the loaded "
+                             "data.")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    coverage = None
+    if args.coverage:
+        from pipeline.parsers import code_dictionary_cache
+        coverage = code_dictionary_cache.get_coverage_index()
+    query_engine = AsyncQueryEngine(create_pooled_async_engine(args.db_url, pool_size=args.max_active,
+                                                               max_overflow=0), coverage=coverage)
+    web.run_app(create_app(query_engine, max_active=args.max_active, max_queued=args.max_queued),
+                host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
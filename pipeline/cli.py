@@ -0,0 +1,298 @@
+"""
+Runs the stages of the pipeline one at a time. Stages pass their results to the next one through files, so a single
+stage can be re-run on its own:
+
+  download    keep the Morticd10 archives current in --download-dir
+  transform   process the archives (downloaded into memory, or kept in --download-dir) and population into the tables
+              to load, written to --stage-dir
+  load        write the tables of --stage-dir to the database, with the Parquet snapshot (and cube)
+  rollup      refresh the rollups and bump the load generation, invalidating cached results
+  enrich      fetch attributes of every country (e.g. daylight hours) into the country_attributes table
+  query       answer a question, e.g. query top_causes --country Algeria --year 2008
+  bench       run the benchmark suite, see python -m benchmarks.run_benchmarks --help
+
+Modules of a command are only imported when it runs, so starting the CLI doesn't pay for importing pandas, SQLAlchemy,
+requests and tqdm.
+
+Usage: python -m pipeline <command> [options]
+"""
+import argparse
+import json
+import logging
+import os
+from definitions import (CUBE_DIR, DATABASE_URL, DOWNLOAD_DIR, ICD10_MORTALITY_DATA_URLS, RESULT_CACHE_PATH,
+                         RUN_REPORT_DIR, SNAPSHOT_DIR, STAGE_DIR)
+
+# instrumentation.CAPTURE_MODES, repeated so parsing the arguments doesn't import the profilers
+CAPTURE_MODES = ['cprofile', 'tracemalloc']
+
+# Parameters of each question of pipeline.query.mortality_queries, required ones first
+QUESTIONS = {
+    'top_causes': (['country', 'year'], ['n']),
+    'deaths_by_sex': (['country', 'year'], ['cause']),
+    'deaths': (['country', 'year'], ['sex', 'cause']),
+    'cause_time_series': (['cause'], ['country']),
+}
+
+QUESTION_PARAM_TYPES = {'year': int, 'n': int}
+
+
+def configure_logger():
+    logger = logging.getLogger('pipeline')
+    logger.setLevel(logging.DEBUG)
+
+    # create file handler which logs even debug messages
+    fh = logging.FileHandler('main.log')
+    fh.setLevel(logging.DEBUG)
+    # create console handler with a higher log level
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.INFO)
+    # create formatter and add it to the handlers
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    fh.setFormatter(formatter)
+    ch.setFormatter(formatter)
+    # add the handlers to the logger
+    logger.addHandler(fh)
+    logger.addHandler(ch)
+
+    return logger
+
+
+def given(args, *names):
+    """
+    :param args: argparse Namespace
+    :param names: str option names
+    :return: {name: value} dict of the options given on the command line, so the defaults of the functions called
+        apply to the others
+    """
+    return {name: getattr(args, name) for name in names if getattr(args, name) is not None}
+
+
+def run_recorded(name, run, args):
+    """
+    Runs a stage command while recording a run report of it, see instrumentation.RunReport.
+
+    :param name: str, name of the run, the report is written to data/run_reports/<name>-<start time>.json by default
+    :param run: Callable[[argparse Namespace], None]
+    :param args: argparse Namespace with report and profile options
+    """
+    from pipeline import instrumentation
+
+    report = instrumentation.RunReport(capture=args.profile)
+    report_path = args.report or f"{RUN_REPORT_DIR}/{name}-{report.started_at.strftime('%Y%m%dT%H%M%S')}.json"
+    status = 'failed'
+    try:
+        with instrumentation.recording(report):
+            run(args)
+        status = 'succeeded'
+    finally:
+        report.write(report_path, status=status, args={key: value for key, value in vars(args).items()
+                                                       if not callable(value)})
+
+
+def download(args):
+    from pipeline import instrumentation
+    from pipeline.ingest import downloader
+
+    for url in ICD10_MORTALITY_DATA_URLS:
+        with instrumentation.stage('download'):
+            downloader.download(url, download_dir=args.download_dir, **given(args, 'connections'))
+
+
+def transform(args):
+    from pipeline import run_pipeline
+    from pipeline.ingest import downloader
+    from pipeline.loaders import stage_files
+
+    paths = ICD10_MORTALITY_DATA_URLS
+    if args.download_dir:
+        paths = [downloader.download_path(url, args.download_dir) for url in ICD10_MORTALITY_DATA_URLS]
+        missing_paths = [path for path in paths if not os.path.isfile(path)]
+        if missing_paths:
+            raise SystemExit(f"Missing {', '.join(missing_paths)}, run python -m pipeline download first")
+    tables = run_pipeline.transform(paths, age_resolved=args.age_resolved, coverage_pruning=args.coverage_pruning,
+                                    **given(args, 'workers', 'chunksize', 'temp_dir'))
+    stage_files.write_stage_tables(tables, args.stage_dir)
+
+
+def load(args):
+    from sqlalchemy import create_engine
+    from pipeline import run_pipeline
+    from pipeline.ingest import icd10_mortality_rates_processor
+    from pipeline.loaders import stage_files
+
+    run_pipeline.write_tables(stage_files.read_stage_tables(args.stage_dir), create_engine(args.db_url),
+                              icd10_mortality_rates_processor.get_code_lookups(), args.snapshot_dir,
+                              cube_dir=args.cube_dir, load_mode=args.load_mode, **given(args, 'batch_size'))
+
+
+def rollup(args):
+    from sqlalchemy import create_engine
+    from pipeline import run_pipeline
+
+    run_pipeline.refresh(create_engine(args.db_url))
+
+
+def enrich(args):
+    from sqlalchemy import create_engine
+    from pipeline.ingest import country_enrichment
+
+    source = country_enrichment.RestCountriesSource(**given(args, 'base_url'))
+    attributes_df = country_enrichment.run(source, **given(args, 'cache_path', 'concurrency', 'requests_per_second'))
+    country_enrichment.load(attributes_df, create_engine(args.db_url))
+
+
+def query(args):
+    """
+    Prints the answer to a question, one JSON object per row, from the database or with --cube-dir from a saved cube.
+    With --result-cache answers are shared through a SQLite file until the next load bumps the load generation.
+    """
+    required_params, optional_params = QUESTIONS[args.question]
+    params = {name: getattr(args, name) for name in required_params}
+    params.update(given(args, *optional_params))
+    if args.cube_dir:
+        from pipeline.query.mortality_cube import MortalityCube
+        answer = getattr(MortalityCube.open(args.cube_dir), args.question)(**params)
+    else:
+        from pipeline.query import mortality_queries
+        from pipeline.query.query_engine import QueryEngine, create_pooled_engine
+        coverage = None
+        if args.coverage:
+            from pipeline.parsers import code_dictionary_cache
+            coverage = code_dictionary_cache.get_coverage_index()
+        query_engine = QueryEngine(create_pooled_engine(args.db_url), coverage=coverage)
+        question = getattr(mortality_queries, args.question)
+        if args.result_cache:
+            from pipeline.query.result_cache import ResultCache, database_load_generation
+            os.makedirs(os.path.dirname(os.path.abspath(args.result_cache)), exist_ok=True)
+            result_cache = ResultCache(generation_source=database_load_generation(query_engine),
+                                       disk_path=args.result_cache)
+            question = result_cache.cached(question)
+        answer = question(query_engine, **params)
+
+    if isinstance(answer, list):
+        for row in answer:
+            print(json.dumps(row._asdict()))
+    else:
+        print(json.dumps({args.question: answer}))
+
+
+def bench(args, bench_args):
+    from benchmarks import run_benchmarks
+
+    run_benchmarks.main(bench_args)
+
+
+def add_report_options(parser):
+    parser.add_argument('--report', default=None,
+                        help="Path of the JSON run report with the time, rows and memory of every stage, "
+                             "data/run_reports/<command>-<start time>.json by default.")
+    parser.add_argument('--profile', choices=CAPTURE_MODES, default=None,
+                        help="Also capture a cProfile profile or the tracemalloc peak memory of every stage in the "
+                             "run report, which slows the run down.")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m pipeline', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True, metavar='command')
+
+    download_parser = commands.add_parser('download', help="Download the Morticd10 archives.")
+    download_parser.add_argument('--download-dir', nargs='?', const=DOWNLOAD_DIR, required=True,
+                                 help="Directory the archives are kept in (data/downloads without a value), they are "
+                                      "only downloaded again once they changed.")
+    download_parser.add_argument('--connections', type=int, default=None,
+                                 help="Maximum number of concurrent range requests per downloaded file.")
+    add_report_options(download_parser)
+    download_parser.set_defaults(run=download)
+
+    transform_parser = commands.add_parser('transform', help="Process the downloaded archives into tables to load.")
+    transform_parser.add_argument('--download-dir', nargs='?', const=DOWNLOAD_DIR, default=None,
+                                  help="Process the archives kept in this directory by the download command (data/"
+                                       "downloads without a value) instead of downloading them into memory.")
+    transform_parser.add_argument('--temp-dir', default=None,
+                                  help="Directory for temporary files when an archive downloaded into memory is too "
+                                       "large to keep in memory.")
+    transform_parser.add_argument('--stage-dir', default=STAGE_DIR,
+                                  help="Directory the processed tables are written to as Parquet files.")
+    transform_parser.add_argument('--chunksize', type=int, default=None,
+                                  help="Stream each archive in chunks of this many rows to bound memory usage.")
+    transform_parser.add_argument('--workers', type=int, default=None,
+                                  help="Number of worker processes processing the archives in parallel.")
+    transform_parser.add_argument('--age-resolved', action='store_true',
+                                  help="Also keep deaths per age band for the mortality_rates_by_age table.")
+    transform_parser.add_argument('--coverage-pruning', action='store_true',
+                                  help="Drop rows of country-years the availability file records with other lists "
+                                       "only.")
+    add_report_options(transform_parser)
+    transform_parser.set_defaults(run=transform)
+
+    load_parser = commands.add_parser('load', help="Write the processed tables to the database.")
+    load_parser.add_argument('--stage-dir', default=STAGE_DIR)
+    load_parser.add_argument('--db-url', default=DATABASE_URL, help="SQLAlchemy URL of the who database.")
+    load_parser.add_argument('--batch-size', type=int, default=None,
+                             help="Number of rows sent and committed per COPY batch.")
+    load_parser.add_argument('--load-mode', choices=['append', 'upsert'], default='append',
+                             help="'append' bulk loads into empty tables, 'upsert' merges into existing data.")
+    load_parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR,
+                             help="Directory of the Parquet snapshot of the processed data.")
+    load_parser.add_argument('--cube-dir', default=None,
+                             help="Also save deaths as a memory mapped cube in this directory.")
+    add_report_options(load_parser)
+    load_parser.set_defaults(run=load)
+
+    rollup_parser = commands.add_parser('rollup', help="Refresh the rollups over the loaded data.")
+    rollup_parser.add_argument('--db-url', default=DATABASE_URL, help="SQLAlchemy URL of the who database.")
+    add_report_options(rollup_parser)
+    rollup_parser.set_defaults(run=rollup)
+
+    enrich_parser = commands.add_parser('enrich', help="Fetch attributes of every country from REST Countries.")
+    enrich_parser.add_argument('--db-url', default=DATABASE_URL, help="SQLAlchemy URL of the who database.")
+    enrich_parser.add_argument('--base-url', default=None, help="Base URL of the REST Countries API.")
+    enrich_parser.add_argument('--cache-path', default=None,
+                               help="SQLite file of cached responses, reruns only request expired responses.")
+    enrich_parser.add_argument('--concurrency', type=int, default=None, help="Maximum requests in flight.")
+    enrich_parser.add_argument('--requests-per-second', type=float, default=None)
+    add_report_options(enrich_parser)
+    enrich_parser.set_defaults(run=enrich)
+
+    query_parser = commands.add_parser('query', help="Answer a question about the loaded data.")
+    query_parser.add_argument('--db-url', default=DATABASE_URL, help="SQLAlchemy URL of the who database.")
+    query_parser.add_argument('--cube-dir', nargs='?', const=CUBE_DIR, default=None,
+                              help="Answer from the cube saved in this directory instead of the database.")
+    query_parser.add_argument('--coverage', action='store_true',
+                              help="Answer questions about country-years the availability file records without any "
+                                   "list without querying the database.")
+    query_parser.add_argument('--result-cache', nargs='?', const=RESULT_CACHE_PATH, default=None,
+                              help="Reuse answers cached in this SQLite file until the next load.")
+    questions = query_parser.add_subparsers(dest='question', required=True, metavar='question')
+    for question, (required_params, optional_params) in QUESTIONS.items():
+        question_parser = questions.add_parser(question)
+        for name in required_params + optional_params:
+            question_parser.add_argument(f'--{name}', type=QUESTION_PARAM_TYPES.get(name, str),
+                                         required=name in required_params)
+    query_parser.set_defaults(run=query)
+
+    # Its options are passed on to benchmarks.run_benchmarks
+    commands.add_parser('bench', help="Run the benchmark suite.", add_help=False)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra_args = parser.parse_known_args(argv)
+    if args.command == 'bench':
+        bench(args, extra_args)
+        return
+    if extra_args:
+        parser.error(f"unrecognized arguments: {' '.join(extra_args)}")
+
+    if args.command == 'query':
+        args.run(args)
+        return
+    configure_logger()
+    run_recorded(args.command, args.run, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import logging
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+
+module_logger = logging.getLogger(__name__)
+
+# Canonical age bands. WHO age formats (Frmat, see Annex Table 1 of the documentation) combine standard age groups
+# and record the combined group under its first standard group, leaving the rest blank, so every Deaths column can be
+# mapped to the canonical band its first age falls in whatever the format. Format 09 only reports all ages.
+AGE_BANDS = (['0', '1-4'] + [f'{age}-{age + 4}' for age in range(5, 85, 5)] + ['85+', 'unknown'] +
+             ['0-6 days', '7-27 days', '28-364 days'])
+
+# (source column, index into AGE_BANDS), columns of the same band are adjacent so bands can be summed with reduceat
+AGE_BAND_COLUMNS = ([('Deaths2', 0)] +
+                    [(f'Deaths{column}', 1) for column in range(3, 7)] +
+                    [(f'Deaths{column}', column - 5) for column in range(7, 23)] +
+                    [(f'Deaths{column}', 18) for column in range(23, 26)] +
+                    [('Deaths26', 19)] +
+                    [('IM_Deaths1', 20), ('IM_Deaths2', 20), ('IM_Deaths3', 21), ('IM_Deaths4', 22)])
+
+# Population columns follow the layout of the Deaths columns, without infant sub-bands
+POPULATION_BAND_COLUMNS = [(column.replace('Deaths', 'Pop'), band) for column, band in AGE_BAND_COLUMNS
+                           if column.startswith('Deaths')]
+
+# Blank cells are read as NaN, float32 represents every death count exactly
+AGE_COLUMN_DTYPES = dict([('Frmat', 'float32'), ('IM_Frmat', 'float32')] +
+                         [(column, 'float32') for column, _ in AGE_BAND_COLUMNS])
+
+# Formats whose age groups are all at least as fine as the canonical bands up to 85+
+EXACT_AGE_FORMATS = [0, 1, 2]
+
+
+class AgeResolvedMortality(NamedTuple):
+    """
+    Aggregated mortality rates with deaths per age band.
+
+    mortality_df has the key columns, total deaths and an age_exact flag (False when any row of the group used a
+    format coarser than the canonical bands). deaths_by_age holds one row of int32 deaths per AGE_BANDS band for each
+    row of mortality_df.
+    """
+    mortality_df: pd.DataFrame
+    deaths_by_age: np.ndarray
+
+
+def to_band_block(df, band_columns, dtype):
+    """
+    Sums the source columns of each band into a dense block of bands, in a single vectorized pass over all rows.
+    Missing values count as 0.
+
+    :param df: DataFrame with the source columns of band_columns
+    :param band_columns: List[Tuple(str source column, int band)], columns of the same band adjacent
+    :param dtype: numpy dtype of the block
+    :return: ndarray of dtype (rows x bands)
+    """
+    band_starts = np.flatnonzero(np.diff([-1] + [band for _, band in band_columns]))
+    source_block = np.nan_to_num(df[[column for column, _ in band_columns]].to_numpy(dtype=np.float64))
+    return np.add.reduceat(source_block, band_starts, axis=1).astype(dtype)
+
+
+def to_age_band_block(mortality_df):
+    """
+    Remaps the Deaths2..Deaths26 and IM_Deaths1..4 columns of raw mortality rates into a dense block of canonical age
+    bands.
+
+    :param mortality_df: DataFrame with the columns of AGE_COLUMN_DTYPES
+    :return: Tuple(ndarray of int32 (rows x len(AGE_BANDS)), ndarray of bool age_exact flags)
+    """
+    deaths_by_age = to_band_block(mortality_df, AGE_BAND_COLUMNS, np.int32)
+    age_exact = mortality_df['Frmat'].isin(EXACT_AGE_FORMATS).to_numpy()
+    return deaths_by_age, age_exact
+
+
+def aggregate(mortality_df, deaths_by_age, keys):
+    """
+    Aggregates rows sharing the same key, summing total deaths and the deaths of every age band.
+
+    Rows with a missing key are dropped, like DataFrame.groupby does.
+
+    :param mortality_df: DataFrame with the key columns, deaths and age_exact
+    :param deaths_by_age: ndarray of int32 (rows x len(AGE_BANDS))
+    :param keys: List[str]
+    :return: AgeResolvedMortality, sorted by keys
+    """
+    grouped = mortality_df.groupby(by=keys, sort=True)
+    group_ids = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    aggregated_df = grouped.agg(deaths=('deaths', 'sum'), age_exact=('age_exact', 'all')).reset_index()
+
+    valid = group_ids >= 0
+    order = np.argsort(group_ids[valid], kind='stable')
+    sorted_group_ids = group_ids[valid][order]
+    group_starts = np.flatnonzero(np.diff(sorted_group_ids, prepend=-1))
+    if len(group_starts):
+        aggregated_deaths_by_age = np.add.reduceat(deaths_by_age[valid][order], group_starts, axis=0, dtype=np.int32)
+    else:
+        aggregated_deaths_by_age = np.zeros((0, len(AGE_BANDS)), dtype=np.int32)
+
+    return AgeResolvedMortality(aggregated_df, aggregated_deaths_by_age)
+
+
+def merge(aggregated, chunk, keys):
+    """
+    Merges two partially aggregated AgeResolvedMortality results.
+
+    :param aggregated: AgeResolvedMortality or None
+    :param chunk: AgeResolvedMortality
+    :param keys: List[str]
+    :return: AgeResolvedMortality
+    """
+    if aggregated is None:
+        return chunk
+    return aggregate(pd.concat([aggregated.mortality_df, chunk.mortality_df], ignore_index=True),
+                     np.concatenate([aggregated.deaths_by_age, chunk.deaths_by_age]),
+                     keys)
+
+
+def to_dataframe(age_resolved_mortality, format_block):
+    """
+    Combines an AgeResolvedMortality into a single DataFrame with a deaths_by_age column holding each row's deaths
+    per band, as formatted by format_block.
+
+    :param age_resolved_mortality: AgeResolvedMortality
+    :param format_block: Callable[[ndarray], Sequence], e.g. postgres_loader.to_array_literals
+    :return: DataFrame
+    """
+    return age_resolved_mortality.mortality_df.assign(
+        deaths_by_age=format_block(age_resolved_mortality.deaths_by_age))
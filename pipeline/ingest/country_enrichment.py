@@ -0,0 +1,293 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from urllib.parse import quote
+import aiohttp
+import pandas as pd
+from definitions import ENRICHMENT_CACHE_PATH
+from pipeline.loaders import postgres_loader
+from pipeline.parsers import icd_10_code_parsers
+from pipeline.query.result_cache import DiskBackend
+
+
+module_logger = logging.getLogger(__name__)
+
+# Attributes of countries from external datasets (e.g. latitude and daylight hours), joined to mortality data on
+# country_id
+TABLE = 'country_attributes'
+KEY_COLUMNS = ['country_id', 'attribute']
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_REQUESTS_PER_SECOND = 10
+DEFAULT_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 1
+REQUEST_TIMEOUT_SECONDS = 30
+
+# External datasets change rarely, cached responses are reused for a month
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# Responses cached along with successful ones, so countries a source doesn't know aren't requested again either.
+# They are only reused for a day, so a fixed lookup of the country is picked up by the next run
+CACHED_STATUSES = {200, 404}
+DEFAULT_NOT_FOUND_TTL_SECONDS = 24 * 60 * 60
+
+# Statuses of failures which may succeed when retried
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+EARTH_AXIAL_TILT_DEGREES = 23.44
+
+# ISO 3166-1 alpha-3 codes of the countries of the code tables whose names REST Countries doesn't know. Former
+# countries and parts of a country are located at their successor or the country they are part of
+REST_COUNTRIES_ALPHA_CODES = {
+    "Cote d'Ivoire": 'CIV',
+    'Congo': 'COG',
+    'Libyan Arab Jamahiriya': 'LBY',
+    'Reunion': 'REU',
+    'Rodrigues': 'MUS',
+    'Sao Tome and Principe': 'STP',
+    'Sudan, Former': 'SDN',
+    'Swaziland': 'SWZ',
+    'Falkland Islands (Malvinas)': 'FLK',
+    'Saint Vincent and Grenadines': 'VCT',
+    'Virgin Islands (USA)': 'VIR',
+    'Brunei Darussalam': 'BRN',
+    'China: Province of Taiwan only': 'TWN',
+    "Democratic Peoples's Republic of Korea": 'PRK',
+    'Hong Kong SAR': 'HKG',
+    'Iran (Islamic Republic of)': 'IRN',
+    "Lao People's Democratic Republic": 'LAO',
+    'Occupied Palestinian Territory': 'PSE',
+    'Republic of Korea': 'KOR',
+    'Ryu Kyu Islands': 'JPN',
+    'Syrian Arab Republic': 'SYR',
+    'Turkey': 'TUR',
+    'Viet Nam': 'VNM',
+    'Czechoslovakia, Former': 'CZE',
+    'Czech Republic': 'CZE',
+    'Germany, Former Democratic Republic': 'DEU',
+    'Germany, Former Federal Republic': 'DEU',
+    'Germany, West Berlin': 'DEU',
+    'TFYR Macedonia': 'MKD',
+    'Republic of Moldova': 'MDA',
+    'Russian Federation': 'RUS',
+    'USSR, Former': 'RUS',
+    'United Kingdom, England and Wales': 'GBR',
+    'United Kingdom, Northern Ireland': 'GBR',
+    'United Kingdom, Scotland': 'GBR',
+    'Yugoslavia, Former': 'SRB',
+    'Serbia and Montenegro, Former': 'SRB',
+    'Micronesia (Federated States of)': 'FSM',
+}
+
+
+def daylight_hours(latitude, declination):
+    """
+    Hours between sunrise and sunset at a latitude on a day with the given solar declination, 0 or 24 in polar night
+    and midnight sun.
+
+    :param latitude: float degrees
+    :param declination: float degrees
+    :return: float
+    """
+    cos_hour_angle = -math.tan(math.radians(latitude)) * math.tan(math.radians(declination))
+    return 24 / math.pi * math.acos(min(1.0, max(-1.0, cos_hour_angle)))
+
+
+class EnrichmentSource:
+    """
+    An external dataset the attributes of countries are fetched from: the URL of a country's JSON document and how
+    it is parsed. Subclasses set name, which is stored with every attribute.
+    """
+    name = None
+
+    def url(self, country):
+        """
+        :param country: str, country name of the code tables
+        :return: str
+        """
+        raise NotImplementedError
+
+    def parse(self, country, payload):
+        """
+        :param country: str
+        :param payload: decoded JSON response
+        :return: {attribute: float} dict
+        """
+        raise NotImplementedError
+
+
+class RestCountriesSource(EnrichmentSource):
+    """
+    Location and area of a country from the REST Countries API, with the daylight hours of the solstices computed
+    from its latitude. Countries are looked up by name, or by alpha code where REST Countries names them differently
+    (see REST_COUNTRIES_ALPHA_CODES).
+    """
+    name = 'restcountries'
+
+    def __init__(self, base_url='https://restcountries.com/v3.1', alpha_codes=None):
+        """
+        :param base_url: str
+        :param alpha_codes: {country name: ISO 3166-1 alpha-3 code} dict, REST_COUNTRIES_ALPHA_CODES by default
+        """
+        self.base_url = base_url
+        self.alpha_codes = REST_COUNTRIES_ALPHA_CODES if alpha_codes is None else alpha_codes
+
+    def url(self, country):
+        if country in self.alpha_codes:
+            return f"{self.base_url}/alpha/{self.alpha_codes[country]}?fields=latlng,area"
+        return f"{self.base_url}/name/{quote(country)}?fullText=true&fields=latlng,area"
+
+    def parse(self, country, payload):
+        # Name lookups return a list of matches, alpha code lookups filtered by fields a single country
+        country_payload = payload[0] if isinstance(payload, list) else payload
+        latitude, longitude = country_payload['latlng']
+        return {'latitude': latitude,
+                'longitude': longitude,
+                'area_km2': country_payload['area'],
+                'daylight_hours_june_solstice': daylight_hours(latitude, EARTH_AXIAL_TILT_DEGREES),
+                'daylight_hours_december_solstice': daylight_hours(latitude, -EARTH_AXIAL_TILT_DEGREES)}
+
+
+class RateLimiter:
+    """
+    Spaces requests at least 1 / requests_per_second seconds apart.
+    """
+
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second
+        self.next_slot = float('-inf')
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class CountryEnricher:
+    """
+    Fetches the attributes of countries from a source with at most concurrency requests in flight, rate limited and
+    retried with exponential backoff. Responses are cached on disk until they expire, so reruns make no requests.
+    """
+
+    def __init__(self, source, cache_path=ENRICHMENT_CACHE_PATH, concurrency=DEFAULT_CONCURRENCY,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, retries=DEFAULT_RETRIES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, not_found_ttl_seconds=DEFAULT_NOT_FOUND_TTL_SECONDS,
+                 retry_backoff_seconds=RETRY_BACKOFF_SECONDS):
+        """
+        :param source: EnrichmentSource
+        :param cache_path: str, SQLite file of the cached responses
+        :param concurrency: int
+        :param requests_per_second: float
+        :param retries: int, number of retries after the first attempt
+        :param ttl_seconds: float, seconds a cached response is used for
+        :param not_found_ttl_seconds: float, seconds a cached 404 response is used for, at most ttl_seconds
+        :param retry_backoff_seconds: float, wait before the first retry, doubled on every further retry
+        """
+        self.source = source
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self.cache = DiskBackend(cache_path)
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.retries = retries
+        self.ttl_seconds = ttl_seconds
+        self.not_found_ttl_seconds = min(not_found_ttl_seconds, ttl_seconds)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.counters = {'requests': 0, 'cache_hits': 0, 'retries': 0}
+
+    async def _request(self, session, url):
+        """
+        :return: Tuple(int status, decoded JSON payload or None)
+        """
+        for attempt in range(self.retries + 1):
+            await self.rate_limiter.wait()
+            self.counters['requests'] += 1
+            try:
+                async with session.get(url) as response:
+                    if response.status not in RETRY_STATUSES:
+                        return response.status, (await response.json(content_type=None)
+                                                 if response.status == 200 else None)
+                    error = f"status {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+            if attempt == self.retries:
+                raise IOError(f"Request of {url} failed after {attempt + 1} attempts ({error})")
+            backoff_seconds = self.retry_backoff_seconds * 2 ** attempt
+            module_logger.warning(f"Request of {url} failed ({error}), retrying in {backoff_seconds}s...")
+            self.counters['retries'] += 1
+            await asyncio.sleep(backoff_seconds)
+
+    async def fetch(self, session, semaphore, country):
+        """
+        :param session: aiohttp ClientSession
+        :param semaphore: asyncio Semaphore bounding the requests in flight
+        :param country: str
+        :return: {attribute: float} dict, empty if the source doesn't know the country
+        """
+        # Keyed on the source rather than the URL, so responses are reused from mirrors of the source as well
+        key = f"{self.source.name}:{country}"
+        cached = self.cache.get(key, 0)
+        if cached is not None:
+            self.counters['cache_hits'] += 1
+            status, payload = cached
+        else:
+            url = self.source.url(country)
+            async with semaphore:
+                status, payload = await self._request(session, url)
+            if status not in CACHED_STATUSES:
+                raise IOError(f"Request of {url} failed with status {status}")
+            ttl_seconds = self.ttl_seconds if status == 200 else self.not_found_ttl_seconds
+            self.cache.set(key, 0, time.time() + ttl_seconds, (status, payload))
+
+        if status != 200:
+            module_logger.info(f"{self.source.name} has no data for {country}")
+            return {}
+        return self.source.parse(country, payload)
+
+    async def enrich(self, countries):
+        """
+        :param countries: {country id: country name} dict
+        :return: DataFrame of the country_attributes table, a row per country_id and attribute
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            attributes = await asyncio.gather(*[self.fetch(session, semaphore, country)
+                                                for country in countries.values()])
+
+        rows = [(country_id, attribute, float(value), self.source.name)
+                for country_id, country_attributes in zip(countries, attributes)
+                for attribute, value in country_attributes.items()]
+        module_logger.info(f"Enriched {sum(1 for country_attributes in attributes if country_attributes)} of "
+                           f"{len(countries)} countries from {self.source.name}: {self.counters}")
+        return pd.DataFrame(rows, columns=KEY_COLUMNS + ['value', 'source']).astype({'country_id': 'int16'})
+
+
+def run(source=None, **enricher_kwargs):
+    """
+    Fetches the attributes of every country of the code tables.
+
+    :param source: EnrichmentSource, RestCountriesSource by default
+    :param enricher_kwargs: see CountryEnricher
+    :return: DataFrame of the country_attributes table
+    """
+    enricher = CountryEnricher(source or RestCountriesSource(), **enricher_kwargs)
+    return asyncio.run(enricher.enrich(icd_10_code_parsers.get_country_codes_dict()))
+
+
+def load(attributes_df, engine, batch_size=postgres_loader.DEFAULT_BATCH_SIZE):
+    """
+    Upserts fetched attributes into the country_attributes table.
+
+    :param attributes_df: DataFrame as returned by run
+    :param engine: SQLAlchemy engine connected to the who database
+    :param batch_size: int
+    :return: see postgres_loader.upsert_dataframe
+    """
+    return postgres_loader.upsert_dataframe(attributes_df, TABLE, engine, key_columns=KEY_COLUMNS,
+                                            batch_size=batch_size)
@@ -0,0 +1,325 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+from urllib.parse import urlparse
+import requests
+from tqdm import tqdm
+from definitions import DOWNLOAD_DIR
+
+
+module_logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+DEFAULT_CONNECTIONS = 4
+DEFAULT_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 1
+REQUEST_TIMEOUT_SECONDS = 60
+
+
+class RemoteFileChanged(Exception):
+    """
+    The remote file changed during a download in byte ranges, the ranges already written are of another version.
+    """
+
+
+class RemoteFile(NamedTuple):
+    """
+    What the server reports about a file in response to a HEAD request.
+    """
+    size: Optional[int]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    accepts_ranges: bool
+
+
+def head(url):
+    """
+    Requests the headers of a remote file.
+
+    :param url: str
+    :return: RemoteFile
+    """
+    response = requests.head(url, allow_redirects=True, timeout=REQUEST_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    content_length = response.headers.get('Content-Length')
+    return RemoteFile(size=int(content_length) if content_length is not None else None,
+                      etag=response.headers.get('ETag'),
+                      last_modified=response.headers.get('Last-Modified'),
+                      accepts_ranges=response.headers.get('Accept-Ranges', '').lower() == 'bytes')
+
+
+def file_sha256(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    :param path: str
+    :param chunk_size: int, bytes read at a time
+    :return: str, hex digest of the SHA-256 of the file
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def read_metadata(metadata_path):
+    """
+    :param metadata_path: str
+    :return: dict, or None if there is no (readable) metadata
+    """
+    try:
+        with open(metadata_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_metadata(metadata_path, metadata):
+    """
+    Atomically replaces the metadata sidecar file, so an interrupted write never leaves it half written.
+
+    :param metadata_path: str
+    :param metadata: dict
+    """
+    with open(metadata_path + '.tmp', 'w') as f:
+        json.dump(metadata, f)
+    os.replace(metadata_path + '.tmp', metadata_path)
+
+
+def is_current(metadata, remote_file):
+    """
+    Checks whether the validators of a stored download match the remote file. A server which sends neither an ETag
+    nor a Last-Modified header can't show a download is current.
+
+    :param metadata: dict of the stored download
+    :param remote_file: RemoteFile
+    :return: bool
+    """
+    if remote_file.size is not None and metadata.get('size') != remote_file.size:
+        return False
+    if remote_file.etag is not None:
+        return metadata.get('etag') == remote_file.etag
+    if remote_file.last_modified is not None:
+        return metadata.get('last_modified') == remote_file.last_modified
+    return False
+
+
+def split_segments(size, segment_size):
+    """
+    :param size: int
+    :param segment_size: int
+    :return: List[Tuple(int first byte, int last byte)], inclusive like HTTP byte ranges
+    """
+    return [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+
+
+def with_retries(function, retries, description):
+    """
+    Calls function, retrying with exponential backoff when a request fails.
+
+    :param function: Callable[[], T]
+    :param retries: int, number of retries after the first attempt
+    :param description: str, used in log messages
+    :return: T
+    """
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except requests.RequestException as e:
+            if attempt == retries:
+                raise
+            backoff_seconds = RETRY_BACKOFF_SECONDS * 2 ** attempt
+            module_logger.warning(f"{description} failed ({e}), retrying in {backoff_seconds}s...")
+            time.sleep(backoff_seconds)
+
+
+def download_segment(url, part_path, segment, remote_file, chunk_size, progress_bar):
+    """
+    Downloads a byte range of url into the same range of the (preallocated) part file.
+
+    If-Range makes the server send the whole file instead of the range when it changed since the download started,
+    which raises RemoteFileChanged rather than mixing two versions of the file.
+
+    :param url: str
+    :param part_path: str
+    :param segment: Tuple(int first byte, int last byte)
+    :param remote_file: RemoteFile
+    :param chunk_size: int
+    :param progress_bar: tqdm
+    """
+    start, end = segment
+    headers = {'Range': f'bytes={start}-{end}'}
+    if remote_file.etag or remote_file.last_modified:
+        headers['If-Range'] = remote_file.etag or remote_file.last_modified
+    with requests.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT_SECONDS) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise RemoteFileChanged(f"Expected a partial response for bytes {start}-{end} of {url}, got "
+                                    f"{r.status_code}, the file changed during the download")
+        written = 0
+        with open(part_path, 'r+b') as part_file:
+            part_file.seek(start)
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                part_file.write(chunk)
+                written += len(chunk)
+                progress_bar.update(len(chunk))
+    if written != end - start + 1:
+        progress_bar.update(-written)
+        raise requests.ConnectionError(f"Received {written} of {end - start + 1} bytes of bytes {start}-{end} of "
+                                       f"{url}")
+
+
+def download_ranges(url, part_path, remote_file, connections, chunk_size, segment_size, retries):
+    """
+    Downloads a file in segments over up to connections concurrent range requests. Completed segments are recorded in
+    a sidecar of the part file, so a later call resumes an interrupted download as long as the remote file is unchanged.
+
+    :param url: str
+    :param part_path: str
+    :param remote_file: RemoteFile
+    :param connections: int
+    :param chunk_size: int
+    :param segment_size: int
+    :param retries: int
+    """
+    part_metadata_path = part_path + '.json'
+    part_metadata = read_metadata(part_metadata_path)
+    if (part_metadata is None or not os.path.exists(part_path) or part_metadata.get('url') != url
+            or part_metadata.get('segment_size') != segment_size or not is_current(part_metadata, remote_file)):
+        part_metadata = {'url': url, 'size': remote_file.size, 'etag': remote_file.etag,
+                         'last_modified': remote_file.last_modified, 'segment_size': segment_size, 'completed': []}
+        with open(part_path, 'wb') as part_file:
+            part_file.truncate(remote_file.size)
+        write_metadata(part_metadata_path, part_metadata)
+
+    segments = split_segments(remote_file.size, segment_size)
+    completed = set(part_metadata['completed'])
+    pending = [index for index in range(len(segments)) if index not in completed]
+    if completed:
+        module_logger.info(f"Resuming download of {url}, {len(completed)} of {len(segments)} segments already done")
+
+    metadata_lock = threading.Lock()
+    completed_size = sum(segments[index][1] - segments[index][0] + 1 for index in completed)
+    with tqdm(total=remote_file.size, initial=completed_size, unit='B', unit_scale=True) as progress_bar:
+        def fetch(index):
+            with_retries(lambda: download_segment(url, part_path, segments[index], remote_file, chunk_size,
+                                                  progress_bar),
+                         retries, f"Download of segment {index} of {url}")
+            with metadata_lock:
+                part_metadata['completed'].append(index)
+                write_metadata(part_metadata_path, part_metadata)
+
+        # Every segment is attempted before failing, so as much as possible is kept for resuming
+        with ThreadPoolExecutor(max_workers=max(1, min(connections, len(pending)))) as executor:
+            futures = [executor.submit(fetch, index) for index in pending]
+        for future in futures:
+            future.result()
+
+
+def download_stream(url, part_path, chunk_size, retries):
+    """
+    Downloads a file in a single request, for servers which don't support range requests or report no size. An
+    interrupted download starts over.
+
+    :param url: str
+    :param part_path: str
+    :param chunk_size: int
+    :param retries: int
+    """
+    def fetch():
+        with requests.get(url, stream=True, timeout=REQUEST_TIMEOUT_SECONDS) as r:
+            r.raise_for_status()
+            content_length = r.headers.get('Content-Length')
+            with open(part_path, 'wb') as part_file, \
+                    tqdm(total=int(content_length) if content_length else None, unit='B',
+                         unit_scale=True) as progress_bar:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    part_file.write(chunk)
+                    progress_bar.update(len(chunk))
+
+    with_retries(fetch, retries, f"Download of {url}")
+
+
+def download_path(url, download_dir=DOWNLOAD_DIR):
+    """
+    :param url: str
+    :param download_dir: str
+    :return: str path download keeps the file of url at
+    """
+    return os.path.join(download_dir, os.path.basename(urlparse(url).path))
+
+
+def remove_part(part_path):
+    """
+    Deletes a part file and its sidecar, so the next download starts from scratch.
+
+    :param part_path: str
+    """
+    for path in (part_path, part_path + '.json'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def download(url, download_dir=DOWNLOAD_DIR, connections=DEFAULT_CONNECTIONS, chunk_size=DEFAULT_CHUNK_SIZE,
+             segment_size=DEFAULT_SEGMENT_SIZE, retries=DEFAULT_RETRIES):
+    """
+    Downloads a file into download_dir, unless the copy from a previous download is current, and returns its path.
+
+    A metadata sidecar (<file>.json) records the ETag, Last-Modified, size and SHA-256 of every completed download.
+    The download is skipped after a HEAD request when the server reports the same ETag (or Last-Modified) and the
+    local copy still has the stored SHA-256, so a truncated or edited copy is downloaded again. Otherwise the file is
+    fetched in byte ranges over concurrent connections when the server supports range requests, into a part file
+    which is resumed if interrupted, and only moved into place once complete. A file which changes on the server
+    during the download is downloaded again from the start.
+
+    :param url: str
+    :param download_dir: str
+    :param connections: int, maximum number of concurrent range requests
+    :param chunk_size: int, bytes read from a response at a time
+    :param segment_size: int, bytes per range request
+    :param retries: int, number of retries of a failed request, or of the download of a file changed meanwhile
+    :return: str path of the downloaded file
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    path = download_path(url, download_dir)
+    metadata_path = path + '.json'
+    part_path = path + '.part'
+
+    metadata = read_metadata(metadata_path) if os.path.exists(path) else None
+    if metadata is not None and metadata.get('url') != url:
+        metadata = None
+
+    remote_file = with_retries(lambda: head(url), retries, f"HEAD request of {url}")
+    if metadata is not None and is_current(metadata, remote_file):
+        if file_sha256(path, chunk_size) == metadata.get('sha256'):
+            module_logger.info(f"{path} is up to date, skipping download of {url}")
+            return path
+        module_logger.warning(f"{path} doesn't match the SHA-256 of its download, downloading {url} again")
+
+    module_logger.info(f"Downloading file from {url} to {path}...")
+    for attempt in range(retries + 1):
+        try:
+            if remote_file.accepts_ranges and remote_file.size:
+                download_ranges(url, part_path, remote_file, connections, chunk_size, segment_size, retries)
+            else:
+                download_stream(url, part_path, chunk_size, retries)
+            break
+        except RemoteFileChanged as e:
+            if attempt == retries:
+                raise
+            module_logger.warning(f"{e}, downloading it again from the start...")
+            remove_part(part_path)
+            remote_file = with_retries(lambda: head(url), retries, f"HEAD request of {url}")
+
+    sha256 = file_sha256(part_path, chunk_size)
+    os.replace(part_path, path)
+    write_metadata(metadata_path, {'url': url, 'size': os.path.getsize(path), 'etag': remote_file.etag,
+                                   'last_modified': remote_file.last_modified, 'sha256': sha256})
+    remove_part(part_path)
+    module_logger.info(f"Download of {url} complete")
+    return path
@@ -1,109 +1,445 @@
+import os
 import requests
+import tempfile
 import zipfile
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from tqdm import tqdm
+import numpy as np
 import pandas as pd
+from pipeline import instrumentation
+from pipeline.ingest import age_bands
+from pipeline.ingest import downloader
 from pipeline.parsers import icd_10_code_parsers
+from pipeline.parsers import code_dictionary_cache
+from pipeline.query.mortality_queries import TOTAL_CAUSES
 
 
 module_logger = logging.getLogger(__name__)
 
 
-def download_file(url):
+# Downloads larger than this are spilled from memory to a temporary file
+MAX_IN_MEMORY_DOWNLOAD_SIZE = 512 * 1024 * 1024
+
+
+def download_file(url, temp_dir=None, max_memory_size=MAX_IN_MEMORY_DOWNLOAD_SIZE,
+                  chunk_size=downloader.DEFAULT_CHUNK_SIZE):
+    """
+    Downloads a file into a spooled temporary file. The download is kept in memory unless it grows larger than
+    max_memory_size, in which case it is moved to an anonymous temporary file in temp_dir (the system default
+    temporary directory if not given). Nothing is left behind on disk once the returned file is closed.
+
+    See downloader.download for cached, resumable downloads.
+
+    :param url: str
+    :param temp_dir: str
+    :param max_memory_size: int
+    :param chunk_size: int, bytes read from the response at a time
+    :return: Binary file object positioned at the start of the downloaded data
+    """
     module_logger.info(f"Downloading file from {url}...")
-    local_filename = url.split('/')[-1]
+    downloaded_file = tempfile.SpooledTemporaryFile(max_size=max_memory_size, dir=temp_dir)
     with requests.get(url, stream=True) as r:
         r.raise_for_status()
-        with open(local_filename, 'wb') as f:
-            progress_bar = tqdm(total=int(r.headers['Content-Length']))
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
-                progress_bar.update(len(chunk))
+        content_length = r.headers.get('Content-Length')
+        progress_bar = tqdm(total=int(content_length) if content_length else None)
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            downloaded_file.write(chunk)
+            progress_bar.update(len(chunk))
     progress_bar.clear()
-    module_logger.info(f"Download complete, file saved as: {local_filename}")
-    return local_filename
+    downloaded_file.seek(0)
+    module_logger.info(f"Download of {url} complete")
+    return downloaded_file
+
+
+@contextmanager
+def open_zipped_csv(zip_file):
+    """
+    Opens the csv contained in a zip archive for streaming, without extracting it to disk.
+
+    :param zip_file: str path or binary file object of the zip archive
+    :return: Binary file object of the archived csv
+    """
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        members = [member for member in zip_ref.infolist() if not member.is_dir()]
+        if not members:
+            raise ValueError(f"No file found in zip archive {zip_ref.filename}")
+        module_logger.info(f"Reading {members[0].filename} from zip archive...")
+        with zip_ref.open(members[0]) as csv_file:
+            yield csv_file
+
+
+# Only the columns needed by the simplified mortality rates view are read from the raw data
+ICD10_COLUMN_DTYPES = {'Country': 'int16',
+                       'Year': 'int16',
+                       'List': str,
+                       'Cause': str,
+                       'Sex': 'int8',
+                       'Deaths1': 'int32'}
+
+# Countries and causes are kept as the integer keys of the country and cause dimension tables
+AGGREGATION_KEYS = ['country_id', 'year', 'cause_id', 'sex']
+
+# Lists whose causes can be resolved, either by exact code or through the 3 character code ranges
+RESOLVABLE_LISTS = ['101', '103', '104', '10M', 'UE1']
+RANGE_INDEXED_LISTS = ['103', '104', '10M']
+
+
+def read_mortality_csv(mortality_rates_csv, chunksize=None, age_resolved=False):
+    """
+    Reads the raw ICD10 mortality rates csv, keeping only the required columns.
+
+    If chunksize is given the csv is read in chunks of (at most) that many rows, otherwise the whole file is read as a
+    single chunk.
+
+    :param mortality_rates_csv: str path or file object
+    :param chunksize: int
+    :param age_resolved: bool, also read the age format and age group columns
+    :return: Iterator[DataFrame]
+    """
+    column_dtypes = dict(ICD10_COLUMN_DTYPES, **age_bands.AGE_COLUMN_DTYPES) if age_resolved else ICD10_COLUMN_DTYPES
+    reader = pd.read_csv(mortality_rates_csv,
+                         usecols=list(column_dtypes),
+                         dtype=column_dtypes,
+                         chunksize=chunksize)
+    if chunksize is None:
+        return iter([reader])
+    return reader
+
+
+def get_code_lookups(coverage_pruning=False):
+    """
+    Builds all code lookups needed to transform the raw ICD10 mortality rates data from the cached code dictionaries.
+
+    WHO country codes are used as country ids as is, cause codes are resolved to the ids of the cause dimension (see
+    icd_10_code_parsers.build_cause_dimension).
+
+    :param coverage_pruning: bool, include the coverage index of the availability file, so transform drops rows whose
+        list it contradicts
+    :return: {lookup name: lookup} dict
+    """
+    code_dictionaries = code_dictionary_cache.get_code_dictionaries()
+    cause_dimension = icd_10_code_parsers.build_cause_dimension(code_dictionaries['condensed'],
+                                                                code_dictionaries['3_char'],
+                                                                code_dictionaries['portugal'])
+    cause_code_lookup = icd_10_code_parsers.build_cause_code_lookup(code_dictionaries['condensed'],
+                                                                    code_dictionaries['portugal'])
+    cause_code_index = code_dictionaries['3_char']
+    return {'country': code_dictionaries['country'],
+            'cause_dimension': cause_dimension,
+            'aggregate_causes': code_dictionaries['aggregate_causes'],
+            'cause': icd_10_code_parsers.build_cause_id_lookup(cause_code_lookup, cause_dimension),
+            '3_char': cause_code_index,
+            '3_char_cause_ids': icd_10_code_parsers.get_cause_ids(cause_dimension, cause_code_index.causes),
+            'coverage': code_dictionary_cache.get_coverage_index() if coverage_pruning else None}
+
+
+def get_dimensions(code_lookups):
+    """
+    Rows of the country and cause dimension tables.
+
+    :param code_lookups: lookups as returned by get_code_lookups
+    :return: {'country': DataFrame of country_id, name, 'cause': DataFrame of cause_id, name, total, aggregate} dict
+    """
+    return {'country': pd.DataFrame({'country_id': np.fromiter(code_lookups['country'], dtype=np.int16,
+                                                               count=len(code_lookups['country'])),
+                                     'name': list(code_lookups['country'].values())}),
+            'cause': pd.DataFrame({'cause_id': code_lookups['cause_dimension'].index.to_numpy(np.int32),
+                                   'name': code_lookups['cause_dimension'].to_numpy(),
+                                   'total': code_lookups['cause_dimension'].isin(TOTAL_CAUSES).to_numpy(),
+                                   'aggregate': code_lookups['cause_dimension'].isin(
+                                       code_lookups['aggregate_causes']).to_numpy()})}
+
+
+def with_names(df, code_lookups):
+    """
+    Replaces the country_id and cause_id columns of a processed DataFrame with country and cause names.
+
+    :param df: DataFrame with country_id and cause_id columns
+    :param code_lookups: lookups as returned by get_code_lookups
+    :return: DataFrame with country and cause columns in place of the id columns
+    """
+    return df.rename(columns={'country_id': 'country', 'cause_id': 'cause'}).assign(
+        country=df['country_id'].map(code_lookups['country']).to_numpy(),
+        cause=code_lookups['cause_dimension'].reindex(df['cause_id']).to_numpy())
+
+
+def resolve_causes(lists, causes, cause_lookup, cause_code_index, cause_code_index_ids):
+    """
+    Resolves the cause codes of every ICD10 list to cause ids in a single vectorized pass.
+
+    Rows are encoded as integer ids of their distinct (list, code) pair, built from the factorized codes of both
+    columns, so only the distinct pairs are looked up before the resolved causes are scattered back to the rows.
+    Codes of lists 103, 104 and 10M are resolved by their 3 character category through cause_code_index, the other
+    lists through cause_lookup. Unknown codes and codes of lists which can't be resolved become -1.
+
+    :param lists: Series of list names
+    :param causes: Series of cause codes
+    :param cause_lookup: lookup as returned by icd_10_code_parsers.build_cause_id_lookup
+    :param cause_code_index: CodeRangeIndex as returned by icd_10_code_parsers.get_3_char_cause_code_index
+    :param cause_code_index_ids: ndarray of the cause ids of the causes of cause_code_index
+    :return: ndarray of int32 cause ids
+    """
+    list_codes, list_names = pd.factorize(lists)
+    cause_codes, cause_names = pd.factorize(causes)
+
+    n_causes = max(len(cause_names), 1)
+    pair_ids = list_codes.astype(np.int64) * n_causes + cause_codes
+    missing = (list_codes < 0) | (cause_codes < 0)
+    pair_ids[missing] = -1
+    pair_codes, unique_pair_ids = pd.factorize(pair_ids)
+
+    pair_lists = np.asarray(list_names, dtype=object)[unique_pair_ids // n_causes]
+    pair_causes = np.asarray(cause_names, dtype=object)[unique_pair_ids % n_causes]
+    range_indexed = np.isin(pair_lists, RANGE_INDEXED_LISTS)
+    pair_cause_ids = cause_lookup.reindex(pd.MultiIndex.from_arrays([pair_lists, pair_causes]),
+                                          fill_value=-1).to_numpy(np.int32, copy=True)
+    index_cause_ids = cause_code_index.get_cause_ids(pair_causes[range_indexed])
+    pair_cause_ids[range_indexed] = np.where(index_cause_ids >= 0, cause_code_index_ids[index_cause_ids], -1)
+
+    cause_ids = pair_cause_ids[pair_codes]
+    cause_ids[missing] = -1
+    return cause_ids
+
 
+def transform(mortality_df, code_lookups, age_resolved=False):
+    """
+    Replaces codes with the keys of the dimension tables and aggregates duplicate rows for a chunk of raw ICD10
+    mortality rates data. Rows of unknown countries or causes are dropped. With the coverage lookup, rows of
+    country-years the availability file records with other lists only are dropped as well (see
+    coverage_index.CoverageIndex.contradicted), recorded as the coverage_pruning stage.
+
+    :param mortality_df: DataFrame with the columns of ICD10_COLUMN_DTYPES (and age_bands.AGE_COLUMN_DTYPES if
+    age_resolved)
+    :param code_lookups: lookups as returned by get_code_lookups
+    :param age_resolved: bool, keep deaths per age band
+    :return: Aggregated DataFrame, or age_bands.AgeResolvedMortality if age_resolved
+    """
+
+    if age_resolved:
+        with instrumentation.stage('age_bands') as rows:
+            rows.rows_in = len(mortality_df)
+            deaths_by_age, age_exact = age_bands.to_age_band_block(mortality_df)
+            mortality_df = mortality_df[list(ICD10_COLUMN_DTYPES)]
+
+    with instrumentation.stage('code_mapping') as rows:
+        rows.rows_in = len(mortality_df)
+
+        # Rename columns to lowercase
+        mortality_df = mortality_df.rename(columns={'Country': 'country_id',
+                                                    'Year': 'year',
+                                                    'List': 'list',
+                                                    'Cause': 'cause',
+                                                    'Sex': 'sex',
+                                                    'Deaths1': 'deaths'})
+
+        # Map sex codes to characters
+        mortality_df['sex'] = mortality_df['sex'].map({1: 'm',
+                                                       2: 'f',
+                                                       9: 'u'})
+
+        # Rows of unknown countries and of lists the availability file rules out are left out before resolving causes
+        known = mortality_df['country_id'].isin(list(code_lookups['country'])).to_numpy()
+        if code_lookups.get('coverage') is not None:
+            known = known & ~prune_coverage(mortality_df, code_lookups['coverage'])
+
+        # Map ICD10 cause codes of every list to cause ids
+        cause_ids = np.full(len(mortality_df), -1, dtype=np.int32)
+        cause_ids[known] = resolve_causes(mortality_df['list'][known], mortality_df['cause'][known],
+                                          code_lookups['cause'], code_lookups['3_char'],
+                                          code_lookups['3_char_cause_ids'])
+
+        # Country codes are already country ids, the List and Cause columns are no longer needed
+        known = known & (cause_ids >= 0)
+        mortality_df = mortality_df.assign(cause_id=cause_ids).loc[known, ['country_id', 'year', 'cause_id', 'sex',
+                                                                          'deaths']]
+        if age_resolved:
+            deaths_by_age, age_exact = deaths_by_age[known], age_exact[known]
+        rows.rows_out = len(mortality_df)
+
+    # Aggregating duplicate rows by combining deaths
+    with instrumentation.stage('aggregate') as rows:
+        rows.rows_in = len(mortality_df)
+        if age_resolved:
+            aggregated = age_bands.aggregate(mortality_df.assign(age_exact=age_exact), deaths_by_age,
+                                             AGGREGATION_KEYS)
+        else:
+            aggregated = mortality_df.groupby(by=AGGREGATION_KEYS, as_index=False).sum()
+        rows.rows_out = count_rows(aggregated)
+    return aggregated
 
-def unzip_file(zip_file_path):
-    module_logger.info(f"Extracting {zip_file_path}...")
-    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-        zip_ref.extractall("./")
-    module_logger.info(f"Extraction complete, file saved as {zip_ref.filename.split('.')[0]}")
-    return zip_ref.filename.split(".")[0]
 
+def prune_coverage(mortality_df, coverage):
+    """
+    Finds the rows of country-years the availability file records with other lists only, logging how many rows of
+    each country-year are dropped.
+
+    :param mortality_df: DataFrame with country_id, year and list columns
+    :param coverage: CoverageIndex
+    :return: bool ndarray, True for rows to drop
+    """
+    with instrumentation.stage('coverage_pruning') as rows:
+        rows.rows_in = len(mortality_df)
+        contradicted = coverage.contradicted(mortality_df['country_id'], mortality_df['year'], mortality_df['list'])
+        rows.rows_out = rows.rows_in - int(contradicted.sum())
+    if contradicted.any():
+        dropped = mortality_df.loc[contradicted].groupby(['country_id', 'year', 'list']).size()
+        module_logger.warning(f"Dropping {contradicted.sum()} rows of country-years the availability file records "
+                              f"with other lists: " + ', '.join(f"{country_id} {year} list {list_name}: {count}"
+                                                                for (country_id, year, list_name), count
+                                                                in dropped.items()))
+    return contradicted
+
+
+def count_rows(processed):
+    """
+    :param processed: DataFrame or age_bands.AgeResolvedMortality
+    :return: int, number of aggregated rows
+    """
+    if isinstance(processed, age_bands.AgeResolvedMortality):
+        return len(processed.mortality_df)
+    return len(processed)
+
+
+def merge_aggregates(aggregated_df, chunk_df):
+    """
+    Merges two partially aggregated DataFrames (or age_bands.AgeResolvedMortality results) by combining deaths of
+    rows sharing the same key.
 
-def run(mortality_data_url):
+    :param aggregated_df: DataFrame or None
+    :param chunk_df: DataFrame
+    :return: Aggregated DataFrame
+    """
+    if aggregated_df is None:
+        return chunk_df
+    with instrumentation.stage('merge') as rows:
+        rows.rows_in = count_rows(aggregated_df) + count_rows(chunk_df)
+        if isinstance(chunk_df, age_bands.AgeResolvedMortality):
+            merged = age_bands.merge(aggregated_df, chunk_df, AGGREGATION_KEYS)
+        else:
+            merged = pd.concat([aggregated_df, chunk_df],
+                               ignore_index=True).groupby(by=AGGREGATION_KEYS, as_index=False).sum()
+        rows.rows_out = count_rows(merged)
+    return merged
+
+
+def open_download(url, temp_dir=None, download_dir=None, connections=downloader.DEFAULT_CONNECTIONS):
+    """
+    Downloads a file and opens it for reading. Paths of local files are opened without downloading.
+
+    :param url: str, URL or path of a local file
+    :param temp_dir: str, see download_file
+    :param download_dir: str, keep the download in this directory with downloader.download instead of in memory
+    :param connections: int, see downloader.download
+    :return: Binary file object
+    """
+    if os.path.isfile(url):
+        return open(url, 'rb')
+    if download_dir:
+        return open(downloader.download(url, download_dir=download_dir, connections=connections), 'rb')
+    return download_file(url, temp_dir=temp_dir)
+
+
+def run(mortality_data_url, chunksize=None, temp_dir=None, age_resolved=False, download_dir=None,
+        connections=downloader.DEFAULT_CONNECTIONS, coverage_pruning=False):
     """
     Downloads ICD10 mortality rates data from WHO servers, cleans and transforms data, and returns processed DataFrame.
 
-    :return: Processed ICD10 mortality rates DataFrame
+    The csv is streamed straight out of the downloaded zip archive. Without download_dir the archive is only written
+    to disk (in temp_dir) when it is too large to keep in memory, with download_dir it is kept there and only
+    downloaded again once it changed on the server.
+
+    When chunksize is given the data is streamed in chunks of that many rows, each chunk is transformed and aggregated
+    on its own and the partial results are merged, so peak memory is bounded by the chunk size rather than file size.
+
+    With age_resolved the deaths of each age group are kept as well, see age_bands.AgeResolvedMortality.
+
+    :param mortality_data_url: str, URL or path of a local zip archive
+    :param chunksize: int
+    :param temp_dir: str
+    :param age_resolved: bool
+    :param download_dir: str
+    :param connections: int, maximum number of concurrent connections per download
+    :param coverage_pruning: bool, drop rows the availability file contradicts, see get_code_lookups
+    :return: Processed ICD10 mortality rates DataFrame, or age_bands.AgeResolvedMortality if age_resolved
     """
 
     module_logger.info(f"Starting ICD10 processor for {mortality_data_url}...")
-    # Download pt1 of data
-    mortality_rates_zip_name = download_file(mortality_data_url)
-
-    # Extract data
-    mortality_rates_name = unzip_file(mortality_rates_zip_name)
-
-    # Read into dataframe
-    module_logger.info(f"Reading {mortality_rates_name} into DataFrame...")
-    mortality_df = pd.read_csv(mortality_rates_name, dtype={'Country': int,
-                                                            'Year': int,
-                                                            'Sex': int,
-                                                            'Deaths1': int})
-
-    module_logger.info("Processing ICD 10 DataFrame...")
-
-    # Remove unneeded columns
-    mortality_df = mortality_df[['Country', 'Year', 'List', 'Cause', 'Sex', 'Deaths1']]
-
-    # Rename columns to lowercase
-    mortality_df.rename(columns={'Country': 'country',
-                                 'Year': 'year',
-                                 'List': 'list',
-                                 'Cause': 'cause',
-                                 'Sex': 'sex',
-                                 'Deaths1': 'deaths'}, inplace=True)
-
-    # Map sex codes to characters
-    mortality_df['sex'] = mortality_df['sex'].map({1: 'm',
-                                                   2: 'f',
-                                                   9: 'u'})
-
-    # Map county codes to country names
-    mortality_df['country'] = mortality_df['country'].map(icd_10_code_parsers.get_country_codes_dict())
-
-    # Map ICD10 condensed cause codes to cause names
-    icd_10_condensed_dict = icd_10_code_parsers.get_condensed_cause_code_dict()
-    mortality_df.loc[mortality_df['list'] == 101, 'cause'] = \
-        mortality_df.loc[mortality_df['list'] == 101, 'cause'].map(icd_10_condensed_dict)
-
-    # Map ICD10 (revision 3) character cause codes to cause names
-    icd_10_3_char_dict = icd_10_code_parsers.get_3_char_cause_code_dict()
-    mortality_df.loc[mortality_df['list'] == '103', 'list'] = 103
-    mortality_df.loc[mortality_df['list'] == 103, 'cause'] = \
-        mortality_df.loc[mortality_df['list'] == 103, 'cause'].map(icd_10_3_char_dict)
-
-    # Map ICD10 (revision 4) character cause codes to cause names
-    mortality_df.loc[mortality_df['list'] == '104', 'list'] = 104
-    mortality_df.loc[mortality_df['list'] == 104, 'cause'] = \
-        mortality_df.loc[mortality_df['list'] == 104, 'cause'].map(lambda x: x[:3]).map(icd_10_3_char_dict)
-
-    # Map ICD10 (revision 10M)) character cause codes to cause names
-    mortality_df.loc[mortality_df['list'] == '10M', 'cause'] = \
-        mortality_df.loc[mortality_df['list'] == '10M', 'cause'].map(lambda x: x[:3]).map(icd_10_3_char_dict)
-
-    # Map ICD10 (revision Portugal special list) character cause codes to cause names
-    icd_10_portugal_codes_dict = icd_10_code_parsers.get_portugal_condensed_cause_code_dict()
-    mortality_df.loc[mortality_df['list'] == 'UE1', 'cause'] = \
-        mortality_df.loc[mortality_df['list'] == 'UE1', 'cause'].map(icd_10_portugal_codes_dict)
-
-    # No longer need List column so will drop
-    mortality_df.drop(columns='list', inplace=True)
+    with instrumentation.stage('code_lookups'):
+        code_lookups = get_code_lookups(coverage_pruning)
 
-    # Aggregating duplicate rows by combining deaths
-    module_logger.info("Aggregating data...")
-    mortality_df = mortality_df.groupby(by=['country', 'year', 'cause', 'sex'], as_index=False).sum()
+    with instrumentation.stage('download'):
+        mortality_rates_zip = open_download(mortality_data_url, temp_dir=temp_dir, download_dir=download_dir,
+                                            connections=connections)
+    with mortality_rates_zip:
+        return process_zip(mortality_rates_zip, code_lookups, chunksize=chunksize, age_resolved=age_resolved)
+
+
+def process_zip(mortality_rates_zip, code_lookups, chunksize=None, age_resolved=False):
+    """
+    Processes a zipped ICD10 mortality rates csv, see run.
+
+    :param mortality_rates_zip: str path or binary file object of the zip archive
+    :param code_lookups: lookups as returned by get_code_lookups
+    :param chunksize: int
+    :param age_resolved: bool
+    :return: Processed ICD10 mortality rates DataFrame, or age_bands.AgeResolvedMortality if age_resolved
+    """
+    mortality_df = None
+    # The csv is decompressed while it is parsed, so unzipping is part of the read_csv stage
+    with open_zipped_csv(mortality_rates_zip) as mortality_rates_csv:
+        for chunk_df in instrumentation.timed_iter('read_csv', read_mortality_csv(mortality_rates_csv,
+                                                                                  chunksize=chunksize,
+                                                                                  age_resolved=age_resolved)):
+            module_logger.debug(f"Processing chunk of {len(chunk_df)} rows...")
+            mortality_df = merge_aggregates(mortality_df, transform(chunk_df, code_lookups, age_resolved=age_resolved))
+
+    return mortality_df
+
+
+def run_all(mortality_data_urls, workers=1, chunksize=None, temp_dir=None, age_resolved=False, download_dir=None,
+            connections=downloader.DEFAULT_CONNECTIONS, coverage_pruning=False):
+    """
+    Runs the ICD10 processor for each part of the mortality rates data and merges the parts into one DataFrame.
+
+    With more than one worker the parts are processed in parallel worker processes. Parts are merged in the order of
+    mortality_data_urls, so the result does not depend on which worker finishes first. Stages run in the workers are
+    added to the active instrumentation report.
+
+    :param mortality_data_urls: List[str]
+    :param workers: int, maximum number of worker processes
+    :param chunksize: int
+    :param temp_dir: str
+    :param age_resolved: bool
+    :param download_dir: str
+    :param connections: int
+    :param coverage_pruning: bool
+    :return: Processed ICD10 mortality rates DataFrame, or age_bands.AgeResolvedMortality if age_resolved
+    """
+    run_part = partial(run, chunksize=chunksize, temp_dir=temp_dir, age_resolved=age_resolved,
+                       download_dir=download_dir, connections=connections, coverage_pruning=coverage_pruning)
+    if workers > 1 and len(mortality_data_urls) > 1:
+        module_logger.info(f"Processing {len(mortality_data_urls)} parts with {workers} workers...")
+        # Compile the code dictionaries once up front rather than in every worker
+        code_dictionary_cache.get_code_dictionaries()
+        if coverage_pruning:
+            code_dictionary_cache.get_coverage_index()
+        report = instrumentation.active_report()
+        if report is not None:
+            run_part = partial(instrumentation.call_recorded, report.capture, run_part)
+        with ProcessPoolExecutor(max_workers=min(workers, len(mortality_data_urls))) as executor:
+            part_dfs = list(executor.map(run_part, mortality_data_urls))
+        if report is not None:
+            for _, summary in part_dfs:
+                report.merge(summary)
+            part_dfs = [part_df for part_df, _ in part_dfs]
+    else:
+        part_dfs = [run_part(url) for url in mortality_data_urls]
 
+    module_logger.info("Merging processed parts...")
+    mortality_df = None
+    for part_df in part_dfs:
+        mortality_df = merge_aggregates(mortality_df, part_df)
     return mortality_df
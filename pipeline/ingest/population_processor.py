@@ -0,0 +1,167 @@
+import logging
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from definitions import POPULATION_PATH
+from pipeline.ingest import age_bands
+from pipeline.parsers import code_dictionary_cache
+
+
+module_logger = logging.getLogger(__name__)
+
+POPULATION_COLUMN_DTYPES = dict([('Country', 'int16'), ('Admin1', 'str'), ('SubDiv', 'str'), ('Year', 'int16'),
+                                 ('Sex', 'int8'), ('Frmat', 'float32'), ('Pop1', 'float64')] +
+                                [(column, 'float64') for column, _ in age_bands.POPULATION_BAND_COLUMNS])
+
+POPULATION_KEYS = ['country_id', 'year', 'sex']
+
+PER_100K = 100000
+
+# WHO World Standard Population (Ahmad et al. 2001) per 100,000 for ages 0-4, 5-9, ..., 80-84 and 85+. The published
+# weights sum to 100,035 because of rounding, so they are normalized.
+WHO_STANDARD_POPULATION = np.array([8860, 8690, 8600, 8470, 8220, 7930, 7610, 7150, 6590, 6040, 5370, 4550, 3720,
+                                    2960, 2210, 1520, 910, 635], dtype=np.float64)
+STANDARD_POPULATION_WEIGHTS = WHO_STANDARD_POPULATION / WHO_STANDARD_POPULATION.sum()
+
+# Start of each standard age group in the canonical age bands up to 85+, the '0' and '1-4' bands form 0-4
+STANDARD_AGE_GROUP_STARTS = [0] + list(range(2, age_bands.AGE_BANDS.index('85+') + 1))
+
+
+class AgeResolvedPopulation(NamedTuple):
+    """
+    Population per country, year and sex.
+
+    population_df has the key columns, total population and an age_exact flag (False when the population was
+    reported in a format coarser than the canonical age bands). population_by_age holds one row of population per
+    canonical age band up to 'unknown' for each row of population_df.
+    """
+    population_df: pd.DataFrame
+    population_by_age: np.ndarray
+
+
+def read_population_csv(population_csv):
+    """
+    Reads the raw WHO population csv, keeping only the required columns.
+
+    :param population_csv: str path or file object
+    :return: DataFrame
+    """
+    return pd.read_csv(population_csv, usecols=list(POPULATION_COLUMN_DTYPES), dtype=POPULATION_COLUMN_DTYPES)
+
+
+def transform(population_df, country_lookup):
+    """
+    Maps sex codes and aggregates the raw population data to one row per country, year and sex. Country codes are
+    kept as country ids, rows of unknown countries are dropped.
+
+    Some countries report administrative subdivisions next to the national total, national rows are used where
+    present and the subdivisions are summed otherwise.
+
+    :param population_df: DataFrame with the columns of POPULATION_COLUMN_DTYPES
+    :param country_lookup: {country code: country name} dict of the known countries
+    :return: AgeResolvedPopulation, sorted by POPULATION_KEYS
+    """
+    national = (population_df['Admin1'].isna() & population_df['SubDiv'].isna()).to_numpy()
+    has_national = pd.Series(national).groupby([population_df['Country'].to_numpy(),
+                                                population_df['Year'].to_numpy(),
+                                                population_df['Sex'].to_numpy()]).transform('any').to_numpy()
+
+    population_df = pd.DataFrame({'country_id': population_df['Country'],
+                                  'year': population_df['Year'],
+                                  'sex': population_df['Sex'].map({1: 'm',
+                                                                   2: 'f',
+                                                                   9: 'u'}),
+                                  'population': population_df['Pop1'].fillna(0),
+                                  'age_exact': population_df['Frmat'].isin(age_bands.EXACT_AGE_FORMATS),
+                                  **{column: population_df[column] for column, _ in age_bands.POPULATION_BAND_COLUMNS}})
+    population_df = population_df[(national | ~has_national)
+                                  & population_df['country_id'].isin(list(country_lookup)).to_numpy()]
+
+    grouped = population_df.groupby(by=POPULATION_KEYS, sort=True)
+    group_ids = grouped.ngroup().to_numpy()
+    aggregated_df = grouped.agg(population=('population', 'sum'), age_exact=('age_exact', 'all')).reset_index()
+
+    band_block = age_bands.to_band_block(population_df, age_bands.POPULATION_BAND_COLUMNS, np.float64)
+    population_by_age = np.zeros((len(aggregated_df), band_block.shape[1]), dtype=np.float64)
+    np.add.at(population_by_age, group_ids, band_block)
+
+    return AgeResolvedPopulation(aggregated_df, population_by_age)
+
+
+def run(population_path=POPULATION_PATH):
+    """
+    Processes the WHO population data.
+
+    :param population_path: str
+    :return: AgeResolvedPopulation
+    """
+    module_logger.info(f"Starting population processor for {population_path}...")
+    population = transform(read_population_csv(population_path),
+                           code_dictionary_cache.get_code_dictionaries()['country'])
+    module_logger.info(f"Finished population processor, {len(population.population_df)} rows")
+    return population
+
+
+def to_dataframe(population, format_block):
+    """
+    Combines an AgeResolvedPopulation into a single DataFrame of integer counts with a population_by_age column
+    holding each row's population per band, as formatted by format_block.
+
+    :param population: AgeResolvedPopulation
+    :param format_block: Callable[[ndarray], Sequence], e.g. postgres_loader.to_array_literals
+    :return: DataFrame
+    """
+    return population.population_df.assign(
+        population=np.rint(population.population_df['population'].to_numpy()).astype(np.int64),
+        population_by_age=format_block(np.rint(population.population_by_age).astype(np.int64)))
+
+
+def compute_rates(mortality, population):
+    """
+    Computes crude and age-standardized death rates per 100,000 people for every row of the processed mortality rates.
+
+    Mortality rows are matched to their population on (country, year, sex) through an index over the population keys,
+    and rates are computed over whole columns. Age-standardized rates weight the rate of each age group up to 85+ by
+    the WHO World Standard Population, so they need deaths per age band and are only computed for rows whose deaths
+    and population both have exact age groups and no empty age group. Rates which can't be computed are NaN.
+
+    :param mortality: DataFrame with AGGREGATION_KEYS and deaths, or age_bands.AgeResolvedMortality
+    :param population: AgeResolvedPopulation
+    :return: DataFrame with the mortality keys, deaths, population, crude_rate and age_standardized_rate
+    """
+    if isinstance(mortality, age_bands.AgeResolvedMortality):
+        mortality_df, deaths_by_age = mortality
+    else:
+        mortality_df, deaths_by_age = mortality, None
+    population_df = population.population_df
+
+    population_index = pd.MultiIndex.from_frame(population_df[POPULATION_KEYS])
+    positions = population_index.get_indexer(pd.MultiIndex.from_frame(mortality_df[POPULATION_KEYS]))
+    matched = positions >= 0
+
+    population_totals = np.full(len(mortality_df), np.nan)
+    population_totals[matched] = population_df['population'].to_numpy(dtype=np.float64)[positions[matched]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crude_rate = np.where(population_totals > 0,
+                              mortality_df['deaths'].to_numpy(dtype=np.float64) / population_totals * PER_100K,
+                              np.nan)
+
+    age_standardized_rate = np.full(len(mortality_df), np.nan)
+    if deaths_by_age is not None:
+        standardized = matched & mortality_df['age_exact'].to_numpy(dtype=bool)
+        standardized[standardized] = population_df['age_exact'].to_numpy(dtype=bool)[positions[standardized]]
+
+        group_deaths = np.add.reduceat(deaths_by_age[standardized, :STANDARD_AGE_GROUP_STARTS[-1] + 1],
+                                       STANDARD_AGE_GROUP_STARTS, axis=1, dtype=np.float64)
+        group_population = np.add.reduceat(
+            population.population_by_age[positions[standardized], :STANDARD_AGE_GROUP_STARTS[-1] + 1],
+            STANDARD_AGE_GROUP_STARTS, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            standardized_rates = (group_deaths / group_population) @ STANDARD_POPULATION_WEIGHTS * PER_100K
+        standardized_rates[~(group_population > 0).all(axis=1)] = np.nan
+        age_standardized_rate[standardized] = standardized_rates
+
+    return mortality_df[['country_id', 'year', 'cause_id', 'sex', 'deaths']].assign(
+        population=pd.array(np.round(population_totals), dtype='Int64'),
+        crude_rate=crude_rate,
+        age_standardized_rate=age_standardized_rate)
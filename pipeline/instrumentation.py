@@ -0,0 +1,304 @@
+import cProfile
+import json
+import logging
+import os
+import platform
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak RSS is not reported there
+    resource = None
+
+
+module_logger = logging.getLogger(__name__)
+
+CAPTURE_MODES = ['cprofile', 'tracemalloc']
+
+# Functions listed per stage in the cProfile capture mode
+PROFILE_TOP_FUNCTIONS = 25
+
+_active_report = None
+
+
+def peak_rss_bytes():
+    """
+    :return: int, peak resident set size of the process so far, or None where it can't be measured
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class StageRows:
+    """
+    Rows going into and out of a stage, set by the code running in the stage, which may also set calls to 0 when the
+    run shouldn't count as a call of the stage.
+    """
+    def __init__(self):
+        self.rows_in = None
+        self.rows_out = None
+        self.calls = 1
+
+
+class _CaptureFrame:
+    """
+    Capture state of a stage which is currently running.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.traced_peak_bytes = 0
+
+
+class RunReport:
+    """
+    Collects metrics of the stages of a run, see stage.
+
+    Stages with the same name (e.g. one per chunk or part) are combined, summing their calls, times and rows and
+    keeping the highest peak memory. Times of a stage include the stages nested in it. With capture set to 'cprofile'
+    each stage is profiled (excluding nested stages), with 'tracemalloc' the peak memory traced by Python is recorded
+    as well. Both slow the run down, so they are off by default.
+
+    :param capture: str, one of CAPTURE_MODES or None
+    """
+
+    def __init__(self, capture=None):
+        if capture is not None and capture not in CAPTURE_MODES:
+            raise ValueError(f"Unknown capture mode {capture}, expected one of {CAPTURE_MODES}")
+        self.capture = capture
+        self.started_at = datetime.now(timezone.utc)
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self.stages = {}
+        self._profiles = {}
+        self._profilers = {}
+        self._capture_stack = []
+        self._started_tracemalloc = False
+
+    def add(self, name, calls=1, wall_seconds=0.0, cpu_seconds=0.0, rows_in=None, rows_out=None,
+            peak_rss_bytes=None, traced_peak_bytes=None):
+        """
+        Adds the metrics of one or more runs of a stage.
+        """
+        stage = self.stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows_in': None,
+                                              'rows_out': None, 'peak_rss_bytes': None})
+        stage['calls'] += calls
+        stage['wall_seconds'] += wall_seconds
+        stage['cpu_seconds'] += cpu_seconds
+        for key, value in [('rows_in', rows_in), ('rows_out', rows_out)]:
+            if value is not None:
+                stage[key] = (stage[key] or 0) + value
+        for key, value in [('peak_rss_bytes', peak_rss_bytes), ('traced_peak_bytes', traced_peak_bytes)]:
+            if value is not None:
+                stage[key] = max(stage.get(key) or 0, value)
+
+    def add_profile(self, name, functions):
+        """
+        Adds profiled functions of a stage.
+
+        :param name: str
+        :param functions: {function: [calls, total_seconds, cumulative_seconds]} dict
+        """
+        profile = self._profiles.setdefault(name, {})
+        for function, (calls, total_seconds, cumulative_seconds) in functions.items():
+            totals = profile.setdefault(function, [0, 0.0, 0.0])
+            totals[0] += calls
+            totals[1] += total_seconds
+            totals[2] += cumulative_seconds
+
+    def start_capture(self, name):
+        if self._capture_stack:
+            self._pause_capture(self._capture_stack[-1])
+        frame = _CaptureFrame(name)
+        self._capture_stack.append(frame)
+        if self.capture == 'cprofile':
+            self._profilers.setdefault(name, cProfile.Profile()).enable()
+        elif self.capture == 'tracemalloc':
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+        return frame
+
+    def stop_capture(self, frame):
+        self._capture_stack.pop()
+        traced_peak_bytes = None
+        if self.capture == 'cprofile':
+            self._profilers[frame.name].disable()
+        elif self.capture == 'tracemalloc':
+            traced_peak_bytes = max(frame.traced_peak_bytes, tracemalloc.get_traced_memory()[1])
+        if self._capture_stack:
+            parent = self._capture_stack[-1]
+            parent.traced_peak_bytes = max(parent.traced_peak_bytes, traced_peak_bytes or 0)
+            if self.capture == 'cprofile':
+                self._profilers[parent.name].enable()
+        elif self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return traced_peak_bytes
+
+    def _pause_capture(self, frame):
+        if self.capture == 'cprofile':
+            self._profilers[frame.name].disable()
+        elif self.capture == 'tracemalloc':
+            frame.traced_peak_bytes = max(frame.traced_peak_bytes, tracemalloc.get_traced_memory()[1])
+
+    def profiles(self):
+        """
+        :return: {stage name: {function: [calls, total_seconds, cumulative_seconds]}} dict of all profiled stages
+        """
+        profiles = {name: dict(functions) for name, functions in self._profiles.items()}
+        for name, profiler in self._profilers.items():
+            for (filename, line, function_name), (_, calls, total_seconds, cumulative_seconds, _) in \
+                    pstats.Stats(profiler).stats.items():
+                function = f"{filename}:{line}({function_name})"
+                totals = profiles.setdefault(name, {}).setdefault(function, [0, 0.0, 0.0])
+                totals[0] += calls
+                totals[1] += total_seconds
+                totals[2] += cumulative_seconds
+        return profiles
+
+    def summary(self):
+        """
+        :return: Tuple(stages, profiles) which can be pickled and added to another report with merge
+        """
+        return self.stages, self.profiles()
+
+    def merge(self, summary):
+        """
+        Adds the stages of another report, e.g. of a worker process.
+
+        :param summary: as returned by RunReport.summary
+        """
+        stages, profiles = summary
+        for name, stage in stages.items():
+            self.add(name, **stage)
+        for name, functions in profiles.items():
+            self.add_profile(name, functions)
+
+    def to_dict(self, **metadata):
+        """
+        :param metadata: extra JSON serializable run information, e.g. the pipeline arguments
+        :return: JSON serializable dict of the run report
+        """
+        stages = {name: dict(stage) for name, stage in self.stages.items()}
+        for name, functions in self.profiles().items():
+            top_functions = sorted(functions.items(), key=lambda item: item[1][2], reverse=True)
+            stages.setdefault(name, {})['profile'] = [
+                {'function': function, 'calls': calls, 'total_seconds': total_seconds,
+                 'cumulative_seconds': cumulative_seconds}
+                for function, (calls, total_seconds, cumulative_seconds) in top_functions[:PROFILE_TOP_FUNCTIONS]]
+        return {'started_at': self.started_at.isoformat(),
+                'wall_seconds': time.perf_counter() - self._start_wall,
+                'cpu_seconds': time.process_time() - self._start_cpu,
+                'peak_rss_bytes': peak_rss_bytes(),
+                'capture': self.capture,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'metadata': metadata,
+                'stages': stages}
+
+    def write(self, path, **metadata):
+        """
+        Writes the run report as JSON.
+
+        :param path: str
+        :param metadata: see to_dict
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(**metadata), f, indent=2, default=str)
+        module_logger.info(f"Run report written to {path}")
+
+
+def active_report():
+    """
+    :return: RunReport stages are currently recorded in, or None
+    """
+    return _active_report
+
+
+@contextmanager
+def recording(report):
+    """
+    Records the stages run in the context into report.
+
+    :param report: RunReport
+    :return: RunReport
+    """
+    global _active_report
+    previous_report, _active_report = _active_report, report
+    try:
+        yield report
+    finally:
+        _active_report = previous_report
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a stage of the run and records its wall time, CPU time, rows and peak RSS in the active report. Rows are
+    recorded by setting rows_in/rows_out of the yielded StageRows. Does nothing (beyond yielding) when no report is
+    being recorded, and can be used as a decorator as well.
+
+    :param name: str
+    :return: StageRows
+    """
+    report = _active_report
+    rows = StageRows()
+    if report is None:
+        yield rows
+        return
+
+    frame = report.start_capture(name)
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield rows
+    finally:
+        wall_seconds = time.perf_counter() - start_wall
+        cpu_seconds = time.process_time() - start_cpu
+        traced_peak_bytes = report.stop_capture(frame)
+        report.add(name, calls=rows.calls, wall_seconds=wall_seconds, cpu_seconds=cpu_seconds, rows_in=rows.rows_in,
+                   rows_out=rows.rows_out, peak_rss_bytes=peak_rss_bytes(), traced_peak_bytes=traced_peak_bytes)
+
+
+def timed_iter(name, iterable):
+    """
+    Records the time spent producing each item of iterable as a stage, with the length of the item as rows out. The
+    time spent finding the iterable exhausted is recorded as well, but not as a call.
+
+    :param name: str
+    :param iterable: Iterable of sized items, e.g. DataFrame chunks
+    :return: Iterator
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name) as rows:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                rows.calls = 0
+                return
+            rows.rows_out = len(item)
+        yield item
+
+
+def call_recorded(capture, function, *args, **kwargs):
+    """
+    Calls function while recording its stages in a new report, so stages run in a worker process can be added to
+    the report of the parent process.
+
+    :param capture: str, see RunReport
+    :param function: Callable
+    :return: Tuple(result of function, RunReport.summary)
+    """
+    with recording(RunReport(capture=capture)) as report:
+        result = function(*args, **kwargs)
+    return result, report.summary()
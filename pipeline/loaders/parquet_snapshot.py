@@ -0,0 +1,61 @@
+import logging
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+
+module_logger = logging.getLogger(__name__)
+
+SNAPSHOT_PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('country', pa.string())]), flavor='hive')
+
+DICTIONARY_COLUMNS = ['cause', 'country']
+
+
+def write_snapshot(mortality_df, snapshot_dir):
+    """
+    Writes processed mortality rates to a Parquet dataset partitioned by year and country, with the cause and country
+    columns dictionary-encoded. Partitions present in mortality_df replace existing ones, other partitions are kept.
+
+    :param mortality_df: Processed ICD10 mortality rates DataFrame
+    :param snapshot_dir: str
+    :return: int, rows written
+    """
+    module_logger.info(f"Writing snapshot of {len(mortality_df)} rows to {snapshot_dir}...")
+    table = pa.Table.from_pandas(mortality_df, preserve_index=False)
+    table = table.set_column(table.schema.get_field_index('year'), 'year', pc.cast(table['year'], pa.int16()))
+    for column in DICTIONARY_COLUMNS:
+        table = table.set_column(table.schema.get_field_index(column), column, pc.dictionary_encode(table[column]))
+
+    ds.write_dataset(table, snapshot_dir, format='parquet', partitioning=SNAPSHOT_PARTITIONING,
+                     existing_data_behavior='delete_matching')
+    return table.num_rows
+
+
+def _field_filter(name, value):
+    if isinstance(value, (list, tuple, set)):
+        return ds.field(name).isin(list(value))
+    return ds.field(name) == value
+
+
+def read_snapshot(snapshot_dir, columns=None, country=None, year=None, cause=None):
+    """
+    Reads processed mortality rates from a snapshot written by write_snapshot, without a database.
+
+    Filters on country and year only open the matching partitions, and only the requested columns are read.
+
+    :param snapshot_dir: str
+    :param columns: List[str], None for all columns
+    :param country: str or List[str], None for all countries
+    :param year: int or List[int], None for all years
+    :param cause: str or List[str], None for all causes
+    :return: DataFrame
+    """
+    dataset = ds.dataset(snapshot_dir, format='parquet', partitioning=SNAPSHOT_PARTITIONING)
+
+    filter_expression = None
+    for name, value in [('country', country), ('year', year), ('cause', cause)]:
+        if value is not None:
+            field_filter = _field_filter(name, value)
+            filter_expression = field_filter if filter_expression is None else filter_expression & field_filter
+
+    return dataset.to_table(columns=columns, filter=filter_expression).to_pandas()
@@ -0,0 +1,177 @@
+import io
+import time
+import logging
+from sqlalchemy import text
+
+
+module_logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100000
+
+
+def dataframe_to_csv_buffer(df):
+    """
+    Writes a DataFrame to an in-memory csv buffer (without header or index) in the format expected by COPY.
+
+    Missing values are written as empty unquoted fields, which COPY reads as NULL.
+
+    :param df: DataFrame
+    :return: StringIO positioned at the start of the csv
+    """
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    return buffer
+
+
+def to_array_literals(block):
+    """
+    Formats each row of a 2D integer array as a PostgreSQL array literal, so it can be copied into an int[] column.
+
+    :param block: 2D ndarray of ints
+    :return: List[str], e.g. ['{1,0,3}', ...]
+    """
+    return ['{' + ','.join(map(str, row)) + '}' for row in block.tolist()]
+
+
+def copy_batches(connection, cursor, df, table, batch_size, commit_batches):
+    """
+    Streams a DataFrame into a table through COPY FROM STDIN, batch_size rows at a time.
+
+    :param connection: DBAPI connection
+    :param cursor: psycopg2 cursor of connection
+    :param df: DataFrame with columns matching the table column names
+    :param table: str
+    :param batch_size: int
+    :param commit_batches: bool, commit after each batch if True
+    """
+    copy_sql = f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)"
+    for batch_start in range(0, len(df), batch_size):
+        batch_df = df.iloc[batch_start:batch_start + batch_size]
+        cursor.copy_expert(copy_sql, dataframe_to_csv_buffer(batch_df))
+        if commit_batches:
+            connection.commit()
+            module_logger.debug(f"Committed batch of {len(batch_df)} rows into {table}")
+
+
+def copy_dataframe(df, table, engine, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Bulk loads a DataFrame into a PostgreSQL table by streaming it through COPY FROM STDIN.
+
+    Rows are sent in batches of batch_size, each batch is committed on its own so a failure only rolls back the
+    batch being loaded. The DataFrame columns must match the table column names.
+
+    :param df: DataFrame
+    :param table: str
+    :param engine: SQLAlchemy engine connected to a PostgreSQL database
+    :param batch_size: int
+    :return: {'rows': int, 'seconds': float, 'rows_per_second': float} dict
+    """
+    module_logger.info(f"Copying {len(df)} rows into {table} in batches of {batch_size}...")
+
+    start_time = time.perf_counter()
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        try:
+            copy_batches(connection, cursor, df, table, batch_size, commit_batches=True)
+        finally:
+            cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    seconds = time.perf_counter() - start_time
+
+    rows_per_second = len(df) / seconds if seconds > 0 else float('inf')
+    module_logger.info(f"Copied {len(df)} rows into {table} in {seconds:.2f}s ({rows_per_second:.0f} rows/sec)")
+    return {'rows': len(df), 'seconds': seconds, 'rows_per_second': rows_per_second}
+
+
+def upsert_sql(table, stage_table, columns, key_columns):
+    """
+    Builds an INSERT ... ON CONFLICT DO UPDATE statement moving rows from stage_table into table. Rows whose non key
+    values are unchanged are skipped, and the statement returns the number of inserted and updated rows.
+
+    :param table: str
+    :param stage_table: str
+    :param columns: List[str]
+    :param key_columns: List[str]
+    :return: str
+    """
+    value_columns = [column for column in columns if column not in key_columns]
+    column_list = ', '.join(columns)
+    if value_columns:
+        conflict_action = (
+            f"DO UPDATE SET {', '.join(f'{column} = EXCLUDED.{column}' for column in value_columns)} "
+            f"WHERE ({', '.join(f'target.{column}' for column in value_columns)}) IS DISTINCT FROM "
+            f"({', '.join(f'EXCLUDED.{column}' for column in value_columns)})")
+    else:
+        conflict_action = "DO NOTHING"
+
+    # xmax is only set on rows that already existed, which separates updates from inserts
+    return (f"WITH upserted AS ("
+            f"INSERT INTO {table} AS target ({column_list}) "
+            f"SELECT {column_list} FROM {stage_table} "
+            f"ON CONFLICT ({', '.join(key_columns)}) {conflict_action} "
+            f"RETURNING (xmax = 0) AS inserted) "
+            f"SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted")
+
+
+def upsert_dataframe(df, table, engine, key_columns, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Incrementally loads a DataFrame into a PostgreSQL table keyed on key_columns, so the same data can be loaded again
+    without failing on duplicates.
+
+    The data is copied into a temporary (unlogged) staging table and merged into table with
+    INSERT ... ON CONFLICT DO UPDATE in a single transaction. Rows whose values are unchanged are left untouched.
+
+    :param df: DataFrame with columns matching the table column names
+    :param table: str
+    :param engine: SQLAlchemy engine connected to a PostgreSQL database
+    :param key_columns: List[str], columns of the table's primary key
+    :param batch_size: int
+    :return: {'inserted': int, 'updated': int, 'unchanged': int, 'seconds': float} dict
+    """
+    stage_table = f"{table}_stage"
+    module_logger.info(f"Upserting {len(df)} rows into {table}...")
+
+    start_time = time.perf_counter()
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"CREATE TEMP TABLE {stage_table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+            copy_batches(connection, cursor, df, stage_table, batch_size, commit_batches=False)
+            cursor.execute(upsert_sql(table, stage_table, list(df.columns), key_columns))
+            inserted, updated = cursor.fetchone()
+        finally:
+            cursor.close()
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    seconds = time.perf_counter() - start_time
+
+    stats = {'inserted': inserted, 'updated': updated, 'unchanged': len(df) - inserted - updated, 'seconds': seconds}
+    module_logger.info(f"Upserted {len(df)} rows into {table} in {seconds:.2f}s: {stats['inserted']} inserted, "
+                       f"{stats['updated']} updated, {stats['unchanged']} unchanged")
+    return stats
+
+
+def bump_load_generation(engine):
+    """
+    Increments the load generation after a successful load, which invalidates cached query results
+    (see pipeline.query.result_cache).
+
+    :param engine: SQLAlchemy engine connected to the who database
+    :return: int, the new load generation
+    """
+    with engine.begin() as conn:
+        generation = conn.execute(text("UPDATE load_generation SET generation = generation + 1, loaded_at = now() "
+                                       "RETURNING generation")).scalar_one()
+    module_logger.info(f"Load generation is now {generation}")
+    return generation
@@ -0,0 +1,38 @@
+import time
+import logging
+from sqlalchemy import text
+
+
+module_logger = logging.getLogger(__name__)
+
+# Materialized views defined in postgres/postgres_setup.sql, each has a unique index so it can be refreshed concurrently
+ROLLUP_VIEWS = ['deaths_by_country_year',
+                'deaths_by_country_cause',
+                'deaths_by_year_cause',
+                'top_causes_by_country_year']
+
+
+def refresh_rollups(engine, base_table='mortality_facts', views=ROLLUP_VIEWS):
+    """
+    Refreshes the rollup materialized views after a load, so common query shapes are answered by index lookups
+    instead of aggregating the whole base table.
+
+    Views are refreshed concurrently, so readers keep seeing the previous rollups while they are rebuilt. The base
+    table is analyzed first, so the planner knows about the newly loaded rows.
+
+    :param engine: SQLAlchemy engine connected to the who database
+    :param base_table: str
+    :param views: List[str]
+    :return: {view: seconds} dict
+    """
+    timings = {}
+    with engine.begin() as conn:
+        conn.execute(text(f"ANALYZE {base_table}"))
+    for view in views:
+        module_logger.info(f"Refreshing {view}...")
+        start_time = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+        timings[view] = time.perf_counter() - start_time
+        module_logger.debug(f"Refreshed {view} in {timings[view]:.2f}s")
+    return timings
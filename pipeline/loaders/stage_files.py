@@ -0,0 +1,49 @@
+import os
+import json
+import logging
+import pandas as pd
+
+
+module_logger = logging.getLogger(__name__)
+
+# Lists the tables of a stage directory with their primary key columns, written last so a directory of an interrupted
+# write is never read as complete
+MANIFEST_FILE = 'tables.json'
+
+
+def write_stage_tables(tables, stage_dir):
+    """
+    Writes the tables passed from one pipeline stage to the next into a directory, one Parquet file per table, so the
+    next stage can be run on its own. Tables of a previous write are replaced.
+
+    :param tables: {table: (DataFrame, primary key columns)} dict
+    :param stage_dir: str
+    """
+    os.makedirs(stage_dir, exist_ok=True)
+    manifest_path = os.path.join(stage_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    for table, (df, _) in tables.items():
+        path = os.path.join(stage_dir, f'{table}.parquet')
+        module_logger.info(f"Writing {len(df)} rows of {table} to {path}...")
+        df.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump({table: list(key_columns) for table, (_, key_columns) in tables.items()}, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def read_stage_tables(stage_dir):
+    """
+    Reads the tables written by write_stage_tables.
+
+    :param stage_dir: str
+    :return: {table: (DataFrame, primary key columns)} dict, in the order they were written
+    """
+    manifest_path = os.path.join(stage_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"No complete stage tables in {stage_dir}, {MANIFEST_FILE} is missing")
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    return {table: (pd.read_parquet(os.path.join(stage_dir, f'{table}.parquet')), key_columns)
+            for table, key_columns in manifest.items()}
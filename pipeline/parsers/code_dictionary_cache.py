@@ -0,0 +1,146 @@
+import os
+import pickle
+import hashlib
+import logging
+import tempfile
+from definitions import AVAILABILITY_PATH, CODE_DICTIONARY_CACHE_DIR
+from pipeline.parsers import coverage_index
+from pipeline.parsers import icd_10_code_parsers
+
+
+module_logger = logging.getLogger(__name__)
+
+# Bump whenever the structure of the cached dictionaries changes, so stale artifacts are ignored
+CODE_DICTIONARY_CACHE_VERSION = 5
+
+# Artifacts compiled in this process, keyed by the stat signature of their sources
+_code_dictionaries_memo = {}
+
+
+def source_paths():
+    """
+    Paths of the code table csvs the dictionaries are built from.
+
+    :return: List[str]
+    """
+    return [icd_10_code_parsers.ICD_10_CAUSE_CODES_PATH,
+            icd_10_code_parsers.ICD_10_PORTUGAL_CAUSE_CODES_PATH,
+            icd_10_code_parsers.COUNTRY_CODES_PATH]
+
+
+def coverage_source_paths():
+    """
+    Paths of the country codes and the availability file the coverage index is built from.
+
+    :return: List[str]
+    """
+    return [icd_10_code_parsers.COUNTRY_CODES_PATH, AVAILABILITY_PATH]
+
+
+def source_digest(paths):
+    """
+    Hashes the content of the source csvs together with the cache version.
+
+    :param paths: List[str]
+    :return: str, hex digest
+    """
+    digest = hashlib.sha256(f"v{CODE_DICTIONARY_CACHE_VERSION}".encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def build_code_dictionaries():
+    """
+    Builds all code dictionaries from the source csvs. The 3 character codes are kept as a CodeRangeIndex.
+
+    :return: {dictionary name: {code: value} dict or CodeRangeIndex} dict
+    """
+    return {'country': icd_10_code_parsers.get_country_codes_dict(),
+            'condensed': icd_10_code_parsers.get_condensed_cause_code_dict(),
+            '3_char': icd_10_code_parsers.get_3_char_cause_code_index(),
+            'portugal': icd_10_code_parsers.get_portugal_condensed_cause_code_dict(),
+            'aggregate_causes': icd_10_code_parsers.get_aggregate_causes()}
+
+
+def build_coverage_index(cache_dir=CODE_DICTIONARY_CACHE_DIR):
+    """
+    Builds the coverage index of the availability file, see coverage_index.build_coverage_index.
+
+    :param cache_dir: str, directory holding the compiled artifacts
+    :return: CoverageIndex
+    """
+    return coverage_index.build_coverage_index(get_code_dictionaries(cache_dir)['country'], AVAILABILITY_PATH)
+
+
+def write_artifact(code_dictionaries, artifact_path):
+    """
+    Atomically writes the code dictionaries to artifact_path, so concurrent workers never read a partial artifact.
+
+    :param code_dictionaries: dict
+    :param artifact_path: str
+    """
+    os.makedirs(os.path.dirname(artifact_path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(artifact_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(code_dictionaries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, artifact_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def get_artifact(name, paths, build, cache_dir):
+    """
+    Returns a compiled artifact, building it from its sources only when they have changed.
+
+    Artifacts are memoized in-process and stored on disk as a pickle named after a hash of their sources, so each
+    process pays at most the cost of unpickling the artifact. A change to any of the sources gives a new hash and the
+    artifact is rebuilt.
+
+    :param name: str, name of the artifact
+    :param paths: List[str], source paths
+    :param build: Callable[[], artifact]
+    :param cache_dir: str, directory holding the compiled artifacts
+    :return: artifact, shared between callers and must not be modified
+    """
+    signature = (name, cache_dir) + tuple((path, os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths)
+    if signature in _code_dictionaries_memo:
+        return _code_dictionaries_memo[signature]
+
+    artifact_path = os.path.join(cache_dir, f"{name}-v{CODE_DICTIONARY_CACHE_VERSION}-{source_digest(paths)}.pickle")
+    try:
+        with open(artifact_path, 'rb') as f:
+            artifact = pickle.load(f)
+        module_logger.debug(f"Loaded {name} from {artifact_path}")
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        module_logger.info(f"Compiling {name}...")
+        artifact = build()
+        write_artifact(artifact, artifact_path)
+        module_logger.debug(f"Saved {name} to {artifact_path}")
+
+    _code_dictionaries_memo[signature] = artifact
+    return artifact
+
+
+def get_code_dictionaries(cache_dir=CODE_DICTIONARY_CACHE_DIR):
+    """
+    Returns the compiled code dictionaries, see get_artifact.
+
+    :param cache_dir: str, directory holding the compiled artifacts
+    :return: dictionaries as returned by build_code_dictionaries, shared between callers and must not be modified
+    """
+    return get_artifact('code_dictionaries', source_paths(), lambda: build_code_dictionaries(), cache_dir)
+
+
+def get_coverage_index(cache_dir=CODE_DICTIONARY_CACHE_DIR):
+    """
+    Returns the compiled coverage index of the availability file, see get_artifact. It is only built when asked for,
+    so reading the code dictionaries doesn't need the availability file (or xlrd to parse it).
+
+    :param cache_dir: str, directory holding the compiled artifacts
+    :return: CoverageIndex, shared between callers and must not be modified
+    """
+    return get_artifact('coverage_index', coverage_source_paths(), lambda: build_coverage_index(cache_dir), cache_dir)
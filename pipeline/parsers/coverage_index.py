@@ -0,0 +1,195 @@
+import logging
+import numpy as np
+import pandas as pd
+from definitions import AVAILABILITY_PATH
+
+
+module_logger = logging.getLogger(__name__)
+
+AVAILABILITY_SHEET = 'avail_mortality'
+
+# Coverage of each (country, year) is a bitmask with a bit per list, so it holds at most this many lists
+MAX_LISTS = 32
+
+
+def read_availability(availability_path=AVAILABILITY_PATH):
+    """
+    Reads the country-years and lists WHO has mortality data of from the availability file. Rows of subnational areas
+    (Admin1, SubDiv) count towards their country.
+
+    :param availability_path: str, xls file
+    :return: DataFrame with country_id, year and list columns, one row per distinct combination
+    """
+    sheet = pd.read_excel(availability_path, sheet_name=AVAILABILITY_SHEET, header=None, dtype=str)
+    # The table starts below a few lines of notes
+    header_row = sheet.index[sheet[0].str.strip() == 'Country'][0]
+    availability_df = sheet.iloc[header_row + 1:].set_axis(sheet.loc[header_row].str.strip(), axis=1)
+    availability_df = availability_df.dropna(subset=['Country', 'Year', 'List'])
+    return pd.DataFrame({'country_id': availability_df['Country'].astype(int),
+                         'year': availability_df['Year'].astype(int),
+                         'list': availability_df['List'].str.strip()}).drop_duplicates(ignore_index=True)
+
+
+class CoverageIndex:
+    """
+    Bitmap of the (country, year, list) combinations WHO has mortality data of, see read_availability.
+
+    Each (country, year) has a uint32 mask with the bits of its lists set. Country ids are mapped to their row with a
+    lookup array and years to their column by offset, so membership checks of single keys and whole columns of keys
+    are a few array lookups.
+    """
+
+    def __init__(self, country_ids, years, lists, masks, country_names=None):
+        """
+        :param country_ids: List[int], country id of each row of masks
+        :param years: List[int], consecutive years of the columns of masks
+        :param lists: List[str], list of each bit
+        :param masks: uint32 ndarray of shape (countries, years)
+        :param country_names: {country id: country name} dict, to look up countries by name
+        """
+        if len(lists) > MAX_LISTS:
+            raise ValueError(f"{len(lists)} lists don't fit the {MAX_LISTS} bits of a mask")
+        if masks.shape != (len(country_ids), len(years)):
+            raise ValueError(f"Masks of shape {masks.shape} don't match the countries and years")
+        self.country_ids = list(country_ids)
+        self.years = list(years)
+        self.lists = list(lists)
+        self.masks = masks
+        self._first_year = self.years[0] if self.years else 0
+        self._rows = np.full(max(self.country_ids, default=0) + 1, -1, dtype=np.int32)
+        self._rows[self.country_ids] = np.arange(len(self.country_ids))
+        self._list_bits = {list_name: 1 << bit for bit, list_name in enumerate(self.lists)}
+        self._country_ids_by_name = {name: country_id for country_id, name in (country_names or {}).items()}
+
+    @classmethod
+    def from_availability(cls, availability_df, country_names=None):
+        """
+        :param availability_df: DataFrame as returned by read_availability
+        :param country_names: {country id: country name} dict, see CoverageIndex
+        :return: CoverageIndex
+        """
+        country_ids = np.unique(availability_df['country_id'].to_numpy())
+        if len(availability_df):
+            years = np.arange(availability_df['year'].min(), availability_df['year'].max() + 1)
+        else:
+            years = np.array([], dtype=np.int64)
+        lists = sorted(availability_df['list'].unique())
+
+        masks = np.zeros((len(country_ids), len(years)), dtype=np.uint32)
+        list_bits = np.searchsorted(lists, availability_df['list'].to_numpy()).astype(np.uint32)
+        bits = np.left_shift(np.uint32(1), list_bits)
+        np.bitwise_or.at(masks, (np.searchsorted(country_ids, availability_df['country_id'].to_numpy()),
+                                 availability_df['year'].to_numpy() - (years[0] if len(years) else 0)), bits)
+        return cls(country_ids.tolist(), years.tolist(), lists, masks, country_names)
+
+    def country_id(self, country):
+        """
+        :param country: str, country name
+        :return: int, or None for names unknown to the code tables
+        """
+        return self._country_ids_by_name.get(country)
+
+    def get_masks(self, country_ids, years):
+        """
+        Vectorized lookup of the masks of (country, year) keys.
+
+        :param country_ids: array-like of int
+        :param years: array-like of int
+        :return: uint32 ndarray, 0 for keys the availability file has no data of
+        """
+        country_ids = np.asarray(country_ids, dtype=np.int64)
+        columns = np.asarray(years, dtype=np.int64) - self._first_year
+        in_range = (country_ids >= 0) & (country_ids < len(self._rows)) & (columns >= 0) & (columns < len(self.years))
+        rows = np.where(in_range, self._rows[np.where(in_range, country_ids, 0)], -1)
+        found = rows >= 0
+        masks = np.zeros(len(rows), dtype=np.uint32)
+        masks[found] = self.masks[rows[found], columns[found]]
+        return masks
+
+    def list_bits(self, lists):
+        """
+        :param lists: array-like of list names
+        :return: uint32 ndarray of the bit of each list, 0 for lists the availability file doesn't have
+        """
+        list_codes, list_names = pd.factorize(pd.Series(lists))
+        name_bits = np.array([self._list_bits.get(name, 0) for name in list_names] + [0], dtype=np.uint32)
+        return name_bits[list_codes]
+
+    def covers(self, country_id, year, list_name=None):
+        """
+        :param country_id: int
+        :param year: int
+        :param list_name: str, None for any list
+        :return: bool, whether WHO has data of the country and year (in the list)
+        """
+        column = year - self._first_year
+        if not 0 <= country_id < len(self._rows) or not 0 <= column < len(self.years):
+            return False
+        row = self._rows[country_id]
+        if row < 0:
+            return False
+        mask = int(self.masks[row, column])
+        return mask != 0 if list_name is None else bool(mask & self._list_bits.get(list_name, 0))
+
+    def covers_country(self, country_id):
+        """
+        :param country_id: int
+        :return: bool, whether WHO has data of the country in any year
+        """
+        return 0 <= country_id < len(self._rows) and self._rows[country_id] >= 0
+
+    def has_data(self, country, year=None):
+        """
+        Whether a question about a country (and year) may have an answer, for answering questions without data without
+        querying the database. Only country-years the availability file records without any list are ruled out, any
+        other question (countries missing from the file, years outside of it) has to be asked.
+
+        :param country: str, country name
+        :param year: int, None for any year
+        :return: bool
+        """
+        country_id = self.country_id(country)
+        if country_id is None or year is None or not self.covers_country(country_id):
+            return True
+        if not 0 <= year - self._first_year < len(self.years):
+            return True
+        return self.covers(country_id, year)
+
+    def get_lists(self, country_id, year):
+        """
+        :param country_id: int
+        :param year: int
+        :return: List[str], lists WHO has data of the country and year in
+        """
+        mask = int(self.get_masks([country_id], [year])[0])
+        return [list_name for list_name, bit in self._list_bits.items() if mask & bit]
+
+    def __eq__(self, other):
+        if not isinstance(other, CoverageIndex):
+            return NotImplemented
+        return (self.country_ids == other.country_ids and self.years == other.years and self.lists == other.lists
+                and np.array_equal(self.masks, other.masks)
+                and self._country_ids_by_name == other._country_ids_by_name)
+
+    def contradicted(self, country_ids, years, lists):
+        """
+        Rows whose country and year the availability file records with other lists only. Country-years it has no data
+        of at all are never contradicted, they may have been added after the file was published.
+
+        :param country_ids: array-like of int
+        :param years: array-like of int
+        :param lists: array-like of list names
+        :return: bool ndarray
+        """
+        masks = self.get_masks(country_ids, years)
+        return (masks != 0) & ((masks & self.list_bits(lists)) == 0)
+
+
+def build_coverage_index(country_names, availability_path=AVAILABILITY_PATH):
+    """
+    :param country_names: {country id: country name} dict of the code tables
+    :param availability_path: str
+    :return: CoverageIndex
+    """
+    module_logger.debug("Building coverage index from the availability file.")
+    return CoverageIndex.from_availability(read_availability(availability_path), country_names)
@@ -1,8 +1,10 @@
 import csv
 import re
+import numpy as np
 import pandas as pd
 import logging
 from definitions import ICD_10_CAUSE_CODES_PATH, ICD_10_PORTUGAL_CAUSE_CODES_PATH, COUNTRY_CODES_PATH
+from pipeline.parsers.icd_10_code_range_index import CodeRangeIndex, encode_code
 
 
 module_logger = logging.getLogger(__name__)
@@ -114,16 +116,70 @@ def detailed_code_str_to_list(detailed_list_numbers_str):
     return codes
 
 
-def get_3_char_cause_code_dict():
+def code_range_str_to_interval(cause_code_range_str):
     """
-    Creates a dictionary of code-cause key-value pairs using the 3 character code formats contained in the ICD10 cause
-    code table.
+    Converts a code string range to an interval of encoded codes (see icd_10_code_range_index.encode_code).
+
+    Example:
+    input = 'A98-B03'
+    output = (6598, 6603)
+
+    Example:
+    input = 'A99'
+    output = (6599, 6599)
+
+    :param cause_code_range_str: str
+    :return: Tuple(int, int)
+    """
+
+    # If single code, return as single code interval
+    if cause_code_split_regex.match(cause_code_range_str):
+        code = encode_code(*extract_char_numeral_pair(cause_code_range_str))
+        return code, code
+
+    if ranged_cause_code_validity_regex.match(cause_code_range_str) is None:
+        raise ValueError(f"{cause_code_range_str} is not of the required format.")
+
+    start_code, end_code = cause_code_range_str.split('-')
+    start = encode_code(*extract_char_numeral_pair(start_code))
+    end = encode_code(*extract_char_numeral_pair(end_code))
+
+    # Check if range string is backwards, i.e. 'B01-A99'
+    if end < start:
+        raise ValueError(f"{cause_code_range_str} range is backwards.")
+
+    return start, end
+
+
+def detailed_code_str_to_intervals(detailed_list_numbers_str):
+    """
+    Converts a code string (including jumps in ranges) to a list of encoded code intervals.
+
+    Example:
+    input = 'A98-B03, B06-B07'
+    output = [(6598, 6603), (6606, 6607)]
+
+    :param detailed_list_numbers_str: str
+    :return: List[Tuple(int, int)]
+    """
+
+    if type(detailed_list_numbers_str) is not str:
+        raise TypeError(f"{detailed_list_numbers_str} is not of type str")
+
+    return [code_range_str_to_interval(code_range_str)
+            for code_range_str in detailed_list_numbers_str.replace(' ', '').split(',')]
+
+
+def get_3_char_cause_code_index():
+    """
+    Creates an interval index resolving codes to causes using the 3 character code formats contained in the ICD10 cause
+    code table. Code ranges are stored as intervals rather than expanded into every code they contain.
 
     See Table 8 for further details - https://www.who.int/healthinfo/statistics/documentation
 
-    :return: {code: cause} dict
+    :return: CodeRangeIndex
     """
-    module_logger.debug("Getting ICD10 3 character code format cause codes.")
+    module_logger.debug("Getting ICD10 3 character code format cause code index.")
 
     cause_codes_df = pd.read_csv(ICD_10_CAUSE_CODES_PATH, dtype={'code': int,
                                                                  'Detailed List Numbers': str,
@@ -131,15 +187,28 @@ def get_3_char_cause_code_dict():
         columns={'Detailed List Numbers': 'detailed_codes',
                  'Cause': 'cause'})
 
-    cause_codes_df['detailed_codes'] = cause_codes_df[cause_codes_df['detailed_codes'].notna()]['detailed_codes'].apply(
-        detailed_code_str_to_list)
-
-    detailed_code_cause_dict = {}
+    ranges = []
     for row in cause_codes_df[cause_codes_df['detailed_codes'].notna()].itertuples():
-        for code in row.detailed_codes:
-            detailed_code_cause_dict[code] = row.cause
+        for start, end in detailed_code_str_to_intervals(row.detailed_codes):
+            ranges.append((start, end, row.cause))
+
+    return CodeRangeIndex.from_ranges(ranges)
+
+
+def get_3_char_cause_code_dict():
+    """
+    Creates a dictionary of code-cause key-value pairs using the 3 character code formats contained in the ICD10 cause
+    code table.
+
+    Prefer get_3_char_cause_code_index, which resolves codes without materializing every code in each range.
+
+    See Table 8 for further details - https://www.who.int/healthinfo/statistics/documentation
 
-    return detailed_code_cause_dict
+    :return: {code: cause} dict
+    """
+    module_logger.debug("Getting ICD10 3 character code format cause codes.")
+
+    return get_3_char_cause_code_index().to_dict()
 
 
 def get_condensed_cause_code_dict():
@@ -182,6 +251,50 @@ def get_portugal_condensed_cause_code_dict():
     return cc_dict
 
 
+def get_list_aggregate_causes(cause_codes_path):
+    """
+    Splits the causes of a condensed cause code table into aggregates, which total other causes of the table, and
+    causes of their own. Causes without codes ('All causes') and causes whose code ranges contain the ranges of another
+    cause are aggregates.
+
+    :param cause_codes_path: str, csv of code, detailed codes and cause columns
+    :return: Tuple(set of aggregate cause names, set of other cause names)
+    """
+    cause_codes_df = pd.read_csv(cause_codes_path, dtype=str)
+    causes = [(cause, detailed_code_str_to_intervals(detailed_codes) if isinstance(detailed_codes, str) else None)
+              for detailed_codes, cause in zip(cause_codes_df.iloc[:, 1], cause_codes_df.iloc[:, 2])]
+
+    def contains(intervals, other_intervals):
+        return other_intervals != intervals and all(any(start <= other_start and other_end <= end
+                                                        for start, end in intervals)
+                                                    for other_start, other_end in other_intervals)
+
+    aggregates = {cause for cause, intervals in causes
+                  if intervals is None or any(other_intervals is not None and contains(intervals, other_intervals)
+                                              for _, other_intervals in causes)}
+    return aggregates, {cause for cause, _ in causes} - aggregates
+
+
+def get_aggregate_causes():
+    """
+    Finds the causes of the condensed lists (101 and UE1) which total other causes, i.e. 'All causes' and chapters.
+    Countries reporting in these lists report the aggregates next to the causes they total, so ranking or summing
+    them together counts deaths more than once.
+
+    Causes which are an aggregate in one list but a cause of their own in the other (e.g. 'Chronic lower respiratory
+    diseases') are not aggregates, since they mostly come from list 101.
+
+    See Tables 8 and 10 for further details - https://www.who.int/healthinfo/statistics/documentation
+
+    :return: frozenset of cause names
+    """
+    module_logger.debug("Getting aggregate causes of the condensed cause code lists.")
+
+    condensed_aggregates, condensed_causes = get_list_aggregate_causes(ICD_10_CAUSE_CODES_PATH)
+    portugal_aggregates, portugal_causes = get_list_aggregate_causes(ICD_10_PORTUGAL_CAUSE_CODES_PATH)
+    return frozenset((condensed_aggregates | portugal_aggregates) - condensed_causes - portugal_causes)
+
+
 def get_country_codes_dict():
     """
     Creates a dictionary of code-country key-value pairs using the country codes csv.
@@ -200,3 +313,63 @@ def get_country_codes_dict():
             country_codes_dict[int(row[0])] = row[1]
 
     return country_codes_dict
+
+
+def build_cause_code_lookup(condensed_cause_code_dict, portugal_cause_code_dict):
+    """
+    Combines the cause code dictionaries of the condensed ICD10 lists into a single (list, code) -> cause lookup.
+
+    Lists 103, 104 and 10M are not included, their codes are resolved through the ranges of
+    get_3_char_cause_code_index instead.
+
+    :param condensed_cause_code_dict: {code: cause} dict for list 101
+    :param portugal_cause_code_dict: {code: cause} dict for list UE1
+    :return: Series of causes indexed by a (list, code) MultiIndex
+    """
+    lookups = {'101': condensed_cause_code_dict,
+               'UE1': portugal_cause_code_dict}
+    return pd.Series([cause for lookup in lookups.values() for cause in lookup.values()],
+                     index=pd.MultiIndex.from_tuples([(list_name, code)
+                                                      for list_name, lookup in lookups.items()
+                                                      for code in lookup],
+                                                     names=['list', 'code']),
+                     dtype=object)
+
+
+def build_cause_dimension(condensed_cause_code_dict, cause_code_index, portugal_cause_code_dict):
+    """
+    Numbers every cause of the ICD10 code tables, giving the surrogate keys of the cause dimension table.
+
+    Causes are sorted by name and numbered from 1, so ids only change when the code tables change (which requires a
+    full reload of the mortality facts).
+
+    :param condensed_cause_code_dict: {code: cause} dict for list 101
+    :param cause_code_index: CodeRangeIndex as returned by get_3_char_cause_code_index
+    :param portugal_cause_code_dict: {code: cause} dict for list UE1
+    :return: Series of causes indexed by cause_id
+    """
+    causes = sorted(set(condensed_cause_code_dict.values()) | set(cause_code_index.causes)
+                    | set(portugal_cause_code_dict.values()))
+    return pd.Series(causes, index=pd.RangeIndex(1, len(causes) + 1, name='cause_id'), name='cause', dtype=object)
+
+
+def get_cause_ids(cause_dimension, causes):
+    """
+    :param cause_dimension: Series as returned by build_cause_dimension
+    :param causes: array-like of cause names
+    :return: ndarray of int32 cause ids, -1 for causes not in the dimension
+    """
+    positions = pd.Index(cause_dimension).get_indexer(causes)
+    return np.where(positions >= 0, cause_dimension.index.to_numpy()[positions], -1).astype(np.int32)
+
+
+def build_cause_id_lookup(cause_code_lookup, cause_dimension):
+    """
+    Maps the causes of a (list, code) -> cause lookup to their ids in the cause dimension, so codes resolve straight to
+    cause ids.
+
+    :param cause_code_lookup: lookup as returned by build_cause_code_lookup
+    :param cause_dimension: Series as returned by build_cause_dimension
+    :return: Series of int32 cause ids indexed by a (list, code) MultiIndex
+    """
+    return pd.Series(get_cause_ids(cause_dimension, cause_code_lookup), index=cause_code_lookup.index)
@@ -0,0 +1,158 @@
+import numpy as np
+
+
+def encode_code(char, num):
+    """
+    Encodes a code of the format [char][num][num] as a single integer, so ranges of codes become integer intervals.
+
+    Example:
+    input = ('B', '01')
+    output = 6601
+
+    :param char: str
+    :param num: str or int
+    :return: int
+    """
+    return ord(char) * 100 + int(num)
+
+
+def decode_code(encoded_code):
+    """
+    Inverse of encode_code.
+
+    Example:
+    input = 6601
+    output = 'B01'
+
+    :param encoded_code: int
+    :return: str
+    """
+    return chr(encoded_code // 100) + str(encoded_code % 100).zfill(2)
+
+
+def encode_codes(codes):
+    """
+    Vectorized encode_code over the first 3 characters of each code, so 3 character, 4 character and 10M codes are all
+    encoded by their 3 character category. Codes not starting with [A-Z][0-9][0-9] are encoded as -1.
+
+    :param codes: array-like of str
+    :return: ndarray of int64
+    """
+    # Fixed width unicode truncates each code to 3 characters, which can then be viewed as code points
+    chars = np.asarray(codes, dtype=object).astype('U3').view(np.uint32).reshape(-1, 3).astype(np.int64)
+    char, tens, units = chars[:, 0], chars[:, 1] - ord('0'), chars[:, 2] - ord('0')
+    valid = (char >= ord('A')) & (char <= ord('Z')) & (tens >= 0) & (tens <= 9) & (units >= 0) & (units <= 9)
+    return np.where(valid, char * 100 + tens * 10 + units, -1)
+
+
+class CodeRangeIndex:
+    """
+    Interval index mapping ICD10 codes to causes without materializing every code in each range.
+
+    Ranges are stored as sorted, non overlapping [start, end] intervals of encoded codes (see encode_code), so a code
+    is resolved with a binary search over the interval starts.
+    """
+
+    def __init__(self, starts, ends, cause_ids, causes):
+        """
+        :param starts: sorted ndarray of interval start codes
+        :param ends: ndarray of (inclusive) interval end codes
+        :param cause_ids: ndarray of indexes into causes for each interval
+        :param causes: ndarray of cause names
+        """
+        self.starts = starts
+        self.ends = ends
+        self.cause_ids = cause_ids
+        self.causes = causes
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """
+        Builds the index from possibly overlapping ranges. Where ranges overlap the cause of the later range is used,
+        matching a dict built by assigning each range's codes in order.
+
+        :param ranges: List[Tuple(int, int, str)] of (start, inclusive end, cause) encoded code ranges
+        :return: CodeRangeIndex
+        """
+        causes, range_cause_ids = np.unique(np.array([cause for _, _, cause in ranges], dtype=object),
+                                            return_inverse=True)
+        range_starts = np.array([start for start, _, _ in ranges], dtype=np.int64)
+        range_ends = np.array([end for _, end, _ in ranges], dtype=np.int64)
+
+        # Split the code space into elementary segments at every range boundary and let later ranges overwrite
+        # the segments they cover
+        boundaries = np.unique(np.concatenate([range_starts, range_ends + 1]))
+        segment_cause_ids = np.full(max(len(boundaries) - 1, 0), -1, dtype=np.int64)
+        for start, end, cause_id in zip(range_starts, range_ends, range_cause_ids):
+            segment_cause_ids[np.searchsorted(boundaries, start):np.searchsorted(boundaries, end + 1)] = cause_id
+
+        # Drop uncovered segments and merge adjacent segments with the same cause
+        segment_starts, segment_ends = boundaries[:-1], boundaries[1:] - 1
+        covered = segment_cause_ids >= 0
+        segment_starts, segment_ends = segment_starts[covered], segment_ends[covered]
+        segment_cause_ids = segment_cause_ids[covered]
+        merged = np.ones(len(segment_starts), dtype=bool)
+        merged[1:] = (segment_cause_ids[1:] != segment_cause_ids[:-1]) | (segment_starts[1:] != segment_ends[:-1] + 1)
+        run_starts = np.flatnonzero(merged)
+        run_ends = np.append(run_starts[1:], len(segment_starts)) - 1
+
+        return cls(segment_starts[run_starts], segment_ends[run_ends], segment_cause_ids[run_starts], causes)
+
+    def get_cause_ids(self, codes):
+        """
+        Resolves codes to the indexes of their causes in self.causes in O(log n) per code, vectorized over a whole
+        column.
+
+        :param codes: array-like of 3 character, 4 character or 10M codes
+        :return: ndarray of int64 indexes into causes, -1 for codes not covered by any range
+        """
+        encoded_codes = encode_codes(codes)
+        interval_ids = np.searchsorted(self.starts, encoded_codes, side='right') - 1
+        found = (interval_ids >= 0) & (encoded_codes >= 0)
+        found[found] = encoded_codes[found] <= self.ends[interval_ids[found]]
+
+        cause_ids = np.full(len(encoded_codes), -1, dtype=np.int64)
+        cause_ids[found] = self.cause_ids[interval_ids[found]]
+        return cause_ids
+
+    def get_causes(self, codes):
+        """
+        Resolves codes to causes, see get_cause_ids.
+
+        :param codes: array-like of 3 character, 4 character or 10M codes
+        :return: ndarray of cause names, NaN for codes not covered by any range
+        """
+        cause_ids = self.get_cause_ids(codes)
+        found = cause_ids >= 0
+        resolved_causes = np.full(len(cause_ids), np.nan, dtype=object)
+        resolved_causes[found] = self.causes[cause_ids[found]]
+        return resolved_causes
+
+    def get_cause(self, code):
+        """
+        Resolves a single code to its cause.
+
+        :param code: str
+        :return: str, None if the code is not covered by any range
+        """
+        cause = self.get_causes([code])[0]
+        return cause if isinstance(cause, str) else None
+
+    def to_dict(self):
+        """
+        Materializes every code covered by the index, for backward compatibility with code-cause dictionaries.
+
+        :return: {code: cause} dict
+        """
+        return {decode_code(encoded_code): self.causes[cause_id]
+                for start, end, cause_id in zip(self.starts, self.ends, self.cause_ids)
+                for encoded_code in range(start, end + 1)}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __eq__(self, other):
+        if not isinstance(other, CodeRangeIndex):
+            return NotImplemented
+        return (np.array_equal(self.starts, other.starts) and np.array_equal(self.ends, other.ends)
+                and np.array_equal(self.causes[self.cause_ids], other.causes[other.cause_ids]))
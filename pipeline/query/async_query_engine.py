@@ -0,0 +1,129 @@
+import time
+import logging
+from collections import defaultdict, deque
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from definitions import DATABASE_URL
+from pipeline.query.query_engine import (DEFAULT_MAX_OVERFLOW, DEFAULT_POOL_RECYCLE_SECONDS, DEFAULT_POOL_SIZE,
+                                         DEFAULT_STREAM_BATCH_SIZE, LATENCY_WINDOW, named_param_regex,
+                                         summarize_latencies)
+
+
+module_logger = logging.getLogger(__name__)
+
+# asyncio drivers used for the synchronous drivers of a database URL
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def to_async_url(url):
+    """
+    Replaces the driver of a database URL with its asyncio driver.
+
+    Example:
+    input = 'postgresql://postgres@localhost:37780/who'
+    output = 'postgresql+asyncpg://postgres@localhost:37780/who'
+
+    :param url: str, SQLAlchemy database URL
+    :return: str
+    """
+    scheme, rest = url.split('://', 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+def to_typed_sql(query):
+    """
+    Casts every :name parameter of a query to its type, since asyncpg sends parameters untyped and PostgreSQL can't
+    infer the type of a parameter only compared to NULL.
+
+    :param query: Query
+    :return: str
+    """
+    param_types = dict(query.param_types)
+    return named_param_regex.sub(lambda match: f"CAST({match.group(0)} AS {param_types[match.group(1)]})", query.sql)
+
+
+class AsyncQueryEngine:
+    """
+    asyncio counterpart of QueryEngine, running queries over a pooled async engine and recording the latency of every
+    call.
+
+    On PostgreSQL queries run through asyncpg, which prepares each statement once per pooled connection and reuses it
+    on later calls.
+    """
+
+    def __init__(self, engine, coverage=None):
+        """
+        :param engine: SQLAlchemy AsyncEngine, see create_pooled_async_engine
+        :param coverage: CoverageIndex, see QueryEngine
+        """
+        self.engine = engine
+        self.coverage = coverage
+        self.use_typed_params = engine.dialect.name == 'postgresql'
+        self.latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def _sql(self, query):
+        return text(to_typed_sql(query) if self.use_typed_params else query.sql)
+
+    async def execute(self, query, params):
+        """
+        Runs a query and returns all result rows.
+
+        :param query: Query
+        :param params: {param name: value} dict
+        :return: List[Row]
+        """
+        start_time = time.perf_counter()
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(self._sql(query), params)).fetchall()
+        self._record_latency(query.name, start_time)
+        return rows
+
+    async def stream(self, query, params, batch_size=DEFAULT_STREAM_BATCH_SIZE):
+        """
+        Runs a query through a streaming (server-side) cursor, yielding batches of at most batch_size rows as they are
+        fetched.
+
+        :param query: Query
+        :param params: {param name: value} dict
+        :param batch_size: int
+        :return: AsyncIterator[List[Row]]
+        """
+        start_time = time.perf_counter()
+        async with self.engine.connect() as conn:
+            result = await conn.stream(self._sql(query), params)
+            async for partition in result.partitions(batch_size):
+                yield partition
+        self._record_latency(query.name, start_time)
+
+    def _record_latency(self, query_name, start_time):
+        latency = time.perf_counter() - start_time
+        self.latencies[query_name].append(latency)
+        module_logger.debug(f"{query_name} took {latency * 1000:.2f}ms")
+
+    def latency_stats(self):
+        """
+        :return: see QueryEngine.latency_stats
+        """
+        return summarize_latencies(self.latencies)
+
+    async def dispose(self):
+        await self.engine.dispose()
+
+
+def create_pooled_async_engine(url=DATABASE_URL, pool_size=DEFAULT_POOL_SIZE, max_overflow=DEFAULT_MAX_OVERFLOW,
+                               pool_recycle=DEFAULT_POOL_RECYCLE_SECONDS):
+    """
+    Creates an async engine with a connection pool shared by all queries, see query_engine.create_pooled_engine.
+
+    :param url: str, SQLAlchemy database URL, its driver is replaced by the asyncio driver
+    :param pool_size: int
+    :param max_overflow: int
+    :param pool_recycle: int
+    :return: SQLAlchemy AsyncEngine
+    """
+    url = to_async_url(url)
+    if url.startswith('sqlite'):
+        # SQLite stand-ins have no server to pool connections to
+        return create_async_engine(url)
+    return create_async_engine(url, pool_size=pool_size, max_overflow=max_overflow, pool_recycle=pool_recycle,
+                               pool_pre_ping=True)
@@ -0,0 +1,172 @@
+import logging
+from collections import defaultdict
+from functools import lru_cache
+from typing import Callable, NamedTuple, Tuple
+from pipeline.query.mortality_queries import TOTAL_CAUSES_SQL, CauseDeaths, SexDeaths, YearDeaths, no_coverage
+from pipeline.query.query_engine import Query
+
+
+module_logger = logging.getLogger(__name__)
+
+# Distinct questions answered per statement. Statements are padded to a power of two rows, so each shape has only a
+# handful of statement sizes for PostgreSQL to prepare on every pooled connection
+DEFAULT_BATCH_SIZE = 512
+
+
+class BatchShape(NamedTuple):
+    """
+    SQL answering every question of a shape at once. It joins against a params relation holding a row per question:
+    its position idx followed by the params columns, each with its PostgreSQL type. Result rows start with idx.
+    """
+    name: str
+    params: Tuple[Tuple[str, str], ...]
+    sql: str
+
+
+TOP_CAUSES_BATCH = BatchShape(
+    'top_causes',
+    (('country', 'text'), ('year', 'smallint'), ('n', 'int')),
+    "SELECT params.idx, t.cause, t.deaths FROM params JOIN top_causes_by_country_year t "
+    "ON t.country = params.country AND t.year = params.year AND t.rank <= params.n ORDER BY params.idx, t.rank")
+
+# See mortality_queries.TOTAL_CAUSES for the totals over all causes
+DEATHS_BY_SEX_BATCH = BatchShape(
+    'deaths_by_sex',
+    (('country', 'text'), ('year', 'smallint'), ('cause', 'text')),
+    f"SELECT params.idx, m.sex, coalesce(sum(CASE WHEN m.cause IN {TOTAL_CAUSES_SQL} THEN m.deaths END), "
+    "sum(m.deaths)) "
+    "FROM params JOIN mortality_rates m ON m.country = params.country AND m.year = params.year "
+    "AND (params.cause IS NULL OR m.cause = params.cause) GROUP BY params.idx, m.sex ORDER BY params.idx, m.sex")
+
+CAUSE_TIME_SERIES_BATCH = BatchShape(
+    'cause_time_series',
+    (('cause', 'text'), ('country', 'text')),
+    "SELECT params.idx, m.year, sum(m.deaths) FROM params JOIN mortality_rates m "
+    "ON m.cause = params.cause AND (params.country IS NULL OR m.country = params.country) "
+    "GROUP BY params.idx, m.year ORDER BY params.idx, m.year")
+
+
+class QuestionType(NamedTuple):
+    """
+    A question answered by a batch shape, with the defaults of its optional parameters and the function turning the
+    result rows of a question (without idx) and its parameters into the answer.
+    """
+    shape: BatchShape
+    defaults: dict
+    to_answer: Callable
+
+
+def _top_causes_answer(rows, params):
+    return [CauseDeaths(cause, int(deaths)) for cause, deaths in rows]
+
+
+def _deaths_by_sex_answer(rows, params):
+    return [SexDeaths(sex, int(deaths)) for sex, deaths in rows]
+
+
+def _deaths_answer(rows, params):
+    return sum(int(deaths) for sex, deaths in rows if params['sex'] in (None, sex))
+
+
+def _cause_time_series_answer(rows, params):
+    return [YearDeaths(year, int(deaths)) for year, deaths in rows]
+
+
+# Named after the mortality_queries functions, whose answers they return. deaths shares the statement of
+# deaths_by_sex and picks its sex afterwards
+QUESTION_TYPES = {
+    'top_causes': QuestionType(TOP_CAUSES_BATCH, {'n': 10}, _top_causes_answer),
+    'deaths_by_sex': QuestionType(DEATHS_BY_SEX_BATCH, {'cause': None}, _deaths_by_sex_answer),
+    'deaths': QuestionType(DEATHS_BY_SEX_BATCH, {'sex': None, 'cause': None}, _deaths_answer),
+    'cause_time_series': QuestionType(CAUSE_TIME_SERIES_BATCH, {'country': None}, _cause_time_series_answer),
+}
+
+
+@lru_cache(maxsize=None)
+def to_batch_query(shape, n_rows):
+    """
+    Builds the statement of a shape over a VALUES list of n_rows questions, parameters of each row are suffixed with
+    its row number.
+
+    Example:
+    input = CAUSE_TIME_SERIES_BATCH, 2
+    output = Query('batch_cause_time_series_2',
+                   'WITH params (idx, cause, country) AS (VALUES (:idx_0, :cause_0, :country_0), '
+                   '(:idx_1, :cause_1, :country_1)) SELECT params.idx, ...',
+                   (('idx_0', 'int'), ('cause_0', 'text'), ('country_0', 'text'), ('idx_1', 'int'), ...))
+
+    :param shape: BatchShape
+    :param n_rows: int
+    :return: Query
+    """
+    columns = (('idx', 'int'),) + shape.params
+    values = ', '.join(f"({', '.join(f':{name}_{row}' for name, _ in columns)})" for row in range(n_rows))
+    return Query(f'batch_{shape.name}_{n_rows}',
+                 f"WITH params ({', '.join(name for name, _ in columns)}) AS (VALUES {values}) {shape.sql}",
+                 tuple((f'{name}_{row}', param_type) for row in range(n_rows) for name, param_type in columns))
+
+
+def answer_shape(query_engine, shape, param_rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Runs the statement of a shape over distinct parameter rows, in batches of at most batch_size rows.
+
+    :param query_engine: QueryEngine
+    :param shape: BatchShape
+    :param param_rows: List of tuples of values of the shape params
+    :param batch_size: int
+    :return: List[List[tuple]], result rows (without idx) of each parameter row
+    """
+    results = [[] for _ in param_rows]
+    padding = (None,) * (len(shape.params) + 1)
+    for start in range(0, len(param_rows), batch_size):
+        batch = param_rows[start:start + batch_size]
+        # Padding rows of NULLs join no rows
+        n_rows = min(batch_size, 1 << (len(batch) - 1).bit_length())
+        query = to_batch_query(shape, n_rows)
+        values = [value for position, row in enumerate(batch, start=start) for value in (position,) + row]
+        values += padding * (n_rows - len(batch))
+        for idx, *row in query_engine.execute(query, dict(zip((name for name, _ in query.param_types), values))):
+            results[idx].append(tuple(row))
+    return results
+
+
+def ask_many(query_engine, questions, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Answers many questions with a single set-based statement per question shape instead of a round trip per question,
+    e.g. the deaths of every country and year of a chart. Identical questions are only asked once, and questions the
+    coverage index of the query engine rules out aren't asked at all.
+
+    Example:
+    input = [('top_causes', {'country': 'Algeria', 'year': 2008, 'n': 1}),
+             ('deaths', {'country': 'France', 'year': 2008})]
+    output = [[CauseDeaths('Tetanus', 25)], 3]
+
+    :param query_engine: QueryEngine
+    :param questions: Iterable of (question type, {param name: value} dict) pairs. Question types and their params are
+        those of the mortality_queries functions: top_causes, deaths_by_sex, deaths and cause_time_series
+    :param batch_size: int, distinct questions per statement
+    :return: List of answers in the order of the questions, each as returned by the mortality_queries function
+    """
+    param_rows = defaultdict(dict)
+    asked = []
+    for question_name, params in questions:
+        question_type = QUESTION_TYPES.get(question_name)
+        if question_type is None:
+            raise ValueError(f"Unknown question type {question_name}, expected one of {', '.join(QUESTION_TYPES)}")
+        params = {**question_type.defaults, **params}
+        unknown_params = set(params) - set(question_type.defaults) - {name for name, _ in question_type.shape.params}
+        missing_params = [name for name, _ in question_type.shape.params if name not in params]
+        if unknown_params or missing_params:
+            raise ValueError(f"Question {question_name} with unknown parameters {sorted(unknown_params)} "
+                             f"or missing parameters {missing_params}")
+        if no_coverage(query_engine, params['country'], params.get('year')):
+            asked.append((question_type, params, None))
+            continue
+        shape_rows = param_rows[question_type.shape]
+        row = tuple(params[name] for name, _ in question_type.shape.params)
+        asked.append((question_type, params, shape_rows.setdefault(row, len(shape_rows))))
+
+    results = {shape: answer_shape(query_engine, shape, list(rows), batch_size) for shape, rows in param_rows.items()}
+    module_logger.debug(f"Answered {len(asked)} questions with {len(results)} question shapes")
+    return [question_type.to_answer([] if position is None else results[question_type.shape][position], params)
+            for question_type, params, position in asked]
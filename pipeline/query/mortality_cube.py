@@ -0,0 +1,207 @@
+import os
+import json
+import logging
+import numpy as np
+from definitions import CUBE_DIR
+from pipeline.query.mortality_queries import TOTAL_CAUSES, CauseDeaths, SexDeaths, YearDeaths
+
+
+module_logger = logging.getLogger(__name__)
+
+DEATHS_FILE = 'deaths.npy'
+AXES_FILE = 'axes.json'
+
+SEXES = ['f', 'm', 'u']
+
+
+class MortalityCube:
+    """
+    Deaths of the processed mortality rates as a dense int32 cube indexed by (country, year, cause, sex), answering
+    totals, top causes and time series with vectorized reductions instead of database round trips.
+
+    The country axis holds the countries present in the data, the year axis every year between the first and last
+    one, and the cause axis every cause of the cause dimension in order of their ids, so cells of keys without data
+    are 0. Saved cubes are opened as a read only memory map, so processes opening the same cube share its pages
+    through the page cache instead of each holding a copy.
+    """
+
+    def __init__(self, cube, country_ids, countries, years, cause_ids, causes, aggregate_causes=()):
+        """
+        :param cube: int32 ndarray (or memmap) of deaths of shape (countries, years, causes, sexes)
+        :param country_ids: List[int], country id of each country position
+        :param countries: List[str], country name of each country position
+        :param years: List[int], year of each year position, consecutive years
+        :param cause_ids: List[int], cause id of each cause position
+        :param causes: List[str], cause name of each cause position
+        :param aggregate_causes: Iterable[str], causes totalling other causes, see
+            icd_10_code_parsers.get_aggregate_causes
+        """
+        if cube.shape != (len(countries), len(years), len(causes), len(SEXES)):
+            raise ValueError(f"Cube of shape {cube.shape} doesn't match its axes")
+        self.cube = cube
+        self.country_ids = list(country_ids)
+        self.countries = list(countries)
+        self.years = list(years)
+        self.cause_ids = list(cause_ids)
+        self.causes = list(causes)
+        self._country_positions = {country: position for position, country in enumerate(self.countries)}
+        self._cause_positions = {cause: position for position, cause in enumerate(self.causes)}
+        self.aggregate_causes = [cause for cause in self.causes if cause in set(aggregate_causes)]
+        self._aggregate_positions = [self._cause_positions[cause] for cause in self.aggregate_causes]
+        self._total_positions = [self._cause_positions[cause] for cause in TOTAL_CAUSES
+                                 if cause in self._cause_positions]
+
+    @classmethod
+    def from_facts(cls, mortality_df, country_names, cause_names, aggregate_causes=()):
+        """
+        Builds the cube from processed mortality rates.
+
+        :param mortality_df: DataFrame with the columns of icd10_mortality_rates_processor.AGGREGATION_KEYS and deaths
+        :param country_names: {country id: country name} dict
+        :param cause_names: Series of cause names indexed by cause id, see icd_10_code_parsers.build_cause_dimension
+        :param aggregate_causes: Iterable[str], see MortalityCube
+        :return: MortalityCube
+        """
+        country_ids = np.unique(mortality_df['country_id'].to_numpy())
+        if len(mortality_df):
+            years = np.arange(mortality_df['year'].min(), mortality_df['year'].max() + 1)
+        else:
+            years = np.array([], dtype=np.int64)
+        cause_ids = cause_names.index.to_numpy()
+
+        sex_positions = mortality_df['sex'].map({sex: position for position, sex in enumerate(SEXES)}).to_numpy()
+        cell_ids = np.ravel_multi_index(
+            (np.searchsorted(country_ids, mortality_df['country_id'].to_numpy()),
+             mortality_df['year'].to_numpy(dtype=np.int64) - (years[0] if len(years) else 0),
+             np.searchsorted(cause_ids, mortality_df['cause_id'].to_numpy()),
+             sex_positions.astype(np.int64)),
+            (len(country_ids), len(years), len(cause_ids), len(SEXES)))
+        shape = (len(country_ids), len(years), len(cause_ids), len(SEXES))
+        # bincount sums in float64, which holds death counts exactly
+        deaths = np.bincount(cell_ids, weights=mortality_df['deaths'].to_numpy(dtype=np.float64),
+                             minlength=int(np.prod(shape))).astype(np.int32).reshape(shape)
+
+        return cls(deaths, country_ids.tolist(), [country_names[country_id] for country_id in country_ids],
+                   years.tolist(), cause_ids.tolist(), cause_names.tolist(), aggregate_causes)
+
+    @classmethod
+    def open(cls, cube_dir=CUBE_DIR):
+        """
+        Opens a saved cube as a read only memory map, without reading the deaths into memory.
+
+        :param cube_dir: str
+        :return: MortalityCube
+        """
+        with open(os.path.join(cube_dir, AXES_FILE)) as f:
+            axes = json.load(f)
+        return cls(np.load(os.path.join(cube_dir, DEATHS_FILE), mmap_mode='r'), axes['country_id'], axes['country'],
+                   axes['year'], axes['cause_id'], axes['cause'], axes.get('aggregate_cause', []))
+
+    def save(self, cube_dir=CUBE_DIR):
+        """
+        Saves the cube as an .npy file with its axes in a JSON file next to it. Both files are replaced atomically,
+        processes which already opened the previous cube keep reading it.
+
+        :param cube_dir: str
+        """
+        os.makedirs(cube_dir, exist_ok=True)
+        deaths_path, axes_path = os.path.join(cube_dir, DEATHS_FILE), os.path.join(cube_dir, AXES_FILE)
+        with open(deaths_path + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.cube, dtype=np.int32))
+        with open(axes_path + '.tmp', 'w') as f:
+            json.dump({'country_id': self.country_ids, 'country': self.countries, 'year': self.years,
+                       'cause_id': self.cause_ids, 'cause': self.causes, 'aggregate_cause': self.aggregate_causes,
+                       'sex': SEXES}, f)
+        os.replace(deaths_path + '.tmp', deaths_path)
+        os.replace(axes_path + '.tmp', axes_path)
+        module_logger.info(f"Mortality cube of shape {self.cube.shape} saved to {cube_dir}")
+
+    def country_year(self, country, year):
+        """
+        :param country: str
+        :param year: int
+        :return: int64 ndarray of deaths (causes x sexes) of a country and year, zeros if there is no data
+        """
+        country_position = self._country_positions.get(country)
+        year_position = year - self.years[0] if self.years else -1
+        if country_position is None or not 0 <= year_position < len(self.years):
+            return np.zeros((len(self.causes), len(SEXES)), dtype=np.int64)
+        return self.cube[country_position, year_position].astype(np.int64)
+
+    def _all_causes_total(self, deaths_by_cause):
+        """
+        Totals over all causes, using the total cause deaths where reported (see mortality_queries.TOTAL_CAUSES).
+
+        :param deaths_by_cause: ndarray of deaths with causes on the first axis
+        :return: ndarray of totals
+        """
+        reported_totals = deaths_by_cause[self._total_positions].sum(axis=0)
+        return np.where(reported_totals > 0, reported_totals, deaths_by_cause.sum(axis=0))
+
+    def deaths_by_sex(self, country, year, cause=None):
+        """
+        Deaths in a country and year split by sex, see mortality_queries.deaths_by_sex. Sexes without deaths are left
+        out.
+
+        :param country: str
+        :param year: int
+        :param cause: str, None for all causes
+        :return: List[SexDeaths]
+        """
+        deaths = self.country_year(country, year)
+        if cause is None:
+            sex_deaths = self._all_causes_total(deaths)
+        elif cause in self._cause_positions:
+            sex_deaths = deaths[self._cause_positions[cause]]
+        else:
+            sex_deaths = np.zeros(len(SEXES), dtype=np.int64)
+        return [SexDeaths(sex, int(sex_total)) for sex, sex_total in zip(SEXES, sex_deaths) if sex_total > 0]
+
+    def deaths(self, country, year, sex=None, cause=None):
+        """
+        Deaths in a country and year, optionally for a single sex and/or cause.
+
+        :param country: str
+        :param year: int
+        :param sex: str, 'm', 'f' or 'u', None for all
+        :param cause: str, None for all causes
+        :return: int
+        """
+        return sum(row.deaths for row in self.deaths_by_sex(country, year, cause) if sex in (None, row.sex))
+
+    def top_causes(self, country, year, n=10):
+        """
+        Most common causes of death in a country and year, see mortality_queries.top_causes. Total and aggregate causes
+        are left out like in the top_causes_by_country_year rollup of postgres_setup.sql. Ties are ordered by cause id
+        (which follows cause names).
+
+        :param country: str
+        :param year: int
+        :param n: int
+        :return: List[CauseDeaths], most common first
+        """
+        cause_deaths = self.country_year(country, year).sum(axis=1)
+        if cause_deaths[self._total_positions].any():
+            cause_deaths[self._aggregate_positions] = 0
+        cause_deaths[self._total_positions] = 0
+        positions = np.flatnonzero(cause_deaths)
+        order = positions[np.argsort(-cause_deaths[positions], kind='stable')]
+        return [CauseDeaths(self.causes[position], int(cause_deaths[position])) for position in order[:n]]
+
+    def cause_time_series(self, cause, country=None):
+        """
+        Deaths from a cause for each year with deaths, in a single country or over all countries.
+
+        :param cause: str
+        :param country: str, None for all countries
+        :return: List[YearDeaths], ordered by year
+        """
+        cause_position = self._cause_positions.get(cause)
+        if cause_position is None or (country is not None and country not in self._country_positions):
+            return []
+        if country is None:
+            year_deaths = self.cube[:, :, cause_position].sum(axis=(0, 2), dtype=np.int64)
+        else:
+            year_deaths = self.cube[self._country_positions[country], :, cause_position].sum(axis=1, dtype=np.int64)
+        return [YearDeaths(self.years[position], int(year_deaths[position]))
+                for position in np.flatnonzero(year_deaths)]
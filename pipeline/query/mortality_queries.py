@@ -0,0 +1,150 @@
+from typing import NamedTuple
+from pipeline.query.query_engine import Query
+
+
+# Causes totalling all other causes. Countries reporting with list 101 ('All causes') or UE1 ('ALL CAUSES OF DEATH')
+# have such a total next to overlapping chapter and sub-chapter causes, so totals over all causes use it where present
+# and only sum the causes otherwise
+TOTAL_CAUSES = ('All causes', 'ALL CAUSES OF DEATH')
+# SQL list of TOTAL_CAUSES, for "cause IN ..." conditions
+TOTAL_CAUSES_SQL = '(' + ', '.join(f"'{cause}'" for cause in TOTAL_CAUSES) + ')'
+
+
+class CauseDeaths(NamedTuple):
+    cause: str
+    deaths: int
+
+
+class SexDeaths(NamedTuple):
+    sex: str
+    deaths: int
+
+
+class YearDeaths(NamedTuple):
+    year: int
+    deaths: int
+
+
+class MortalityRate(NamedTuple):
+    country: str
+    year: int
+    cause: str
+    sex: str
+    deaths: int
+
+
+TOP_CAUSES = Query(
+    'top_causes',
+    "SELECT cause, deaths FROM top_causes_by_country_year "
+    "WHERE country = :country AND year = :year AND rank <= :n ORDER BY rank",
+    (('country', 'text'), ('year', 'smallint'), ('n', 'int')))
+
+# See TOTAL_CAUSES for the totals over all causes
+DEATHS_BY_SEX = Query(
+    'deaths_by_sex',
+    f"SELECT sex, coalesce(sum(CASE WHEN cause IN {TOTAL_CAUSES_SQL} THEN deaths END), sum(deaths)) AS deaths "
+    "FROM mortality_rates "
+    "WHERE country = :country AND year = :year AND (:cause IS NULL OR cause = :cause) GROUP BY sex ORDER BY sex",
+    (('country', 'text'), ('year', 'smallint'), ('cause', 'text')))
+
+CAUSE_TIME_SERIES = Query(
+    'cause_time_series',
+    "SELECT year, sum(deaths) AS deaths FROM mortality_rates "
+    "WHERE cause = :cause AND (:country IS NULL OR country = :country) GROUP BY year ORDER BY year",
+    (('cause', 'text'), ('country', 'text')))
+
+MORTALITY_RATES = Query(
+    'mortality_rates',
+    "SELECT country, year, cause, sex, deaths FROM mortality_rates "
+    "WHERE (:country IS NULL OR country = :country) AND (:year IS NULL OR year = :year) "
+    "ORDER BY country, year, cause, sex",
+    (('country', 'text'), ('year', 'smallint')))
+
+
+def no_coverage(query_engine, country, year=None):
+    """
+    Whether the coverage index of a query engine rules out any data of a country (and year), so the question can be
+    answered without querying the database. See CoverageIndex.has_data for which questions it rules out.
+
+    :param query_engine: QueryEngine or AsyncQueryEngine
+    :param country: str, None for all countries
+    :param year: int, None for any year
+    :return: bool, False without a coverage index
+    """
+    coverage = query_engine.coverage
+    return coverage is not None and country is not None and not coverage.has_data(country, year)
+
+
+def top_causes(query_engine, country, year, n=10):
+    """
+    Most common causes of death in a country and year, e.g. "what was the most common cause of death in Algeria in
+    2008". Answered from the top_causes_by_country_year rollup, which holds the top ten causes.
+
+    :param query_engine: QueryEngine
+    :param country: str
+    :param year: int
+    :param n: int, at most 10
+    :return: List[CauseDeaths], most common first
+    """
+    if no_coverage(query_engine, country, year):
+        return []
+    return [CauseDeaths(*row) for row in query_engine.execute(TOP_CAUSES, {'country': country, 'year': year, 'n': n})]
+
+
+def deaths_by_sex(query_engine, country, year, cause=None):
+    """
+    Deaths in a country and year split by sex.
+
+    :param query_engine: QueryEngine
+    :param country: str
+    :param year: int
+    :param cause: str, None for all causes
+    :return: List[SexDeaths]
+    """
+    if no_coverage(query_engine, country, year):
+        return []
+    return [SexDeaths(sex, int(deaths))
+            for sex, deaths in query_engine.execute(DEATHS_BY_SEX, {'country': country, 'year': year, 'cause': cause})]
+
+
+def deaths(query_engine, country, year, sex=None, cause=None):
+    """
+    Deaths in a country and year, optionally for a single sex and/or cause.
+
+    :param query_engine: QueryEngine
+    :param country: str
+    :param year: int
+    :param sex: str, 'm', 'f' or 'u', None for all
+    :param cause: str, None for all causes
+    :return: int
+    """
+    return sum(row.deaths for row in deaths_by_sex(query_engine, country, year, cause) if sex in (None, row.sex))
+
+
+def cause_time_series(query_engine, cause, country=None):
+    """
+    Deaths from a cause for each year, in a single country or over all countries.
+
+    :param query_engine: QueryEngine
+    :param cause: str
+    :param country: str, None for all countries
+    :return: List[YearDeaths], ordered by year
+    """
+    if no_coverage(query_engine, country):
+        return []
+    return [YearDeaths(year, int(deaths))
+            for year, deaths in query_engine.execute(CAUSE_TIME_SERIES, {'cause': cause, 'country': country})]
+
+
+def iter_mortality_rates(query_engine, country=None, year=None, batch_size=10000):
+    """
+    Streams the mortality rates rows of a country and/or year without loading the whole result into memory.
+
+    :param query_engine: QueryEngine
+    :param country: str, None for all countries
+    :param year: int, None for all years
+    :param batch_size: int, rows fetched per round trip
+    :return: Iterator[MortalityRate]
+    """
+    for row in query_engine.stream(MORTALITY_RATES, {'country': country, 'year': year}, batch_size=batch_size):
+        yield MortalityRate(*row)
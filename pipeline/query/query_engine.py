@@ -0,0 +1,164 @@
+import re
+import time
+import logging
+from collections import defaultdict, deque
+from typing import NamedTuple, Tuple
+import numpy as np
+from sqlalchemy import create_engine, text
+from definitions import DATABASE_URL
+
+
+module_logger = logging.getLogger(__name__)
+
+# Sized for a handful of concurrent analysts per process, overflow connections are closed again once returned
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_RECYCLE_SECONDS = 1800
+
+# Number of most recent latencies kept per query
+LATENCY_WINDOW = 1000
+
+DEFAULT_STREAM_BATCH_SIZE = 10000
+
+named_param_regex = re.compile(r"(?<!:):([a-z_][a-z0-9_]*)\b")
+
+
+class Query(NamedTuple):
+    """
+    A named SQL query with :name style parameters and the PostgreSQL type of each parameter, in the order used for
+    the server-side prepared statement.
+    """
+    name: str
+    sql: str
+    param_types: Tuple[Tuple[str, str], ...]
+
+
+def create_pooled_engine(url=DATABASE_URL, pool_size=DEFAULT_POOL_SIZE, max_overflow=DEFAULT_MAX_OVERFLOW,
+                         pool_recycle=DEFAULT_POOL_RECYCLE_SECONDS):
+    """
+    Creates an engine with a connection pool shared by all queries, so connections are reused across calls instead of
+    being opened per query.
+
+    :param url: str, SQLAlchemy database URL
+    :param pool_size: int, connections kept open in the pool
+    :param max_overflow: int, extra connections opened under load
+    :param pool_recycle: int, seconds after which a connection is replaced
+    :return: SQLAlchemy engine
+    """
+    return create_engine(url, pool_size=pool_size, max_overflow=max_overflow, pool_recycle=pool_recycle,
+                         pool_pre_ping=True)
+
+
+def to_prepared_statement(query):
+    """
+    Builds the PREPARE statement and the EXECUTE template of a query, replacing :name parameters with the $n
+    positional parameters PostgreSQL expects.
+
+    Example:
+    input = Query('deaths', 'SELECT ... WHERE country = :country AND year = :year',
+                  (('country', 'text'), ('year', 'smallint')))
+    output = ('PREPARE deaths (text, smallint) AS SELECT ... WHERE country = $1 AND year = $2',
+              'EXECUTE deaths (:country, :year)')
+
+    :param query: Query
+    :return: Tuple(str, str)
+    """
+    positions = {name: position for position, (name, _) in enumerate(query.param_types, start=1)}
+    prepare_sql = (f"PREPARE {query.name} ({', '.join(param_type for _, param_type in query.param_types)}) AS "
+                   f"{named_param_regex.sub(lambda match: f'${positions[match.group(1)]}', query.sql)}")
+    execute_sql = f"EXECUTE {query.name} ({', '.join(f':{name}' for name in positions)})"
+    return prepare_sql, execute_sql
+
+
+class QueryEngine:
+    """
+    Runs queries over a pooled engine, recording the latency of every call.
+
+    On PostgreSQL queries are run as server-side prepared statements. Each pooled connection prepares a query the
+    first time it runs it and keeps track of what it has prepared, so later calls skip parsing and planning. Other
+    databases (e.g. a SQLite stand-in) run the plain SQL.
+    """
+
+    def __init__(self, engine, coverage=None):
+        """
+        :param engine: SQLAlchemy engine, see create_pooled_engine
+        :param coverage: CoverageIndex, questions about country-years it rules out are answered without a query (see
+            mortality_queries.no_coverage). None to always query
+        """
+        self.engine = engine
+        self.coverage = coverage
+        self.use_prepared_statements = engine.dialect.name == 'postgresql'
+        self.latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def _execute(self, conn, query, params):
+        if not self.use_prepared_statements:
+            return conn.execute(text(query.sql), params)
+
+        prepare_sql, execute_sql = to_prepared_statement(query)
+        prepared = conn.info.setdefault('prepared_statements', set())
+        if query.name not in prepared:
+            conn.exec_driver_sql(prepare_sql)
+            prepared.add(query.name)
+        return conn.execute(text(execute_sql), params)
+
+    def execute(self, query, params):
+        """
+        Runs a query and returns all result rows.
+
+        :param query: Query
+        :param params: {param name: value} dict
+        :return: List[Row]
+        """
+        start_time = time.perf_counter()
+        with self.engine.connect() as conn:
+            rows = self._execute(conn, query, params).fetchall()
+        self._record_latency(query.name, start_time)
+        return rows
+
+    def stream(self, query, params, batch_size=DEFAULT_STREAM_BATCH_SIZE):
+        """
+        Runs a query through a streaming (server-side) cursor, yielding rows as they are fetched in batches of
+        batch_size, so large results are never held in memory at once.
+
+        Streaming cursors can't be declared over a prepared statement, so the plain SQL is run.
+
+        :param query: Query
+        :param params: {param name: value} dict
+        :param batch_size: int
+        :return: Iterator[Row]
+        """
+        start_time = time.perf_counter()
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(text(query.sql),
+                                                                                              params)
+            for partition in result.partitions():
+                yield from partition
+        self._record_latency(query.name, start_time)
+
+    def _record_latency(self, query_name, start_time):
+        latency = time.perf_counter() - start_time
+        self.latencies[query_name].append(latency)
+        module_logger.debug(f"{query_name} took {latency * 1000:.2f}ms")
+
+    def latency_stats(self):
+        """
+        Summarises the most recent latencies of each query.
+
+        :return: {query name: {'count': int, 'p50_ms': float, 'p99_ms': float, 'max_ms': float}} dict
+        """
+        return summarize_latencies(self.latencies)
+
+
+def summarize_latencies(latencies):
+    """
+    :param latencies: {query name: sequence of latencies in seconds} dict
+    :return: {query name: {'count': int, 'p50_ms': float, 'p99_ms': float, 'max_ms': float}} dict
+    """
+    stats = {}
+    for query_name, query_latencies in latencies.items():
+        latencies_ms = np.array(query_latencies) * 1000
+        stats[query_name] = {'count': len(latencies_ms),
+                             'p50_ms': float(np.percentile(latencies_ms, 50)),
+                             'p99_ms': float(np.percentile(latencies_ms, 99)),
+                             'max_ms': float(latencies_ms.max())}
+    return stats
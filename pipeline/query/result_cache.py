@@ -0,0 +1,211 @@
+import time
+import pickle
+import sqlite3
+import inspect
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from pipeline.query.query_engine import Query
+
+
+module_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_GENERATION_CHECK_SECONDS = 30
+
+LOAD_GENERATION = Query('load_generation', "SELECT generation FROM load_generation", ())
+
+
+def database_load_generation(query_engine):
+    """
+    Creates a generation source reading the load generation run_pipeline bumps after each successful load.
+
+    :param query_engine: QueryEngine
+    :return: Callable[[], int]
+    """
+    return lambda: query_engine.execute(LOAD_GENERATION, {})[0][0]
+
+
+def normalize_params(func, args, kwargs):
+    """
+    Binds the arguments of a query function call to its parameter names, so calls with positional, keyword and
+    default arguments share a key. The first parameter (the query engine) is not part of the key.
+
+    :param func: query function
+    :param args: tuple
+    :param kwargs: dict
+    :return: Tuple of (param name, value) pairs
+    """
+    bound_args = inspect.signature(func).bind(*args, **kwargs)
+    bound_args.apply_defaults()
+    return tuple(bound_args.arguments.items())[1:]
+
+
+class DiskBackend:
+    """
+    Results shared between processes in a SQLite file, keyed on the same keys as the in-memory cache.
+
+    Expired rows are deleted whenever a result is stored, and rows of older load generations when the generation
+    changes, so the file only holds results that can still be served.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results "
+                          "(key TEXT PRIMARY KEY, generation INTEGER, expires_at REAL, value BLOB)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_expires_at_idx ON results (expires_at)")
+
+    def get(self, key, generation):
+        with self.lock:
+            row = self.conn.execute("SELECT generation, expires_at, value FROM results WHERE key = ?",
+                                    (key,)).fetchone()
+        if row is None or row[0] != generation or row[1] <= time.time():
+            return None
+        return pickle.loads(row[2])
+
+    def set(self, key, generation, expires_at, value):
+        with self.lock:
+            self.conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+            self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                              (key, generation, expires_at, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def prune_generations(self, generation):
+        """
+        Deletes the results of every load generation other than generation.
+
+        :param generation: int
+        """
+        with self.lock:
+            self.conn.execute("DELETE FROM results WHERE generation IS NOT ?", (generation,))
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM results")
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of query results with a time to live, placed in front of the query functions with cached.
+
+    All entries are dropped when the load generation changes, which is checked at most every
+    generation_check_seconds. Results of the disk backend are stored with the generation they were computed in and
+    ignored once it changes.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS, generation_source=None,
+                 generation_check_seconds=DEFAULT_GENERATION_CHECK_SECONDS, disk_path=None):
+        """
+        :param max_entries: int, entries kept in memory before the least recently used is evicted
+        :param ttl_seconds: float, seconds a result is served for
+        :param generation_source: Callable[[], int] returning the current load generation, see
+        database_load_generation
+        :param generation_check_seconds: float
+        :param disk_path: str, optional SQLite file shared with other processes
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation_source = generation_source
+        self.generation_check_seconds = generation_check_seconds
+        self.disk_backend = DiskBackend(disk_path) if disk_path else None
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generation = None
+        self.generation_checked_at = float('-inf')
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _current_generation(self):
+        if self.generation_source is None:
+            return None
+        now = time.monotonic()
+        if now - self.generation_checked_at >= self.generation_check_seconds:
+            generation = self.generation_source()
+            with self.lock:
+                self.generation_checked_at = now
+                changed = generation != self.generation
+                if changed:
+                    if self.entries:
+                        module_logger.info(f"Load generation changed to {generation}, invalidating cached results")
+                        self.counters['invalidations'] += 1
+                    self.entries.clear()
+                    self.generation = generation
+            if changed and self.disk_backend is not None:
+                self.disk_backend.prune_generations(generation)
+        return self.generation
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached result for key, or computes and caches it.
+
+        :param key: hashable, normalized query parameters
+        :param compute: Callable[[], result]
+        :return: result, shared between callers and must not be modified
+        """
+        generation = self._current_generation()
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self.entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    return result
+                del self.entries[key]
+                self.counters['expirations'] += 1
+
+        if self.disk_backend is not None:
+            result = self.disk_backend.get(repr(key), generation)
+            if result is not None:
+                self._store(key, now + self.ttl_seconds, result)
+                with self.lock:
+                    self.counters['hits'] += 1
+                return result
+
+        with self.lock:
+            self.counters['misses'] += 1
+        result = compute()
+        self._store(key, now + self.ttl_seconds, result)
+        if self.disk_backend is not None:
+            self.disk_backend.set(repr(key), generation, now + self.ttl_seconds, result)
+        return result
+
+    def _store(self, key, expires_at, result):
+        with self.lock:
+            self.entries[key] = (expires_at, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def cached(self, func):
+        """
+        Decorates a query function (taking the query engine as its first argument) so its results are served from
+        the cache.
+
+        :param func: query function
+        :return: cached query function
+        """
+        @wraps(func)
+        def cached_func(*args, **kwargs):
+            key = (func.__qualname__,) + normalize_params(func, args, kwargs)
+            return self.get_or_compute(key, lambda: func(*args, **kwargs))
+        return cached_func
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        if self.disk_backend is not None:
+            self.disk_backend.clear()
+
+    def stats(self):
+        """
+        Hit, miss, eviction, expiration and invalidation counters, to help size the cache.
+
+        :return: dict
+        """
+        with self.lock:
+            return dict(self.counters, size=len(self.entries), max_entries=self.max_entries)
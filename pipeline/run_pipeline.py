@@ -1,42 +1,174 @@
+import argparse
 import logging
 from sqlalchemy import create_engine
+from definitions import DATABASE_URL, DOWNLOAD_DIR, ICD10_MORTALITY_DATA_URLS, SNAPSHOT_DIR
+from pipeline import instrumentation
+from pipeline.cli import configure_logger, run_recorded
+from pipeline.ingest import age_bands
+from pipeline.ingest import downloader
 from pipeline.ingest import icd10_mortality_rates_processor
+from pipeline.ingest import population_processor
+from pipeline.loaders import parquet_snapshot
+from pipeline.loaders import postgres_loader
+from pipeline.loaders import rollups
+from pipeline.query.mortality_cube import MortalityCube
 
 
-def configure_logger():
-    logger = logging.getLogger('pipeline')
-    logger.setLevel(logging.DEBUG)
+module_logger = logging.getLogger(__name__)
 
-    # create file handler which logs even debug messages
-    fh = logging.FileHandler('main.log')
-    fh.setLevel(logging.DEBUG)
-    # create console handler with a higher log level
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    # create formatter and add it to the handlers
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+TARGET_TABLE = 'mortality_facts'
 
-    return logger
 
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Load WHO ICD10 mortality rates data into the who database.")
+    parser.add_argument('--db-url', default=DATABASE_URL, help="SQLAlchemy URL of the who database.")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="Stream each mortality data file in chunks of this many rows to bound memory usage.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes used to process the mortality data parts in parallel.")
+    parser.add_argument('--download-dir', nargs='?', const=DOWNLOAD_DIR, default=None,
+                        help="Keep the mortality data files in this directory (data/downloads without a value), they "
+                             "are only downloaded again once they changed. By default they are downloaded into "
+                             "memory (or --temp-dir) and discarded after the run.")
+    parser.add_argument('--connections', type=int, default=downloader.DEFAULT_CONNECTIONS,
+                        help="Maximum number of concurrent range requests per downloaded file.")
+    parser.add_argument('--temp-dir', default=None,
+                        help="Directory for temporary files when an in-memory download is too large to keep in "
+                             "memory.")
+    parser.add_argument('--batch-size', type=int, default=postgres_loader.DEFAULT_BATCH_SIZE,
+                        help="Number of rows sent and committed per COPY batch when writing to the database.")
+    parser.add_argument('--load-mode', choices=['append', 'upsert'], default='append',
+                        help="'append' bulk loads into an empty table, 'upsert' incrementally merges into existing "
+                             "data and only touches rows whose deaths changed.")
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR,
+                        help="Directory of the Parquet snapshot of the processed data, written next to the database.")
+    parser.add_argument('--cube-dir', default=None,
+                        help="Also save deaths as a memory mapped (country, year, cause, sex) cube in this directory, "
+                             "see pipeline.query.mortality_cube.")
+    parser.add_argument('--age-resolved', action='store_true',
+                        help="Also keep deaths per age band and load them into the mortality_rates_by_age table.")
+    parser.add_argument('--coverage-pruning', action='store_true',
+                        help="Drop rows of country-years the availability file records with other lists only.")
+    parser.add_argument('--report', default=None,
+                        help="Path of the JSON run report with the time, rows and memory of every stage, "
+                             "data/run_reports/run-<start time>.json by default.")
+    parser.add_argument('--profile', choices=instrumentation.CAPTURE_MODES, default=None,
+                        help="Also capture a cProfile profile or the tracemalloc peak memory of every stage in the "
+                             "run report, which slows the run down.")
+    return parser.parse_args(args)
 
-def main():
+
+def main(args=None):
+    args = parse_args(args)
     logger = configure_logger()
 
     logger.info("Starting pipeline...")
+    run_recorded('run', load, args)
+
+
+def load(args):
+    engine = create_engine(args.db_url)
+    tables = transform(ICD10_MORTALITY_DATA_URLS, workers=args.workers, chunksize=args.chunksize,
+                       temp_dir=args.temp_dir, age_resolved=args.age_resolved, download_dir=args.download_dir,
+                       connections=args.connections, coverage_pruning=args.coverage_pruning)
+    write_tables(tables, engine, icd10_mortality_rates_processor.get_code_lookups(), args.snapshot_dir,
+                 cube_dir=args.cube_dir, load_mode=args.load_mode, batch_size=args.batch_size)
+    refresh(engine)
+
+
+def transform(mortality_data_urls, workers=1, chunksize=None, temp_dir=None, age_resolved=False, download_dir=None,
+              connections=downloader.DEFAULT_CONNECTIONS, coverage_pruning=False):
+    """
+    Processes the mortality data and population into the tables written to the database.
+
+    :param mortality_data_urls: List[str], URLs or paths of local zip archives, see
+        icd10_mortality_rates_processor.run_all for the other params
+    :return: {table: (DataFrame, primary key columns)} dict
+    """
+    with instrumentation.stage('process_mortality') as rows:
+        processed_icd10_data = icd10_mortality_rates_processor.run_all(mortality_data_urls,
+                                                                       workers=workers,
+                                                                       chunksize=chunksize,
+                                                                       temp_dir=temp_dir,
+                                                                       age_resolved=age_resolved,
+                                                                       download_dir=download_dir,
+                                                                       connections=connections,
+                                                                       coverage_pruning=coverage_pruning)
+        rows.rows_out = icd10_mortality_rates_processor.count_rows(processed_icd10_data)
+    with instrumentation.stage('population') as rows:
+        population = population_processor.run()
+        rows.rows_out = len(population.population_df)
+    mortality_keys = icd10_mortality_rates_processor.AGGREGATION_KEYS
+
+    tables = {TARGET_TABLE: (processed_icd10_data, mortality_keys)}
+    if age_resolved:
+        tables = {TARGET_TABLE: (processed_icd10_data.mortality_df.drop(columns='age_exact'), mortality_keys),
+                  'mortality_rates_by_age': (age_bands.to_dataframe(processed_icd10_data,
+                                                                    postgres_loader.to_array_literals),
+                                             mortality_keys)}
+    tables['population'] = (population_processor.to_dataframe(population, postgres_loader.to_array_literals),
+                            population_processor.POPULATION_KEYS)
+    with instrumentation.stage('compute_rates') as rows:
+        tables['mortality_rates_per_100k'] = (population_processor.compute_rates(processed_icd10_data, population),
+                                              mortality_keys)
+        rows.rows_out = len(tables['mortality_rates_per_100k'][0])
+    return tables
+
+
+def write_tables(tables, engine, code_lookups, snapshot_dir, cube_dir=None, load_mode='append',
+                 batch_size=postgres_loader.DEFAULT_BATCH_SIZE):
+    """
+    Writes the snapshot (and cube) of the processed data, the dimension tables and the tables of transform to the
+    database.
+
+    :param tables: {table: (DataFrame, primary key columns)} dict, see transform
+    :param engine: SQLAlchemy engine
+    :param code_lookups: lookups as returned by icd10_mortality_rates_processor.get_code_lookups
+    :param snapshot_dir: str
+    :param cube_dir: str, None to not save a cube
+    :param load_mode: str, 'append' or 'upsert'
+    :param batch_size: int
+    """
+    with instrumentation.stage('write_snapshot') as rows:
+        rows.rows_in = len(tables[TARGET_TABLE][0])
+        parquet_snapshot.write_snapshot(icd10_mortality_rates_processor.with_names(tables[TARGET_TABLE][0],
+                                                                                   code_lookups),
+                                        snapshot_dir)
+
+    if cube_dir:
+        with instrumentation.stage('write_cube') as rows:
+            rows.rows_in = len(tables[TARGET_TABLE][0])
+            MortalityCube.from_facts(tables[TARGET_TABLE][0], code_lookups['country'], code_lookups['cause_dimension'],
+                                     code_lookups['aggregate_causes']).save(cube_dir)
+
+    # Dimension tables are small and always upserted, so the facts of any load mode find their keys
+    for table, df in icd10_mortality_rates_processor.get_dimensions(code_lookups).items():
+        module_logger.info(f"Writing data to {table} table...")
+        with instrumentation.stage(f'write_{table}') as rows:
+            rows.rows_in = len(df)
+            postgres_loader.upsert_dataframe(df, table, engine, key_columns=[f'{table}_id'], batch_size=batch_size)
+
+    for table, (df, key_columns) in tables.items():
+        module_logger.info(f"Writing data to {table} table...")
+        with instrumentation.stage(f'write_{table}') as rows:
+            rows.rows_in = len(df)
+            if load_mode == 'upsert':
+                postgres_loader.upsert_dataframe(df, table, engine, key_columns=key_columns, batch_size=batch_size)
+            else:
+                postgres_loader.copy_dataframe(df, table, engine, batch_size=batch_size)
+
+
+def refresh(engine):
+    """
+    Refreshes the rollups over the loaded facts and bumps the load generation, which invalidates cached results.
+
+    :param engine: SQLAlchemy engine
+    """
+    module_logger.info("Refreshing rollups...")
+    with instrumentation.stage('refresh_rollups'):
+        rollups.refresh_rollups(engine, base_table=TARGET_TABLE)
 
-    engine = create_engine('postgresql://postgres@localhost:37780/who')
-    target_table = 'mortality_rates'
-    icd10_mortality_rates_urls = ["https://www.who.int/healthinfo/statistics/Morticd10_part1.zip",
-                                  "https://www.who.int/healthinfo/statistics/Morticd10_part2.zip"]
-    for url in icd10_mortality_rates_urls:
-        processed_icd10_data = icd10_mortality_rates_processor.run(url)
-        logger.info(f"Writing data to {target_table} table...")
-        processed_icd10_data.to_sql(target_table, con=engine, if_exists='append', index=False, method='multi')
+    postgres_loader.bump_load_generation(engine)
 
 
 if __name__ == "__main__":
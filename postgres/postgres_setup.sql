@@ -2,12 +2,187 @@ CREATE DATABASE who;
 
 \connect who
 
-CREATE TABLE mortality_rates
+-- Dimension tables, facts reference countries by their WHO country code and causes by the ids the pipeline numbers
+-- them with (see icd_10_code_parsers.build_cause_dimension)
+CREATE TABLE country
 (
-    country text,
+    country_id smallint PRIMARY KEY,
+    name text NOT NULL UNIQUE
+);
+
+-- Total causes total all other causes (see pipeline.query.mortality_queries.TOTAL_CAUSES), aggregate causes total
+-- other causes of list 101 or UE1, e.g. the totals and chapters (see icd_10_code_parsers.get_aggregate_causes)
+CREATE TABLE cause
+(
+    cause_id smallint PRIMARY KEY,
+    name text NOT NULL UNIQUE,
+    total boolean NOT NULL DEFAULT false,
+    aggregate boolean NOT NULL DEFAULT false
+);
+
+-- Deaths per country, year, cause and sex, partitioned by year so loads and queries of a year only touch its
+-- partition. Keys are not declared as foreign keys of the dimension tables to keep COPY loads free of per row checks,
+-- the pipeline always loads the dimension tables first
+CREATE TABLE mortality_facts
+(
+    country_id smallint NOT NULL,
+    year smallint NOT NULL,
+    cause_id smallint NOT NULL,
+    sex char(1) NOT NULL,
+    deaths int,
+    PRIMARY KEY(country_id, year, cause_id, sex)
+) PARTITION BY RANGE (year);
+
+CREATE INDEX mortality_facts_cause_year_idx ON mortality_facts (cause_id, year);
+
+DO $$
+BEGIN
+    FOR partition_year IN 1979..2030 LOOP
+        EXECUTE format('CREATE TABLE mortality_facts_%s PARTITION OF mortality_facts FOR VALUES FROM (%s) TO (%s)',
+                       partition_year, partition_year, partition_year + 1);
+    END LOOP;
+END
+$$;
+CREATE TABLE mortality_facts_default PARTITION OF mortality_facts DEFAULT;
+
+-- Mortality rates with country and cause names, in the layout of the former mortality_rates table
+CREATE VIEW mortality_rates AS
+    SELECT country.name AS country, facts.year, cause.name AS cause, facts.sex, facts.deaths
+    FROM mortality_facts facts
+    JOIN country ON country.country_id = facts.country_id
+    JOIN cause ON cause.cause_id = facts.cause_id;
+
+-- Deaths per age band, loaded when the pipeline runs with --age-resolved. deaths_by_age[band] holds the deaths of
+-- age_bands.band (see pipeline/ingest/age_bands.py), age_exact is false when a coarser age format was reported
+CREATE TABLE mortality_rates_by_age
+(
+    country_id smallint,
+    year smallint,
+    cause_id smallint,
+    sex char(1),
+    age_exact boolean,
+    deaths int,
+    deaths_by_age int[],
+    PRIMARY KEY(country_id, year, cause_id, sex)
+);
+
+CREATE TABLE age_bands
+(
+    band smallint PRIMARY KEY,
+    label text NOT NULL
+);
+INSERT INTO age_bands (band, label) VALUES
+    (1, '0'), (2, '1-4'), (3, '5-9'), (4, '10-14'), (5, '15-19'), (6, '20-24'), (7, '25-29'), (8, '30-34'),
+    (9, '35-39'), (10, '40-44'), (11, '45-49'), (12, '50-54'), (13, '55-59'), (14, '60-64'), (15, '65-69'),
+    (16, '70-74'), (17, '75-79'), (18, '80-84'), (19, '85+'), (20, 'unknown'), (21, '0-6 days'), (22, '7-27 days'),
+    (23, '28-364 days');
+
+-- WHO population per country, year and sex (see pipeline/ingest/population_processor.py), population_by_age[band]
+-- holds the population of age_bands.band up to 'unknown'
+CREATE TABLE population
+(
+    country_id smallint,
     year smallint,
-    cause text,
+    sex char(1),
+    population bigint,
+    age_exact boolean,
+    population_by_age bigint[],
+    PRIMARY KEY(country_id, year, sex)
+);
+
+-- Crude and WHO age-standardized death rates per 100,000 people, NULL where they can't be computed
+CREATE TABLE mortality_rates_per_100k
+(
+    country_id smallint,
+    year smallint,
+    cause_id smallint,
     sex char(1),
     deaths int,
-    PRIMARY KEY(country, year, cause, sex)
+    population bigint,
+    crude_rate double precision,
+    age_standardized_rate double precision,
+    PRIMARY KEY(country_id, year, cause_id, sex)
+);
+
+-- Attributes of countries from external datasets, e.g. latitude or daylight hours, see
+-- pipeline/ingest/country_enrichment.py
+CREATE TABLE country_attributes
+(
+    country_id smallint,
+    attribute text,
+    value double precision,
+    source text NOT NULL,
+    PRIMARY KEY(country_id, attribute)
+);
+
+-- Rollups for common query shapes, refreshed by the pipeline after each load (see pipeline/loaders/rollups.py).
+-- Facts are aggregated on their integer keys and names are only joined to the aggregated rows.
+-- Totals over all causes use the total cause where reported, see pipeline.query.mortality_queries.TOTAL_CAUSES
+CREATE MATERIALIZED VIEW deaths_by_country_year AS
+    SELECT country.name AS country, totals.year, totals.deaths
+    FROM (
+        SELECT facts.country_id, facts.year,
+               coalesce(sum(CASE WHEN cause.total THEN facts.deaths END), sum(facts.deaths))::bigint AS deaths
+        FROM mortality_facts facts
+        JOIN cause ON cause.cause_id = facts.cause_id
+        GROUP BY facts.country_id, facts.year
+    ) totals
+    JOIN country ON country.country_id = totals.country_id;
+CREATE UNIQUE INDEX deaths_by_country_year_key ON deaths_by_country_year (country, year);
+
+CREATE MATERIALIZED VIEW deaths_by_country_cause AS
+    SELECT country.name AS country, cause.name AS cause, totals.deaths
+    FROM (
+        SELECT country_id, cause_id, sum(deaths)::bigint AS deaths
+        FROM mortality_facts
+        GROUP BY country_id, cause_id
+    ) totals
+    JOIN country ON country.country_id = totals.country_id
+    JOIN cause ON cause.cause_id = totals.cause_id;
+CREATE UNIQUE INDEX deaths_by_country_cause_key ON deaths_by_country_cause (country, cause);
+CREATE INDEX deaths_by_country_cause_cause_idx ON deaths_by_country_cause (cause);
+
+CREATE MATERIALIZED VIEW deaths_by_year_cause AS
+    SELECT totals.year, cause.name AS cause, totals.deaths
+    FROM (
+        SELECT year, cause_id, sum(deaths)::bigint AS deaths
+        FROM mortality_facts
+        GROUP BY year, cause_id
+    ) totals
+    JOIN cause ON cause.cause_id = totals.cause_id;
+CREATE UNIQUE INDEX deaths_by_year_cause_key ON deaths_by_year_cause (year, cause);
+CREATE INDEX deaths_by_year_cause_cause_idx ON deaths_by_year_cause (cause, year);
+
+-- Ten most common causes of death for each country and year. Country-years reported in list 101 or UE1 (the ones
+-- with an all causes total) report aggregate causes next to the causes they total, so aggregates aren't ranked for
+-- them. Elsewhere causes named like a chapter hold the codes of the chapter without a cause of their own
+CREATE MATERIALIZED VIEW top_causes_by_country_year AS
+    SELECT country.name AS country, ranked_causes.year, ranked_causes.rank, ranked_causes.cause,
+           ranked_causes.deaths
+    FROM (
+        SELECT totals.country_id, totals.year, cause.name AS cause, totals.deaths,
+               row_number() OVER (PARTITION BY totals.country_id, totals.year
+                                  ORDER BY totals.deaths DESC, cause.name) AS rank
+        FROM (
+            SELECT facts.country_id, facts.year, facts.cause_id, sum(facts.deaths)::bigint AS deaths,
+                   bool_or(bool_or(cause.total))
+                       OVER (PARTITION BY facts.country_id, facts.year) AS condensed
+            FROM mortality_facts facts
+            JOIN cause ON cause.cause_id = facts.cause_id
+            GROUP BY facts.country_id, facts.year, facts.cause_id
+        ) totals
+        JOIN cause ON cause.cause_id = totals.cause_id
+        WHERE NOT (cause.aggregate AND totals.condensed)
+    ) ranked_causes
+    JOIN country ON country.country_id = ranked_causes.country_id
+    WHERE ranked_causes.rank <= 10;
+CREATE UNIQUE INDEX top_causes_by_country_year_key ON top_causes_by_country_year (country, year, rank);
+
+-- Incremented by the pipeline after each successful load, query result caches are invalidated when it changes
+CREATE TABLE load_generation
+(
+    id boolean PRIMARY KEY DEFAULT true CHECK (id),
+    generation bigint NOT NULL,
+    loaded_at timestamptz
 );
+INSERT INTO load_generation (generation) VALUES (0);
@@ -0,0 +1,34 @@
+import io
+import unittest
+import zipfile
+import numpy as np
+from benchmarks import synthetic_morticd10
+from pipeline.ingest import icd10_mortality_rates_processor
+
+
+class SyntheticMorticd10TestCase(unittest.TestCase):
+    def test_same_seed_same_file(self):
+        csv_files = [io.BytesIO(), io.BytesIO(), io.BytesIO()]
+        for csv_file, seed in zip(csv_files, [0, 0, 1]):
+            synthetic_morticd10.write_morticd10_csv(csv_file, 1000, seed=seed, chunk_rows=300)
+
+        self.assertEqual(csv_files[0].getvalue(), csv_files[1].getvalue())
+        self.assertNotEqual(csv_files[0].getvalue(), csv_files[2].getvalue())
+
+    def test_processed_like_who_files(self):
+        zip_file = io.BytesIO()
+        with zipfile.ZipFile(zip_file, 'w') as zip_ref, zip_ref.open('Morticd10_synthetic', 'w') as csv_file:
+            synthetic_morticd10.write_morticd10_csv(csv_file, 2000, chunk_rows=700)
+        zip_file.seek(0)
+
+        with icd10_mortality_rates_processor.open_zipped_csv(zip_file) as csv_file:
+            mortality_df = next(icd10_mortality_rates_processor.read_mortality_csv(csv_file, age_resolved=True))
+        self.assertEqual(len(mortality_df), 2000)
+        self.assertEqual(set(mortality_df['List']), set(synthetic_morticd10.LIST_WEIGHTS))
+        np.testing.assert_array_equal(mortality_df.filter(regex=r'^Deaths([2-9]|\d\d)$').sum(axis=1),
+                                      mortality_df['Deaths1'])
+
+        # Every generated code is drawn from the code tables, so no row is dropped for an unknown country or cause
+        processed = icd10_mortality_rates_processor.transform(mortality_df,
+                                                              icd10_mortality_rates_processor.get_code_lookups())
+        self.assertEqual(processed['deaths'].sum(), mortality_df['Deaths1'].sum())
@@ -0,0 +1,191 @@
+import asyncio
+import csv
+import io
+import os
+import tempfile
+import unittest
+from aiohttp.test_utils import AioHTTPTestCase
+from sqlalchemy import create_engine
+from pipeline.api.query_service import AdmissionControl, Overloaded, RequestCoalescer, create_app
+from pipeline.query.async_query_engine import AsyncQueryEngine, create_pooled_async_engine, to_async_url, to_typed_sql
+from pipeline.query.mortality_queries import DEATHS_BY_SEX
+from tests.pipeline.mock_coverage import mock_coverage_index
+from tests.pipeline.query.test_mortality_queries import MORTALITY_RATES, create_sqlite_stand_in
+
+
+class GatedQueryEngine(AsyncQueryEngine):
+    """
+    Holds every query until the gate is opened, so tests control which requests are in flight at the same time.
+    """
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        self.gate = asyncio.Event()
+        self.calls = 0
+
+    async def execute(self, query, params):
+        self.calls += 1
+        await self.gate.wait()
+        return await super().execute(query, params)
+
+
+class SQLiteQueryServiceTestCase(AioHTTPTestCase):
+    """
+    Serves the query service over a SQLite stand-in of the who database.
+    """
+    max_active = 10
+    max_queued = 100
+
+    def setUp(self):
+        self.db_dir = tempfile.TemporaryDirectory()
+        self.db_url = f"sqlite:///{os.path.join(self.db_dir.name, 'who.sqlite')}"
+        engine = create_engine(self.db_url)
+        create_sqlite_stand_in(engine)
+        engine.dispose()
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.db_dir.cleanup()
+
+    async def get_application(self):
+        self.query_engine = GatedQueryEngine(create_pooled_async_engine(self.db_url))
+        self.query_engine.gate.set()
+        return create_app(self.query_engine, max_active=self.max_active, max_queued=self.max_queued)
+
+    async def get_json(self, path):
+        async with self.client.get(path) as response:
+            self.assertEqual(response.status, 200)
+            return await response.json()
+
+
+class QueryServiceTestCase(SQLiteQueryServiceTestCase):
+    async def test_queries(self):
+        self.assertEqual(await self.get_json('/top_causes?country=Algeria&year=2008&n=1'),
+                         [{'cause': 'Tetanus', 'deaths': 25}])
+        self.assertEqual(await self.get_json('/deaths?country=Algeria&year=2008'), {'deaths': 70})
+        self.assertEqual(await self.get_json('/deaths?country=Algeria&year=2008&sex=m&cause=Cholera'), {'deaths': 10})
+        self.assertEqual(await self.get_json('/deaths_by_sex?country=France&year=2008'),
+                         [{'sex': 'f', 'deaths': 1}, {'sex': 'u', 'deaths': 2}])
+        self.assertEqual(await self.get_json('/cause_time_series?cause=Cholera'),
+                         [{'year': 2008, 'deaths': 23}, {'year': 2009, 'deaths': 3}])
+
+    async def test_invalid_parameters(self):
+        for path in ['/top_causes?country=Algeria', '/top_causes?country=Algeria&year=recent',
+                     '/mortality_rates?format=xml']:
+            async with self.client.get(path) as response:
+                self.assertEqual(response.status, 400)
+
+    async def test_no_coverage(self):
+        self.query_engine.coverage = mock_coverage_index()
+
+        for path in ['/deaths?country=France&year=2007', '/top_causes?country=France&year=2007',
+                     '/mortality_rates?country=France&year=2007']:
+            async with self.client.get(path) as response:
+                self.assertEqual(response.status, 404)
+                self.assertEqual(await response.json(), {'error': 'no coverage'})
+        self.assertEqual(self.query_engine.calls, 0)
+        # Countries missing from the availability file and years after it are asked
+        self.assertEqual(await self.get_json('/deaths?country=Algeria&year=2008'), {'deaths': 70})
+        self.assertEqual(await self.get_json('/deaths?country=Italy&year=2008'), {'deaths': 0})
+        self.assertEqual(await self.get_json('/top_causes?country=Algeria&year=2019'), [])
+        self.assertEqual(self.query_engine.calls, 3)
+
+    async def test_streamed_results(self):
+        expected_rows = [list(row) for row in MORTALITY_RATES if row[1] == 2008]
+
+        self.assertEqual([list(row.values()) for row in await self.get_json('/mortality_rates?year=2008')],
+                         expected_rows)
+        async with self.client.get('/mortality_rates?year=2008&format=csv') as response:
+            header, *rows = csv.reader(io.StringIO(await response.text()))
+        self.assertEqual(header, ['country', 'year', 'cause', 'sex', 'deaths'])
+        self.assertEqual(rows, [[str(value) for value in row] for row in expected_rows])
+
+    async def test_identical_requests_coalesced(self):
+        self.query_engine.gate.clear()
+        requests = [asyncio.ensure_future(self.get_json('/deaths?country=Algeria&year=2008')) for _ in range(5)]
+        requests.append(asyncio.ensure_future(self.get_json('/deaths?country=France&year=2008')))
+        while self.query_engine.calls < 2:
+            await asyncio.sleep(0.01)
+        self.query_engine.gate.set()
+
+        self.assertEqual([response['deaths'] for response in await asyncio.gather(*requests)], [70] * 5 + [3])
+        self.assertEqual(self.query_engine.calls, 2)
+        stats = await self.get_json('/stats')
+        self.assertEqual((stats['executed'], stats['coalesced']), (2, 4))
+
+
+class OverloadedQueryServiceTestCase(SQLiteQueryServiceTestCase):
+    max_active = 1
+    max_queued = 1
+
+    async def test_overload_rejected(self):
+        self.query_engine.gate.clear()
+        # One query runs and one waits for the slot, distinct queries aren't coalesced
+        requests = [asyncio.ensure_future(self.client.get(f'/cause_time_series?cause={cause}'))
+                    for cause in ['Cholera', 'Tetanus']]
+        while self.query_engine.calls < 1:
+            await asyncio.sleep(0.01)
+
+        async with self.client.get('/cause_time_series?cause=Plague') as response:
+            self.assertEqual(response.status, 429)
+            self.assertEqual(response.headers['Retry-After'], '1')
+
+        self.query_engine.gate.set()
+        for response in await asyncio.gather(*requests):
+            self.assertEqual(response.status, 200)
+            response.release()
+        self.assertEqual((await self.get_json('/stats'))['rejected'], 1)
+
+
+class AdmissionControlTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_queue_bounded(self):
+        admission = AdmissionControl(max_active=1, max_queued=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission.admit():
+                await release.wait()
+
+        holders = [asyncio.ensure_future(hold()) for _ in range(2)]
+        await asyncio.sleep(0)
+        with self.assertRaises(Overloaded):
+            async with admission.admit():
+                pass
+        release.set()
+        await asyncio.gather(*holders)
+
+        self.assertEqual((admission.admitted, admission.rejected), (0, 1))
+
+
+class RequestCoalescerTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_errors_shared(self):
+        coalescer = RequestCoalescer()
+        release = asyncio.Event()
+
+        async def fail():
+            await release.wait()
+            raise ValueError()
+
+        callers = [asyncio.ensure_future(coalescer.run('key', fail)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual((coalescer.executed, coalescer.coalesced), (1, 2))
+        self.assertEqual(coalescer.in_flight, {})
+
+
+class AsyncQueryEngineTestCase(unittest.TestCase):
+    def test_to_async_url(self):
+        self.assertEqual(to_async_url('postgresql://postgres@localhost:37780/who'),
+                         'postgresql+asyncpg://postgres@localhost:37780/who')
+        self.assertEqual(to_async_url('sqlite:///who.sqlite'), 'sqlite+aiosqlite:///who.sqlite')
+
+    def test_typed_sql(self):
+        self.assertIn("CAST(:cause AS text) IS NULL OR cause = CAST(:cause AS text)", to_typed_sql(DEATHS_BY_SEX))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pipeline.loaders.parquet_snapshot import read_snapshot, write_snapshot
+
+
+class ParquetSnapshotTestCase(unittest.TestCase):
+    columns = ['country', 'year', 'cause', 'sex', 'deaths']
+    mortality_df = pd.DataFrame([['Algeria', 2001, 'Cholera', 'f', 12],
+                                 ['Algeria', 2001, 'Cholera', 'm', 10],
+                                 ['Algeria', 2002, 'Tetanus', 'f', 2],
+                                 ["Côte d'Ivoire", 2002, 'Tetanus', 'm', 4],
+                                 ['France', 2001, 'Schistosomiasis', 'f', 14],
+                                 ['Italy', 2002, 'Plague', 'm', 4]],
+                                columns=columns)
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_dir = os.path.join(self.temp_dir.name, 'snapshot')
+        write_snapshot(self.mortality_df, self.snapshot_dir)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read_sorted(self, **kwargs):
+        snapshot_df = read_snapshot(self.snapshot_dir, **kwargs)
+        return snapshot_df.astype({column: object for column in ['country', 'cause']
+                                   if column in snapshot_df}).sort_values(list(snapshot_df.columns),
+                                                                          ignore_index=True)
+
+    def test_partitioned_by_year_and_country(self):
+        self.assertEqual(sorted(os.listdir(self.snapshot_dir)), ['year=2001', 'year=2002'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.snapshot_dir, 'year=2001'))),
+                         ['country=Algeria', 'country=France'])
+
+        data_file = os.path.join(self.snapshot_dir, 'year=2001', 'country=Algeria',
+                                 os.listdir(os.path.join(self.snapshot_dir, 'year=2001', 'country=Algeria'))[0])
+        self.assertTrue(pa.types.is_dictionary(pq.read_schema(data_file).field('cause').type))
+
+    def test_round_trip(self):
+        pd.testing.assert_frame_equal(self.read_sorted(columns=self.columns),
+                                      self.mortality_df.sort_values(self.columns, ignore_index=True),
+                                      check_dtype=False)
+
+    def test_filtered_read(self):
+        expected_output = pd.DataFrame([["Côte d'Ivoire", 'Tetanus', 4]], columns=['country', 'cause', 'deaths'])
+
+        pd.testing.assert_frame_equal(self.read_sorted(columns=['country', 'cause', 'deaths'], year=2002,
+                                                       country=["Côte d'Ivoire", 'France']),
+                                      expected_output, check_dtype=False)
+        self.assertEqual(len(read_snapshot(self.snapshot_dir, cause='Cholera')), 2)
+
+    def test_rewritten_partitions_replaced(self):
+        write_snapshot(self.mortality_df[self.mortality_df['country'] == 'France'].assign(deaths=1),
+                       self.snapshot_dir)
+
+        self.assertEqual(read_snapshot(self.snapshot_dir, country='France')['deaths'].tolist(), [1])
+        self.assertEqual(len(read_snapshot(self.snapshot_dir)), len(self.mortality_df))
+
+
+if __name__ == '__main__':
+    unittest.main()
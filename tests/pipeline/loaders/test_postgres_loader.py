@@ -0,0 +1,121 @@
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+import pandas as pd
+from pipeline.loaders.postgres_loader import bump_load_generation
+from pipeline.loaders.postgres_loader import copy_dataframe
+from pipeline.loaders.postgres_loader import dataframe_to_csv_buffer
+from pipeline.loaders.postgres_loader import to_array_literals
+from pipeline.loaders.postgres_loader import upsert_dataframe
+from pipeline.loaders.postgres_loader import upsert_sql
+
+
+def mock_engine():
+    engine = MagicMock()
+    connection = engine.raw_connection.return_value
+    cursor = connection.cursor.return_value
+    copied = []
+    cursor.copy_expert.side_effect = lambda sql, buffer: copied.append((sql, buffer.read()))
+    return engine, connection, copied
+
+
+class DataFrameToCsvBufferTestCase(unittest.TestCase):
+    def test_csv_format(self):
+        df = pd.DataFrame([['Algeria', 2001, 'Cholera, "other"', 'f', 12],
+                           ['France', 2002, None, 'm', 4]],
+                          columns=['country', 'year', 'cause', 'sex', 'deaths'])
+
+        expected_output = 'Algeria,2001,"Cholera, ""other""",f,12\nFrance,2002,,m,4\n'
+
+        self.assertEqual(dataframe_to_csv_buffer(df).read(), expected_output)
+
+
+class ToArrayLiteralsTestCase(unittest.TestCase):
+    def test_array_literals_copied_as_quoted_csv(self):
+        df = pd.DataFrame({'deaths_by_age': to_array_literals(np.array([[1, 0, 3], [0, 12, 0]], dtype=np.int32))})
+
+        self.assertEqual(dataframe_to_csv_buffer(df).read(), '"{1,0,3}"\n"{0,12,0}"\n')
+
+
+class CopyDataFrameTestCase(unittest.TestCase):
+    df = pd.DataFrame([['Algeria', 2001, 'Cholera', 'f', 12],
+                       ['Algeria', 2001, 'Cholera', 'm', 10],
+                       ['France', 2001, 'Schistosomiasis', 'f', 14],
+                       ['France', 2001, 'Schistosomiasis', 'm', 14],
+                       ['Italy', 2002, 'Plague', 'm', 4]],
+                      columns=['country', 'year', 'cause', 'sex', 'deaths'])
+
+    def test_copies_in_committed_batches(self):
+        engine, connection, copied = mock_engine()
+
+        stats = copy_dataframe(self.df, 'mortality_rates', engine, batch_size=2)
+
+        expected_sql = "COPY mortality_rates (country, year, cause, sex, deaths) FROM STDIN WITH (FORMAT csv)"
+        self.assertEqual([sql for sql, _ in copied], [expected_sql] * 3)
+        self.assertEqual(''.join(data for _, data in copied), dataframe_to_csv_buffer(self.df).read())
+        self.assertEqual(connection.commit.call_count, 3)
+        connection.close.assert_called_once()
+        self.assertEqual(stats['rows'], 5)
+
+    def test_failed_batch_is_rolled_back(self):
+        engine, connection, _ = mock_engine()
+        connection.cursor.return_value.copy_expert.side_effect = RuntimeError("connection lost")
+
+        with self.assertRaises(RuntimeError):
+            copy_dataframe(self.df, 'mortality_rates', engine)
+
+        connection.rollback.assert_called_once()
+        connection.commit.assert_not_called()
+        connection.close.assert_called_once()
+
+
+class UpsertSqlTestCase(unittest.TestCase):
+    def test_skips_unchanged_rows(self):
+        expected_output = ("WITH upserted AS ("
+                           "INSERT INTO mortality_rates AS target (country, year, cause, sex, deaths) "
+                           "SELECT country, year, cause, sex, deaths FROM stage "
+                           "ON CONFLICT (country, year, cause, sex) DO UPDATE SET deaths = EXCLUDED.deaths "
+                           "WHERE (target.deaths) IS DISTINCT FROM (EXCLUDED.deaths) "
+                           "RETURNING (xmax = 0) AS inserted) "
+                           "SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) "
+                           "FROM upserted")
+
+        self.assertEqual(upsert_sql('mortality_rates', 'stage', ['country', 'year', 'cause', 'sex', 'deaths'],
+                                    ['country', 'year', 'cause', 'sex']),
+                         expected_output)
+
+    def test_key_only_table(self):
+        self.assertIn("ON CONFLICT (country) DO NOTHING", upsert_sql('countries', 'stage', ['country'], ['country']))
+
+
+class UpsertDataFrameTestCase(unittest.TestCase):
+    def test_stages_and_reports_counts(self):
+        engine, connection, copied = mock_engine()
+        cursor = connection.cursor.return_value
+        cursor.fetchone.return_value = (2, 1)
+
+        stats = upsert_dataframe(CopyDataFrameTestCase.df, 'mortality_rates', engine,
+                                 key_columns=['country', 'year', 'cause', 'sex'], batch_size=2)
+
+        executed = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(executed[0], "CREATE TEMP TABLE mortality_rates_stage "
+                                      "(LIKE mortality_rates INCLUDING DEFAULTS) ON COMMIT DROP")
+        self.assertTrue(executed[1].startswith("WITH upserted AS (INSERT INTO mortality_rates AS target"))
+        self.assertTrue(all(sql.startswith("COPY mortality_rates_stage ") for sql, _ in copied))
+        # Staging and merging happen in a single transaction
+        connection.commit.assert_called_once()
+        self.assertEqual((stats['inserted'], stats['updated'], stats['unchanged']), (2, 1, 2))
+
+
+class BumpLoadGenerationTestCase(unittest.TestCase):
+    def test_returns_new_generation(self):
+        engine = MagicMock()
+        conn = engine.begin.return_value.__enter__.return_value
+        conn.execute.return_value.scalar_one.return_value = 3
+
+        self.assertEqual(bump_load_generation(engine), 3)
+        self.assertTrue(str(conn.execute.call_args.args[0]).startswith("UPDATE load_generation"))
+
+
+if __name__ == '__main__':
+    unittest.main()
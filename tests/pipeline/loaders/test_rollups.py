@@ -0,0 +1,21 @@
+import unittest
+from unittest.mock import MagicMock
+from pipeline.loaders.rollups import refresh_rollups
+
+
+class RefreshRollupsTestCase(unittest.TestCase):
+    def test_views_refreshed_concurrently(self):
+        engine = MagicMock()
+        conn = engine.begin.return_value.__enter__.return_value
+
+        timings = refresh_rollups(engine, views=['deaths_by_country_year', 'top_causes_by_country_year'])
+
+        executed = [str(call.args[0]) for call in conn.execute.call_args_list]
+        self.assertEqual(executed, ["ANALYZE mortality_facts",
+                                    "REFRESH MATERIALIZED VIEW CONCURRENTLY deaths_by_country_year",
+                                    "REFRESH MATERIALIZED VIEW CONCURRENTLY top_causes_by_country_year"])
+        self.assertEqual(list(timings), ['deaths_by_country_year', 'top_causes_by_country_year'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from pipeline.loaders.stage_files import MANIFEST_FILE, read_stage_tables, write_stage_tables
+
+
+class StageFilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.stage_dir = os.path.join(self.temp_dir.name, 'stages')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        facts_df = pd.DataFrame({'country_id': np.array([1010, 4080], dtype=np.int16),
+                                 'year': np.array([2008, 2008], dtype=np.int16),
+                                 'cause_id': np.array([2, 4], dtype=np.int32),
+                                 'sex': ['f', 'm'], 'deaths': [12, 25]})
+        population_df = pd.DataFrame({'country_id': [1010], 'year': [2008], 'sex': ['f'],
+                                      'population_by_age': ['{1,2,3}']})
+        tables = {'mortality_facts': (facts_df, ['country_id', 'year', 'cause_id', 'sex']),
+                  'population': (population_df, ['country_id', 'year', 'sex'])}
+
+        write_stage_tables(tables, self.stage_dir)
+        stage_tables = read_stage_tables(self.stage_dir)
+
+        self.assertEqual(list(stage_tables), ['mortality_facts', 'population'])
+        for table, (df, key_columns) in tables.items():
+            assert_frame_equal(stage_tables[table][0], df)
+            self.assertEqual(stage_tables[table][1], key_columns)
+
+    def test_incomplete_write_not_read(self):
+        write_stage_tables({'population': (pd.DataFrame({'year': [2008]}), ['year'])}, self.stage_dir)
+        os.remove(os.path.join(self.stage_dir, MANIFEST_FILE))
+
+        with self.assertRaises(FileNotFoundError):
+            read_stage_tables(self.stage_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
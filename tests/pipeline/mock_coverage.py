@@ -0,0 +1,15 @@
+import pandas as pd
+from definitions import TEST_RESOURCES
+from pipeline.parsers import icd_10_code_parsers
+from pipeline.parsers.coverage_index import CoverageIndex
+
+
+def mock_coverage_index():
+    """
+    Coverage of mock_availability.csv: Algeria with list 104 in 2008 and 2009 and list 103 in 2009 as well, Cape
+    Verde with list 07A in 2009, and France with list 104 in 2001, 2006 and 2008. Italy and Lithuania aren't in it.
+
+    :return: CoverageIndex over 2001-2009, with the country names of the code tables
+    """
+    availability_df = pd.read_csv(TEST_RESOURCES + '/mock_availability.csv', dtype={'list': str})
+    return CoverageIndex.from_availability(availability_df, icd_10_code_parsers.get_country_codes_dict())
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from definitions import TEST_RESOURCES
+from pipeline.parsers import code_dictionary_cache
+from pipeline.parsers.code_dictionary_cache import get_code_dictionaries, get_coverage_index
+from tests.pipeline.mock_coverage import mock_coverage_index
+
+
+class GetCodeDictionariesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        self.country_codes_path = os.path.join(self.temp_dir.name, 'country_codes.csv')
+        shutil.copy(TEST_RESOURCES + '/mock_country_codes.csv', self.country_codes_path)
+
+        patches = [patch('pipeline.parsers.icd_10_code_parsers.ICD_10_CAUSE_CODES_PATH',
+                         TEST_RESOURCES + '/mock_cause_codes.csv'),
+                   patch('pipeline.parsers.icd_10_code_parsers.ICD_10_PORTUGAL_CAUSE_CODES_PATH',
+                         TEST_RESOURCES + '/mock_portugal_cause_codes.csv'),
+                   patch('pipeline.parsers.icd_10_code_parsers.COUNTRY_CODES_PATH', self.country_codes_path),
+                   patch.dict(code_dictionary_cache._code_dictionaries_memo, clear=True)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_compiled_once_per_process(self):
+        with patch('pipeline.parsers.code_dictionary_cache.build_code_dictionaries',
+                   wraps=code_dictionary_cache.build_code_dictionaries) as mock_build:
+            code_dictionaries = get_code_dictionaries(self.cache_dir)
+            self.assertIs(get_code_dictionaries(self.cache_dir), code_dictionaries)
+
+        mock_build.assert_called_once()
+        self.assertEqual(code_dictionaries['country'][1010], 'Algeria')
+        self.assertEqual(code_dictionaries['3_char'].get_cause('A95'), 'Cholera')
+        self.assertEqual(code_dictionaries['condensed']['1002'], 'Cholera')
+        self.assertEqual(code_dictionaries['portugal']['UE02'], 'Cholera')
+
+    def test_loaded_from_artifact_in_new_process(self):
+        code_dictionaries = get_code_dictionaries(self.cache_dir)
+        code_dictionary_cache._code_dictionaries_memo.clear()
+
+        with patch('pipeline.parsers.code_dictionary_cache.build_code_dictionaries') as mock_build:
+            self.assertEqual(get_code_dictionaries(self.cache_dir), code_dictionaries)
+
+        mock_build.assert_not_called()
+
+    def test_rebuilt_when_source_changes(self):
+        get_code_dictionaries(self.cache_dir)
+        with open(self.country_codes_path, 'a') as f:
+            f.write('1040,Burundi\n')
+
+        self.assertEqual(get_code_dictionaries(self.cache_dir)['country'][1040], 'Burundi')
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_coverage_index_built_only_when_asked_for(self):
+        with patch('pipeline.parsers.code_dictionary_cache.AVAILABILITY_PATH',
+                   os.path.join(self.temp_dir.name, 'missing.xls')):
+            self.assertNotIn('coverage', get_code_dictionaries(self.cache_dir))
+        with patch('pipeline.parsers.code_dictionary_cache.AVAILABILITY_PATH',
+                   TEST_RESOURCES + '/mock_availability.csv'), \
+                patch('pipeline.parsers.coverage_index.build_coverage_index',
+                      return_value=mock_coverage_index()) as mock_build:
+            coverage = get_coverage_index(self.cache_dir)
+            self.assertIs(get_coverage_index(self.cache_dir), coverage)
+
+        mock_build.assert_called_once_with(get_code_dictionaries(self.cache_dir)['country'],
+                                           TEST_RESOURCES + '/mock_availability.csv')
+        self.assertEqual(coverage, mock_coverage_index())
+
+
+if __name__ == '__main__':
+    unittest.main()
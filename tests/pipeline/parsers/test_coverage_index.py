@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+from pipeline.parsers import coverage_index
+from pipeline.parsers.coverage_index import CoverageIndex
+from tests.pipeline.mock_coverage import mock_coverage_index
+
+
+class CoverageIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.coverage = mock_coverage_index()
+
+    def test_masks(self):
+        self.assertEqual(self.coverage.country_ids, [1010, 1060, 4080])
+        self.assertEqual(self.coverage.years, list(range(2001, 2010)))
+        self.assertEqual(self.coverage.lists, ['07A', '103', '104'])
+        np.testing.assert_array_equal(self.coverage.get_masks([1010, 1010, 1060, 4080, 4080, 4180],
+                                                              [2008, 2009, 2009, 2001, 2007, 2008]),
+                                      [0b100, 0b110, 0b001, 0b100, 0, 0])
+
+    def test_covers(self):
+        self.assertTrue(self.coverage.covers(1010, 2009))
+        self.assertTrue(self.coverage.covers(1010, 2009, '103'))
+        self.assertFalse(self.coverage.covers(1010, 2008, '103'))
+        self.assertFalse(self.coverage.covers(4080, 2007))
+        for country_id, year in [(4180, 2008), (1010, 2020), (99999, 2008), (-1, 2008)]:
+            self.assertFalse(self.coverage.covers(country_id, year))
+        self.assertEqual(self.coverage.get_lists(1010, 2009), ['103', '104'])
+
+    def test_has_data(self):
+        self.assertTrue(self.coverage.has_data('France', 2008))
+        self.assertTrue(self.coverage.has_data('France'))
+        # Recorded by the file without any list
+        self.assertFalse(self.coverage.has_data('France', 2007))
+        self.assertFalse(self.coverage.has_data('Algeria', 2005))
+
+    def test_has_data_unknown_to_file(self):
+        # Countries missing from the file and years after it may still have data in the database
+        self.assertTrue(self.coverage.has_data('Italy', 2008))
+        self.assertTrue(self.coverage.has_data('Algeria', 2019))
+        self.assertTrue(self.coverage.has_data('France', 1990))
+        self.assertTrue(self.coverage.has_data('Atlantis', 2008))
+
+    def test_contradicted(self):
+        contradicted = self.coverage.contradicted([1010, 1010, 1010, 1060, 4180, 1010, 4080],
+                                                  [2008, 2008, 2009, 2009, 2008, 2019, 2007],
+                                                  ['104', '103', '103', '104', '104', '101', '104'])
+        # Country-years without lists in the file are never contradicted
+        np.testing.assert_array_equal(contradicted, [False, True, False, True, False, False, False])
+
+    def test_read_availability(self):
+        availability_df = coverage_index.read_availability()
+
+        self.assertEqual(list(availability_df.columns), ['country_id', 'year', 'list'])
+        self.assertFalse(availability_df.duplicated().any())
+        coverage = CoverageIndex.from_availability(availability_df)
+        self.assertEqual(coverage.get_lists(4080, 2001), ['104'])
+        self.assertLessEqual(len(coverage.lists), coverage_index.MAX_LISTS)
+
+
+if __name__ == '__main__':
+    unittest.main()
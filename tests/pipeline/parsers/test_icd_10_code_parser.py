@@ -1,3 +1,4 @@
+import tempfile
 import unittest
 from unittest.mock import patch
 from definitions import TEST_RESOURCES
@@ -5,9 +6,13 @@ from pipeline.parsers.icd_10_code_parsers import extract_char_numeral_pair
 from pipeline.parsers.icd_10_code_parsers import code_range_str_to_list
 from pipeline.parsers.icd_10_code_parsers import detailed_code_str_to_list
 from pipeline.parsers.icd_10_code_parsers import get_3_char_cause_code_dict
+from pipeline.parsers.icd_10_code_parsers import get_3_char_cause_code_index
+from pipeline.parsers.icd_10_code_parsers import code_range_str_to_interval
 from pipeline.parsers.icd_10_code_parsers import get_condensed_cause_code_dict
 from pipeline.parsers.icd_10_code_parsers import get_portugal_condensed_cause_code_dict
 from pipeline.parsers.icd_10_code_parsers import get_country_codes_dict
+from pipeline.parsers.icd_10_code_parsers import build_cause_code_lookup
+from pipeline.parsers.icd_10_code_parsers import get_aggregate_causes
 
 
 class ExtractCharNumeralPairTestCase(unittest.TestCase):
@@ -82,6 +87,17 @@ class CodeRangeStrToListTestCase(unittest.TestCase):
             code_range_str_to_list(input_str)
 
 
+class CodeRangeStrToIntervalTestCase(unittest.TestCase):
+    def test_valid_code_range_str(self):
+        self.assertEqual(code_range_str_to_interval('A98-B03'), (6598, 6603))
+        self.assertEqual(code_range_str_to_interval('A99'), (6599, 6599))
+
+    def test_invalid_code_range(self):
+        for input_str in ['abcd', 'A98-B0100', 'B02-A98']:
+            with self.assertRaises(ValueError):
+                code_range_str_to_interval(input_str)
+
+
 class DetailedCodeStrToListTestCase(unittest.TestCase):
     def test_valid_list_numbers_str(self):
         input_str = 'A98-B03, B06-B07'
@@ -156,6 +172,19 @@ class Get3CharCauseCodeDictTestCase(unittest.TestCase):
         self.assertEqual(get_3_char_cause_code_dict(), expected_output)
 
 
+class Get3CharCauseCodeIndexTestCase(unittest.TestCase):
+
+    @patch('pipeline.parsers.icd_10_code_parsers.ICD_10_CAUSE_CODES_PATH', TEST_RESOURCES + '/mock_cause_codes.csv')
+    def test_overlapping_ranges_resolved(self):
+        index = get_3_char_cause_code_index()
+
+        expected_output = ['Cholera', 'Other infectious diseases', 'Remainder of diseases',
+                           'Certain infectious and parasitic diseases', 'Remainder of diseases']
+
+        self.assertEqual(list(index.get_causes(['A95', 'A99', 'B02', 'B04', 'B085'])), expected_output)
+        self.assertEqual(len(index), 10)
+
+
 class GetCondensedCauseCodeDictTestCase(unittest.TestCase):
 
     @patch('pipeline.parsers.icd_10_code_parsers.ICD_10_CAUSE_CODES_PATH', TEST_RESOURCES + '/mock_cause_codes.csv')
@@ -185,6 +214,29 @@ class GetPortugalCondensedCauseCodeDictTestCase(unittest.TestCase):
         self.assertEqual(get_portugal_condensed_cause_code_dict(), expected_output)
 
 
+class GetAggregateCausesTestCase(unittest.TestCase):
+
+    @patch('pipeline.parsers.icd_10_code_parsers.ICD_10_PORTUGAL_CAUSE_CODES_PATH',
+           TEST_RESOURCES + '/mock_portugal_cause_codes.csv')
+    @patch('pipeline.parsers.icd_10_code_parsers.ICD_10_CAUSE_CODES_PATH', TEST_RESOURCES + '/mock_cause_codes.csv')
+    def test_totals_and_chapters(self):
+
+        expected_output = {'All causes', 'Certain infectious and parasitic diseases'}
+
+        self.assertEqual(get_aggregate_causes(), expected_output)
+
+    def test_aggregate_in_one_list_only(self):
+        # 'Diarrhoea' is a cause of its own in list 101 (mock_cause_codes.csv)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as portugal_cause_codes:
+            portugal_cause_codes.write('Code,Detailed codes,Cause\nUE02,A15-A19,Diarrhoea\nUE03,A16,Cholera\n')
+            portugal_cause_codes.flush()
+            with patch('pipeline.parsers.icd_10_code_parsers.ICD_10_PORTUGAL_CAUSE_CODES_PATH',
+                       portugal_cause_codes.name), \
+                    patch('pipeline.parsers.icd_10_code_parsers.ICD_10_CAUSE_CODES_PATH',
+                          TEST_RESOURCES + '/mock_cause_codes.csv'):
+                self.assertEqual(get_aggregate_causes(), {'All causes', 'Certain infectious and parasitic diseases'})
+
+
 class GetCountryCodesTestCase(unittest.TestCase):
 
     @patch('pipeline.parsers.icd_10_code_parsers.COUNTRY_CODES_PATH',
@@ -200,5 +252,15 @@ class GetCountryCodesTestCase(unittest.TestCase):
         self.assertEqual(get_country_codes_dict(), expected_output)
 
 
+class BuildCauseCodeLookupTestCase(unittest.TestCase):
+    def test_lists_combined(self):
+        lookup = build_cause_code_lookup({'1002': 'Cholera'}, {'UE03': 'Diarrhoea'})
+
+        expected_output = {('101', '1002'): 'Cholera',
+                           ('UE1', 'UE03'): 'Diarrhoea'}
+
+        self.assertEqual(lookup.to_dict(), expected_output)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from pipeline.parsers.icd_10_code_range_index import CodeRangeIndex
+from pipeline.parsers.icd_10_code_range_index import decode_code
+from pipeline.parsers.icd_10_code_range_index import encode_code
+from pipeline.parsers.icd_10_code_range_index import encode_codes
+
+
+class EncodeCodeTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        self.assertEqual(encode_code('A', '99') + 1, encode_code('B', '00'))
+        self.assertEqual(decode_code(encode_code('B', '01')), 'B01')
+
+    def test_vectorized(self):
+        codes = ['A00', 'B019', 'C34X', 'a01', 'A1', None, 'Z99']
+
+        expected_output = [6500, 6601, 6734, -1, -1, -1, 9099]
+
+        self.assertEqual(list(encode_codes(codes)), expected_output)
+
+
+class CodeRangeIndexTestCase(unittest.TestCase):
+    ranges = [(encode_code('A', '95'), encode_code('B', '10'), 'Infectious'),
+              (encode_code('A', '95'), encode_code('A', '95'), 'Cholera'),
+              (encode_code('B', '02'), encode_code('B', '03'), 'Remainder'),
+              (encode_code('C', '00'), encode_code('C', '05'), 'Neoplasms')]
+
+    def test_later_ranges_take_precedence(self):
+        index = CodeRangeIndex.from_ranges(self.ranges)
+
+        codes = ['A94', 'A95', 'A96', 'B01', 'B02', 'B03', 'B04', 'B10', 'B11', 'C03', 'C06']
+        expected_output = [None, 'Cholera', 'Infectious', 'Infectious', 'Remainder', 'Remainder', 'Infectious',
+                           'Infectious', None, 'Neoplasms', None]
+
+        self.assertEqual([cause if isinstance(cause, str) else None for cause in index.get_causes(codes)],
+                         expected_output)
+        self.assertEqual(index.get_cause('B039'), 'Remainder')
+        self.assertIsNone(index.get_cause('B11'))
+
+    def test_matches_materialized_dict(self):
+        index = CodeRangeIndex.from_ranges(self.ranges)
+
+        expected_output = {}
+        for start, end, cause in self.ranges:
+            for encoded_code in range(start, end + 1):
+                expected_output[decode_code(encoded_code)] = cause
+
+        self.assertEqual(index.to_dict(), expected_output)
+        self.assertEqual(len(index), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from sqlalchemy import text
+from pipeline.query import batch_queries, mortality_queries
+from pipeline.query.batch_queries import CAUSE_TIME_SERIES_BATCH, to_batch_query
+from pipeline.query.mortality_queries import CauseDeaths, YearDeaths
+from pipeline.query.query_engine import to_prepared_statement
+from tests.pipeline.mock_coverage import mock_coverage_index
+from tests.pipeline.query.test_mortality_queries import UE1_MORTALITY_RATES, sqlite_query_engine
+
+
+class BatchQueriesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.query_engine = sqlite_query_engine()
+
+    def test_answers_in_question_order(self):
+        questions = [('deaths', {'country': 'Algeria', 'year': 2008}),
+                     ('top_causes', {'country': 'Algeria', 'year': 2008, 'n': 1}),
+                     ('cause_time_series', {'cause': 'Cholera'}),
+                     ('deaths', {'country': 'Algeria', 'year': 2008, 'sex': 'm', 'cause': 'Cholera'}),
+                     ('deaths_by_sex', {'country': 'France', 'year': 2008}),
+                     ('top_causes', {'country': 'Algeria', 'year': 1990}),
+                     ('cause_time_series', {'cause': 'Cholera', 'country': 'France'}),
+                     ('deaths', {'country': 'France', 'year': 2008})]
+        expected_answers = [getattr(mortality_queries, question_name)(self.query_engine, **params)
+                            for question_name, params in questions]
+
+        self.assertEqual(batch_queries.ask_many(sqlite_query_engine(), questions), expected_answers)
+        self.assertEqual(expected_answers[1:3], [[CauseDeaths('Tetanus', 25)],
+                                                 [YearDeaths(2008, 23), YearDeaths(2009, 3)]])
+
+    def test_ue1_total_used(self):
+        with self.query_engine.engine.begin() as conn:
+            conn.execute(text("INSERT INTO mortality_rates VALUES (:country, :year, :cause, :sex, :deaths)"),
+                         [dict(zip(['country', 'year', 'cause', 'sex', 'deaths'], row)) for row in UE1_MORTALITY_RATES])
+
+        self.assertEqual(batch_queries.ask_many(self.query_engine, [('deaths', {'country': 'Portugal', 'year': 2008})]),
+                         [100])
+
+    def test_statement_per_shape(self):
+        questions = [('deaths', {'country': country, 'year': year})
+                     for country in ['Algeria', 'France'] for year in [2008, 2009]]
+        # Asked twice, the same (country, year, cause) rows of deaths_by_sex answer both
+        questions += [('deaths_by_sex', {'country': 'Algeria', 'year': 2008})] * 2
+
+        answers = batch_queries.ask_many(self.query_engine, questions, batch_size=3)
+
+        self.assertEqual(answers[:4], [70, 3, 3, 0])
+        latency_stats = self.query_engine.latency_stats()
+        self.assertEqual({name: stats['count'] for name, stats in latency_stats.items()},
+                         {'batch_deaths_by_sex_3': 1, 'batch_deaths_by_sex_1': 1})
+
+    def test_no_coverage_not_asked(self):
+        self.query_engine.coverage = mock_coverage_index()
+        questions = [('deaths', {'country': 'Algeria', 'year': 2008}),
+                     ('deaths', {'country': 'France', 'year': 2007}),
+                     ('top_causes', {'country': 'France', 'year': 2007}),
+                     ('deaths', {'country': 'Italy', 'year': 2008})]
+
+        self.assertEqual(batch_queries.ask_many(self.query_engine, questions), [70, 0, [], 0])
+        self.assertEqual(list(self.query_engine.latency_stats()), ['batch_deaths_by_sex_2'])
+
+    def test_invalid_questions(self):
+        for question in [('population', {'country': 'Algeria'}), ('deaths', {'country': 'Algeria'}),
+                         ('top_causes', {'country': 'Algeria', 'year': 2008, 'sex': 'f'})]:
+            with self.assertRaises(ValueError):
+                batch_queries.ask_many(self.query_engine, [question])
+
+    def test_prepared_batch_statement(self):
+        prepare_sql, execute_sql = to_prepared_statement(to_batch_query(CAUSE_TIME_SERIES_BATCH, 2))
+
+        self.assertTrue(prepare_sql.startswith("PREPARE batch_cause_time_series_2 (int, text, text, int, text, text) "
+                                               "AS WITH params (idx, cause, country) AS (VALUES ($1, $2, $3), "
+                                               "($4, $5, $6)) SELECT"))
+        self.assertEqual(execute_sql, "EXECUTE batch_cause_time_series_2 "
+                                      "(:idx_0, :cause_0, :country_0, :idx_1, :cause_1, :country_1)")
+
+
+if __name__ == '__main__':
+    unittest.main()
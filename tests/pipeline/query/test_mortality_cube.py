@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from pipeline.query.mortality_cube import MortalityCube
+from pipeline.query.mortality_queries import CauseDeaths, SexDeaths, YearDeaths
+from tests.pipeline.query.test_mortality_queries import MORTALITY_RATES, UE1_MORTALITY_RATES
+
+
+COUNTRY_NAMES = {1010: 'Algeria', 4080: 'France'}
+CAUSE_NAMES = pd.Series(['All causes', 'Cholera', 'Plague', 'Tetanus', 'Typhoid'],
+                        index=pd.RangeIndex(1, 6, name='cause_id'), name='cause')
+
+
+def mortality_facts():
+    mortality_df = pd.DataFrame(MORTALITY_RATES, columns=['country', 'year', 'cause', 'sex', 'deaths'])
+    return pd.DataFrame({'country_id': mortality_df['country'].map({name: country_id for country_id, name
+                                                                    in COUNTRY_NAMES.items()}),
+                         'year': mortality_df['year'],
+                         'cause_id': mortality_df['cause'].map(pd.Series(CAUSE_NAMES.index, index=CAUSE_NAMES)),
+                         'sex': mortality_df['sex'],
+                         'deaths': mortality_df['deaths']})
+
+
+class MortalityCubeTestCase(unittest.TestCase):
+    """
+    Answers the questions of MortalityQueriesTestCase from the cube, which should match the database.
+    """
+
+    def setUp(self):
+        self.cube_dir = tempfile.TemporaryDirectory()
+        MortalityCube.from_facts(mortality_facts(), COUNTRY_NAMES, CAUSE_NAMES).save(self.cube_dir.name)
+        self.cube = MortalityCube.open(self.cube_dir.name)
+
+    def tearDown(self):
+        self.cube_dir.cleanup()
+
+    def test_opened_as_memory_map(self):
+        self.assertIsInstance(self.cube.cube, np.memmap)
+        self.assertEqual(self.cube.cube.dtype, np.int32)
+        self.assertEqual(self.cube.cube.shape, (2, 2, 5, 3))
+        self.assertEqual(sorted(os.listdir(self.cube_dir.name)), ['axes.json', 'deaths.npy'])
+
+    def test_top_causes(self):
+        self.assertEqual(self.cube.top_causes('Algeria', 2008),
+                         [CauseDeaths('Tetanus', 25), CauseDeaths('Cholera', 22)])
+        self.assertEqual(self.cube.top_causes('Algeria', 2008, n=1), [CauseDeaths('Tetanus', 25)])
+        self.assertEqual(self.cube.top_causes('Algeria', 1990), [])
+
+    def test_deaths(self):
+        self.assertEqual(self.cube.deaths_by_sex('Algeria', 2008), [SexDeaths('f', 30), SexDeaths('m', 40)])
+        self.assertEqual(self.cube.deaths('Algeria', 2008), 70)
+        self.assertEqual(self.cube.deaths('Algeria', 2008, sex='m', cause='Cholera'), 10)
+        # Without an 'All causes' total the causes are summed
+        self.assertEqual(self.cube.deaths('France', 2008), 3)
+        self.assertEqual(self.cube.deaths('Italy', 2008), 0)
+
+    def test_cause_time_series(self):
+        self.assertEqual(self.cube.cause_time_series('Cholera'), [YearDeaths(2008, 23), YearDeaths(2009, 3)])
+        self.assertEqual(self.cube.cause_time_series('Cholera', country='France'), [YearDeaths(2008, 1)])
+        self.assertEqual(self.cube.cause_time_series('Typhoid'), [])
+
+    def test_aggregate_causes_not_ranked_next_to_their_causes(self):
+        cube = np.zeros((2, 1, 3, 3), dtype=np.int32)
+        # Algeria reports list 101 causes with their chapter, France a list 104 residual cause named like the chapter
+        cube[0, 0, :, 0] = [10, 4, 6]
+        cube[1, 0, 1:, 0] = [1, 2]
+        causes = ['All causes', 'Cholera', 'Certain infectious and parasitic diseases']
+        MortalityCube(cube, [1010, 4080], ['Algeria', 'France'], [2008], [1, 2, 3], causes,
+                      aggregate_causes=['Certain infectious and parasitic diseases', 'Neoplasms']).save(
+            self.cube_dir.name)
+        mortality_cube = MortalityCube.open(self.cube_dir.name)
+        self.assertEqual(mortality_cube.aggregate_causes, ['Certain infectious and parasitic diseases'])
+        self.assertEqual(mortality_cube.top_causes('Algeria', 2008), [CauseDeaths('Cholera', 4)])
+        self.assertEqual(mortality_cube.top_causes('France', 2008),
+                         [CauseDeaths('Certain infectious and parasitic diseases', 2), CauseDeaths('Cholera', 1)])
+
+    def test_ue1_total_used(self):
+        ue1_df = pd.DataFrame(UE1_MORTALITY_RATES, columns=['country', 'year', 'cause', 'sex', 'deaths'])
+        cause_names = pd.Series(sorted(ue1_df['cause'].unique()), index=pd.RangeIndex(1, 4, name='cause_id'))
+        facts_df = pd.DataFrame({'country_id': 4240, 'year': ue1_df['year'],
+                                 'cause_id': ue1_df['cause'].map(pd.Series(cause_names.index, index=cause_names)),
+                                 'sex': ue1_df['sex'], 'deaths': ue1_df['deaths']})
+        mortality_cube = MortalityCube.from_facts(facts_df, {4240: 'Portugal'}, cause_names,
+                                                  aggregate_causes=['Certain infectious and parasitic diseases'])
+
+        self.assertEqual(mortality_cube.deaths('Portugal', 2008), 100)
+        self.assertEqual(mortality_cube.deaths_by_sex('Portugal', 2008), [SexDeaths('f', 100)])
+        self.assertEqual(mortality_cube.top_causes('Portugal', 2008), [CauseDeaths('Cholera', 40)])
+
+    def test_axes_must_match_cube(self):
+        with self.assertRaises(ValueError):
+            MortalityCube(np.zeros((1, 1, 1, 3), dtype=np.int32), [1010], ['Algeria'], [2008], [1, 2],
+                          ['All causes', 'Cholera'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine, text
+from pipeline.query import mortality_queries
+from pipeline.query.mortality_queries import TOTAL_CAUSES, CauseDeaths, SexDeaths, YearDeaths, MortalityRate
+from pipeline.query.query_engine import Query, QueryEngine, to_prepared_statement
+from tests.pipeline.mock_coverage import mock_coverage_index
+
+
+MORTALITY_RATES = [('Algeria', 2008, 'All causes', 'f', 30),
+                   ('Algeria', 2008, 'All causes', 'm', 40),
+                   ('Algeria', 2008, 'Cholera', 'f', 12),
+                   ('Algeria', 2008, 'Cholera', 'm', 10),
+                   ('Algeria', 2008, 'Tetanus', 'm', 25),
+                   ('Algeria', 2009, 'Cholera', 'f', 3),
+                   ('France', 2008, 'Cholera', 'f', 1),
+                   ('France', 2008, 'Plague', 'u', 2)]
+
+# A country-year reported with list UE1, whose total and chapter overlap Cholera
+UE1_MORTALITY_RATES = [('Portugal', 2008, 'ALL CAUSES OF DEATH', 'f', 100),
+                       ('Portugal', 2008, 'Certain infectious and parasitic diseases', 'f', 100),
+                       ('Portugal', 2008, 'Cholera', 'f', 40)]
+
+# Causes of the test rows which total other causes, see icd_10_code_parsers.get_aggregate_causes
+AGGREGATE_CAUSES = set(TOTAL_CAUSES) | {'Certain infectious and parasitic diseases'}
+
+
+def sqlite_query_engine(mortality_rates=MORTALITY_RATES):
+    """
+    SQLite stand-in for the who database, see create_sqlite_stand_in.
+    """
+    engine = create_engine('sqlite://')
+    create_sqlite_stand_in(engine, mortality_rates)
+    return QueryEngine(engine)
+
+
+def create_sqlite_stand_in(engine, mortality_rates=MORTALITY_RATES):
+    """
+    Creates the mortality_rates table of the given rows in a SQLite database, with the top causes rollup built the
+    same way as in postgres_setup.sql: total and aggregate causes (AGGREGATE_CAUSES) aren't ranked in country-years
+    with a total cause.
+    """
+    causes = sorted({row[2] for row in mortality_rates})
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE mortality_rates (country text, year smallint, cause text, sex char(1), "
+                          "deaths int, PRIMARY KEY(country, year, cause, sex))"))
+        conn.execute(text("INSERT INTO mortality_rates VALUES (:country, :year, :cause, :sex, :deaths)"),
+                     [dict(zip(['country', 'year', 'cause', 'sex', 'deaths'], row)) for row in mortality_rates])
+        conn.execute(text("CREATE TABLE cause (name text PRIMARY KEY, total boolean, aggregate boolean)"))
+        conn.execute(text("INSERT INTO cause VALUES (:name, :total, :aggregate)"),
+                     [{'name': cause, 'total': cause in TOTAL_CAUSES, 'aggregate': cause in AGGREGATE_CAUSES}
+                      for cause in causes])
+        conn.execute(text("CREATE TABLE top_causes_by_country_year AS "
+                          "SELECT country, year, rank, cause, deaths FROM ("
+                          "SELECT totals.country, totals.year, totals.cause, totals.deaths, row_number() OVER "
+                          "(PARTITION BY totals.country, totals.year ORDER BY totals.deaths DESC, totals.cause) "
+                          "AS rank FROM ("
+                          "SELECT m.country, m.year, m.cause, sum(m.deaths) AS deaths, "
+                          "max(cause.aggregate) AS aggregate, "
+                          "max(max(cause.total)) OVER (PARTITION BY m.country, m.year) AS condensed "
+                          "FROM mortality_rates m JOIN cause ON cause.name = m.cause "
+                          "GROUP BY m.country, m.year, m.cause"
+                          ") totals WHERE NOT (totals.aggregate AND totals.condensed)"
+                          ") WHERE rank <= 10"))
+
+
+class MortalityQueriesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.query_engine = sqlite_query_engine()
+
+    def test_top_causes(self):
+        self.assertEqual(mortality_queries.top_causes(self.query_engine, 'Algeria', 2008),
+                         [CauseDeaths('Tetanus', 25), CauseDeaths('Cholera', 22)])
+        self.assertEqual(mortality_queries.top_causes(self.query_engine, 'Algeria', 2008, n=1),
+                         [CauseDeaths('Tetanus', 25)])
+        self.assertEqual(mortality_queries.top_causes(self.query_engine, 'Algeria', 1990), [])
+
+    def test_deaths(self):
+        self.assertEqual(mortality_queries.deaths_by_sex(self.query_engine, 'Algeria', 2008),
+                         [SexDeaths('f', 30), SexDeaths('m', 40)])
+        self.assertEqual(mortality_queries.deaths(self.query_engine, 'Algeria', 2008), 70)
+        self.assertEqual(mortality_queries.deaths(self.query_engine, 'Algeria', 2008, sex='m', cause='Cholera'), 10)
+        # Without an 'All causes' total the causes are summed
+        self.assertEqual(mortality_queries.deaths(self.query_engine, 'France', 2008), 3)
+
+    def test_ue1_total_used(self):
+        with self.query_engine.engine.begin() as conn:
+            conn.execute(text("INSERT INTO mortality_rates VALUES (:country, :year, :cause, :sex, :deaths)"),
+                         [dict(zip(['country', 'year', 'cause', 'sex', 'deaths'], row)) for row in UE1_MORTALITY_RATES])
+
+        self.assertEqual(mortality_queries.deaths(self.query_engine, 'Portugal', 2008), 100)
+
+    def test_aggregate_causes_not_ranked_with_total(self):
+        query_engine = sqlite_query_engine(MORTALITY_RATES + UE1_MORTALITY_RATES)
+
+        self.assertEqual(mortality_queries.top_causes(query_engine, 'Portugal', 2008), [CauseDeaths('Cholera', 40)])
+
+    def test_cause_time_series(self):
+        self.assertEqual(mortality_queries.cause_time_series(self.query_engine, 'Cholera'),
+                         [YearDeaths(2008, 23), YearDeaths(2009, 3)])
+        self.assertEqual(mortality_queries.cause_time_series(self.query_engine, 'Cholera', country='France'),
+                         [YearDeaths(2008, 1)])
+
+    def test_iter_mortality_rates(self):
+        self.assertEqual(list(mortality_queries.iter_mortality_rates(self.query_engine, year=2008, batch_size=2)),
+                         [MortalityRate(*row) for row in MORTALITY_RATES if row[1] == 2008])
+
+    def test_no_coverage_answered_without_query(self):
+        self.query_engine.coverage = mock_coverage_index()
+
+        # France 2007 is recorded without any list
+        self.assertEqual(mortality_queries.top_causes(self.query_engine, 'France', 2007), [])
+        self.assertEqual(mortality_queries.deaths(self.query_engine, 'France', 2007), 0)
+        self.assertEqual({name: stats['count'] for name, stats in self.query_engine.latency_stats().items()}, {})
+
+    def test_unknown_coverage_queried(self):
+        self.query_engine.coverage = mock_coverage_index()
+
+        self.assertEqual(mortality_queries.top_causes(self.query_engine, 'Algeria', 2008, n=1),
+                         [CauseDeaths('Tetanus', 25)])
+        # Italy isn't in the availability file and 2019 is after it, so both are asked
+        self.assertEqual(mortality_queries.deaths(self.query_engine, 'Italy', 2008), 0)
+        self.assertEqual(mortality_queries.deaths(self.query_engine, 'Algeria', 2019), 0)
+        self.assertEqual(mortality_queries.cause_time_series(self.query_engine, 'Cholera', country='France'),
+                         [YearDeaths(2008, 1)])
+        self.assertEqual({name: stats['count'] for name, stats in self.query_engine.latency_stats().items()},
+                         {'top_causes': 1, 'deaths_by_sex': 2, 'cause_time_series': 1})
+
+    def test_latency_recorded(self):
+        mortality_queries.top_causes(self.query_engine, 'Algeria', 2008)
+        mortality_queries.top_causes(self.query_engine, 'France', 2008)
+
+        self.assertEqual(self.query_engine.latency_stats()['top_causes']['count'], 2)
+
+
+class PreparedStatementTestCase(unittest.TestCase):
+    query = Query('deaths', "SELECT sum(deaths)::bigint FROM mortality_rates WHERE country = :country "
+                            "AND (:year IS NULL OR year = :year)",
+                  (('country', 'text'), ('year', 'smallint')))
+
+    def test_to_prepared_statement(self):
+        expected_output = ("PREPARE deaths (text, smallint) AS SELECT sum(deaths)::bigint FROM mortality_rates "
+                           "WHERE country = $1 AND ($2 IS NULL OR year = $2)",
+                           "EXECUTE deaths (:country, :year)")
+
+        self.assertEqual(to_prepared_statement(self.query), expected_output)
+
+    def test_prepared_once_per_connection(self):
+        engine = MagicMock()
+        engine.dialect.name = 'postgresql'
+        conn = engine.connect.return_value.__enter__.return_value
+        conn.info = {}
+        query_engine = QueryEngine(engine)
+
+        query_engine.execute(self.query, {'country': 'Algeria', 'year': 2008})
+        query_engine.execute(self.query, {'country': 'France', 'year': None})
+
+        conn.exec_driver_sql.assert_called_once_with(to_prepared_statement(self.query)[0])
+        self.assertEqual([str(call.args[0]) for call in conn.execute.call_args_list],
+                         ["EXECUTE deaths (:country, :year)"] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from pipeline.query.result_cache import ResultCache
+
+
+def top_causes(query_engine, country, year, n=10):
+    query_engine(country, year, n)
+    return [f'{country} {year} {n}']
+
+
+class ResultCacheTestCase(unittest.TestCase):
+
+    def test_hits_share_normalized_params(self):
+        cache = ResultCache()
+        query_engine = MagicMock()
+        cached_top_causes = cache.cached(top_causes)
+
+        self.assertEqual(cached_top_causes(query_engine, 'Algeria', 2008), ['Algeria 2008 10'])
+        self.assertEqual(cached_top_causes(query_engine, country='Algeria', year=2008, n=10), ['Algeria 2008 10'])
+        self.assertEqual(cached_top_causes(query_engine, 'Algeria', 2008, n=5), ['Algeria 2008 5'])
+
+        self.assertEqual(query_engine.call_count, 2)
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 2))
+
+    def test_least_recently_used_evicted(self):
+        cache = ResultCache(max_entries=2)
+        compute = MagicMock(return_value=[])
+
+        for key in ['a', 'b', 'a', 'c', 'a', 'b']:
+            cache.get_or_compute(key, compute)
+
+        # 'b' is evicted by 'c', as 'a' was used more recently
+        self.assertEqual(compute.call_count, 4)
+        self.assertEqual(cache.stats()['evictions'], 2)
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_expired_entries_recomputed(self):
+        cache = ResultCache(ttl_seconds=0)
+        compute = MagicMock(return_value=[])
+
+        cache.get_or_compute('a', compute)
+        cache.get_or_compute('a', compute)
+
+        self.assertEqual(compute.call_count, 2)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_invalidated_by_load_generation(self):
+        generation = [1]
+        cache = ResultCache(generation_source=lambda: generation[0], generation_check_seconds=0)
+        compute = MagicMock(return_value=[])
+
+        cache.get_or_compute('a', compute)
+        cache.get_or_compute('a', compute)
+        generation[0] = 2
+        cache.get_or_compute('a', compute)
+
+        self.assertEqual(compute.call_count, 2)
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+    def test_disk_backend_shared(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            disk_path = os.path.join(temp_dir, 'results.sqlite')
+            generation = [1]
+            compute = MagicMock(return_value=['Cholera'])
+
+            ResultCache(disk_path=disk_path, generation_source=lambda: generation[0]).get_or_compute('a', compute)
+            self.assertEqual(ResultCache(disk_path=disk_path,
+                                         generation_source=lambda: generation[0]).get_or_compute('a', compute),
+                             ['Cholera'])
+            self.assertEqual(compute.call_count, 1)
+
+            # Results of an older load generation are ignored
+            generation[0] = 2
+            ResultCache(disk_path=disk_path, generation_source=lambda: generation[0]).get_or_compute('a', compute)
+            self.assertEqual(compute.call_count, 2)
+
+    def test_disk_backend_pruned(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            disk_path = os.path.join(temp_dir, 'results.sqlite')
+            generation = [1]
+            cache = ResultCache(disk_path=disk_path, generation_source=lambda: generation[0],
+                                generation_check_seconds=0)
+            cache.get_or_compute('a', lambda: 'a')
+            ResultCache(ttl_seconds=0, disk_path=disk_path, generation_source=lambda: generation[0]).get_or_compute(
+                'b', lambda: 'b')
+            # Storing a result deletes expired ones
+            cache.get_or_compute('c', lambda: 'c')
+            self.assertEqual(cache.disk_backend.conn.execute("SELECT key FROM results ORDER BY key").fetchall(),
+                             [("'a'",), ("'c'",)])
+
+            # Results of older load generations are deleted once the generation changes
+            generation[0] = 2
+            cache.get_or_compute('d', lambda: 'd')
+            self.assertEqual(cache.disk_backend.conn.execute("SELECT key FROM results").fetchall(), [("'d'",)])
+
+
+if __name__ == '__main__':
+    unittest.main()
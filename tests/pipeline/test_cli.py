@@ -0,0 +1,95 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from definitions import ROOT_DIR
+from pipeline import cli
+from pipeline.query.mortality_cube import MortalityCube
+from tests.pipeline.query.test_mortality_cube import CAUSE_NAMES, COUNTRY_NAMES, mortality_facts
+from tests.pipeline.query.test_mortality_queries import create_sqlite_stand_in
+
+
+# Imported by the stages, but never just by starting the CLI
+HEAVY_MODULES = ['numpy', 'pandas', 'pyarrow', 'requests', 'sqlalchemy', 'tqdm']
+
+# Generous bound on the cumulative import time of the CLI, which takes ~20ms where the stage modules take seconds
+MAX_IMPORT_MICROSECONDS = 500000
+
+
+def import_times(module):
+    """
+    Imports a module in a fresh interpreter with -X importtime.
+
+    :param module: str
+    :return: {module: cumulative microseconds} dict of every module imported
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT_DIR,
+                            capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and not line.endswith('| imported package'):
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+class CliTestCase(unittest.TestCase):
+    def test_cold_start(self):
+        times = import_times('pipeline.cli')
+
+        self.assertEqual([module for module in HEAVY_MODULES if module in times], [])
+        self.assertLess(times['pipeline.cli'], MAX_IMPORT_MICROSECONDS)
+
+    def test_query_from_cube(self):
+        with tempfile.TemporaryDirectory() as cube_dir:
+            MortalityCube.from_facts(mortality_facts(), COUNTRY_NAMES, CAUSE_NAMES).save(cube_dir)
+            output = io.StringIO()
+            with redirect_stdout(output):
+                cli.main(['query', '--cube-dir', cube_dir, 'top_causes', '--country', 'Algeria', '--year', '2008'])
+                cli.main(['query', '--cube-dir', cube_dir, 'deaths', '--country', 'Algeria', '--year', '2008'])
+
+        self.assertEqual(output.getvalue().splitlines(), ['{"cause": "Tetanus", "deaths": 25}',
+                                                          '{"cause": "Cholera", "deaths": 22}',
+                                                          '{"deaths": 70}'])
+
+    def test_query_from_result_cache(self):
+        engine = create_engine('sqlite://')
+        create_sqlite_stand_in(engine)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE load_generation (generation bigint)"))
+            conn.execute(text("INSERT INTO load_generation VALUES (1)"))
+
+        def top_causes(result_cache_path):
+            output = io.StringIO()
+            with patch('pipeline.query.query_engine.create_pooled_engine', return_value=engine), \
+                    redirect_stdout(output):
+                cli.main(['query', '--result-cache', result_cache_path, 'top_causes', '--country', 'Algeria',
+                          '--year', '2008', '--n', '1'])
+            return output.getvalue().splitlines()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            result_cache_path = os.path.join(temp_dir, 'query_results.sqlite')
+            self.assertEqual(top_causes(result_cache_path), ['{"cause": "Tetanus", "deaths": 25}'])
+
+            with engine.begin() as conn:
+                conn.execute(text("DELETE FROM top_causes_by_country_year"))
+            self.assertEqual(top_causes(result_cache_path), ['{"cause": "Tetanus", "deaths": 25}'])
+
+            # A load invalidates the cached answers
+            with engine.begin() as conn:
+                conn.execute(text("UPDATE load_generation SET generation = 2"))
+            self.assertEqual(top_causes(result_cache_path), [])
+
+    def test_missing_question_params(self):
+        with self.assertRaises(SystemExit), redirect_stderr(io.StringIO()):
+            cli.main(['query', 'top_causes', '--country', 'Algeria'])
+
+
+if __name__ == '__main__':
+    unittest.main()
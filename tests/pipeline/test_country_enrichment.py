@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from pipeline.ingest.country_enrichment import CountryEnricher, RestCountriesSource, daylight_hours
+
+
+# REST Countries responses of the fake server
+COUNTRIES = {'Algeria': {'latlng': [28.0, 3.0], 'area': 2381741.0},
+             'Finland': {'latlng': [64.0, 26.0], 'area': 338424.0},
+             'France': {'latlng': [46.0, 2.0], 'area': 551695.0},
+             'GBR': {'latlng': [54.0, -2.0], 'area': 242900.0}}
+
+
+class FakeRestCountries:
+    """
+    Serves COUNTRIES like the REST Countries API, failing the first failures[country] requests of a country with 503
+    and keeping track of the requests made and how many were in flight at once.
+    """
+
+    def __init__(self, failures=None, delay_seconds=0):
+        self.failures = dict(failures or {})
+        self.delay_seconds = delay_seconds
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def country(self, request):
+        name = request.match_info['name']
+        self.requests.append(name)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay_seconds)
+        finally:
+            self.in_flight -= 1
+        if self.failures.get(name, 0) > 0:
+            self.failures[name] -= 1
+            raise web.HTTPServiceUnavailable()
+        if name not in COUNTRIES:
+            raise web.HTTPNotFound()
+        return web.json_response([COUNTRIES[name]])
+
+    async def alpha(self, request):
+        response = await self.country(request)
+        return web.json_response(json.loads(response.text)[0])
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/v3.1/name/{name}', self.country)
+        app.router.add_get('/v3.1/alpha/{name}', self.alpha)
+        return app
+
+
+class CountryEnrichmentTestCase(unittest.IsolatedAsyncioTestCase):
+    countries = {1010: 'Algeria', 4070: 'Finland', 4080: 'France', 9999: 'Atlantis'}
+
+    async def asyncSetUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.temp_dir.name, 'enrichment.sqlite')
+
+    async def asyncTearDown(self):
+        self.temp_dir.cleanup()
+
+    async def enrich(self, fake_server, countries=None, **kwargs):
+        server = TestServer(fake_server.app())
+        await server.start_server()
+        try:
+            enricher = CountryEnricher(RestCountriesSource(str(server.make_url('/v3.1'))), cache_path=self.cache_path,
+                                       retry_backoff_seconds=0, **kwargs)
+            return enricher, await enricher.enrich(countries or self.countries)
+        finally:
+            await server.close()
+
+    async def test_enrich(self):
+        enricher, attributes_df = await self.enrich(FakeRestCountries())
+
+        self.assertEqual(sorted(attributes_df['country_id'].unique()), [1010, 4070, 4080])
+        finland = attributes_df[attributes_df['country_id'] == 4070].set_index('attribute')['value']
+        self.assertEqual((finland['latitude'], finland['area_km2']), (64.0, 338424.0))
+        self.assertGreater(finland['daylight_hours_june_solstice'], 20)
+        self.assertEqual(set(attributes_df['source']), {'restcountries'})
+
+    async def test_rerun_served_from_cache(self):
+        _, attributes_df = await self.enrich(FakeRestCountries())
+        fake_server = FakeRestCountries()
+        enricher, cached_df = await self.enrich(fake_server)
+
+        self.assertEqual(fake_server.requests, [])
+        self.assertEqual(enricher.counters['cache_hits'], len(self.countries))
+        self.assertTrue(cached_df.equals(attributes_df))
+
+    async def test_expired_responses_requested_again(self):
+        await self.enrich(FakeRestCountries(), ttl_seconds=0)
+        fake_server = FakeRestCountries()
+        await self.enrich(fake_server, ttl_seconds=0)
+
+        self.assertEqual(sorted(fake_server.requests), sorted(self.countries.values()))
+
+    async def test_countries_named_differently_looked_up_by_alpha_code(self):
+        fake_server = FakeRestCountries()
+        _, attributes_df = await self.enrich(fake_server, countries={4330: 'United Kingdom, Scotland'})
+
+        self.assertEqual(fake_server.requests, ['GBR'])
+        scotland = attributes_df.set_index('attribute')['value']
+        self.assertEqual((scotland['latitude'], scotland['area_km2']), (54.0, 242900.0))
+
+    async def test_not_found_cached_shorter(self):
+        await self.enrich(FakeRestCountries(), not_found_ttl_seconds=0)
+        fake_server = FakeRestCountries()
+        await self.enrich(fake_server, not_found_ttl_seconds=0)
+
+        self.assertEqual(fake_server.requests, ['Atlantis'])
+
+    async def test_retries(self):
+        enricher, attributes_df = await self.enrich(FakeRestCountries(failures={'France': 2}))
+
+        self.assertEqual(enricher.counters['retries'], 2)
+        self.assertIn(4080, set(attributes_df['country_id']))
+
+        self.cache_path = os.path.join(self.temp_dir.name, 'empty.sqlite')
+        with self.assertRaises(IOError):
+            await self.enrich(FakeRestCountries(failures={'Algeria': 3}), countries={1010: 'Algeria'}, retries=2)
+
+    async def test_concurrency_bounded(self):
+        fake_server = FakeRestCountries(delay_seconds=0.05)
+        await self.enrich(fake_server, concurrency=2, requests_per_second=1000)
+
+        self.assertEqual(len(fake_server.requests), len(self.countries))
+        self.assertEqual(fake_server.max_in_flight, 2)
+
+    def test_daylight_hours(self):
+        self.assertAlmostEqual(daylight_hours(0, 23.44), 12)
+        self.assertEqual((daylight_hours(70, 23.44), daylight_hours(70, -23.44)), (24, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from pipeline.ingest import downloader
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the files of the server from memory, with ETags and range requests like the WHO servers. Requests are
+    logged on the server, and the server can be told to drop the connection on a number of range requests, or to
+    replace a file with a new version (server.changed_files) after a number of GET requests.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_file_headers(self, status, length):
+        content = self.server.files[self.path]
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', self.server.etags[self.path])
+        if self.server.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {self.range[0]}-{self.range[1]}/{len(content)}')
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.server.requests.append(('HEAD', None))
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return
+        self.send_file_headers(200, len(self.server.files[self.path]))
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        with self.server.lock:
+            self.server.requests.append(('GET', range_header))
+            if self.server.change_after_requests == len(self.server.requests):
+                for path, (content, etag) in self.server.changed_files.items():
+                    self.server.files[path] = content
+                    self.server.etags[path] = etag
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return
+        content = self.server.files[self.path]
+        if_range = self.headers.get('If-Range')
+        if (not self.server.accept_ranges or range_header is None
+                or (if_range is not None and if_range != self.server.etags[self.path])):
+            self.send_file_headers(200, len(content))
+            self.wfile.write(content)
+            return
+
+        start, end = map(int, re.match(r'bytes=(\d+)-(\d+)', range_header).groups())
+        self.range = (start, min(end, len(content) - 1))
+        with self.server.lock:
+            dropped = self.server.dropped_range_requests > 0
+            self.server.dropped_range_requests -= dropped
+        self.send_file_headers(206, self.range[1] - self.range[0] + 1)
+        # A dropped connection only delivers part of the range
+        self.wfile.write(content[start:start + 10] if dropped else content[start:self.range[1] + 1])
+
+
+class DownloaderTestCase(unittest.TestCase):
+    content = bytes(range(256)) * 400
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('localhost', 0), RangeRequestHandler)
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://localhost:{cls.server.server_address[1]}/Morticd10_part1.zip'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.files = {'/Morticd10_part1.zip': self.content}
+        self.server.etags = {'/Morticd10_part1.zip': '"v1"'}
+        self.server.accept_ranges = True
+        self.server.dropped_range_requests = 0
+        self.server.change_after_requests = None
+        self.server.changed_files = {}
+        self.server.requests = []
+        self.download_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.download_dir.name, 'Morticd10_part1.zip')
+
+    def tearDown(self):
+        self.download_dir.cleanup()
+
+    def download(self, **kwargs):
+        return downloader.download(self.url, download_dir=self.download_dir.name, connections=3, chunk_size=1024,
+                                   segment_size=10000, **kwargs)
+
+    def get_requests(self):
+        return [range_header for method, range_header in self.server.requests if method == 'GET']
+
+    def test_range_download(self):
+        self.assertEqual(self.download(), self.path)
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(len(self.get_requests()), 11)
+        with open(self.path + '.json') as f:
+            self.assertEqual(json.load(f)['sha256'], hashlib.sha256(self.content).hexdigest())
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+    def test_unchanged_file_skipped(self):
+        self.download()
+        self.server.requests = []
+
+        self.download()
+
+        self.assertEqual(self.server.requests, [('HEAD', None)])
+
+    def test_corrupted_copy_downloaded_again(self):
+        self.download()
+        with open(self.path, 'r+b') as f:
+            f.write(b'corrupted')
+        self.server.requests = []
+
+        self.download()
+
+        self.assertEqual(len(self.get_requests()), 11)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_changed_file_downloaded_again(self):
+        self.download()
+        self.server.files['/Morticd10_part1.zip'] = self.content[::-1]
+        self.server.etags['/Morticd10_part1.zip'] = '"v2"'
+
+        self.download()
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content[::-1])
+
+    @patch('pipeline.ingest.downloader.RETRY_BACKOFF_SECONDS', 0)
+    def test_interrupted_download_resumed(self):
+        self.server.dropped_range_requests = 4
+        with self.assertRaises(Exception):
+            self.download(retries=0)
+        with open(self.path + '.part.json') as f:
+            completed = json.load(f)['completed']
+        self.assertEqual(len(completed), 7)
+
+        self.server.requests = []
+        self.download(retries=0)
+
+        # Only the segments which were dropped are requested again
+        self.assertEqual(len(self.get_requests()), 4)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    @patch('pipeline.ingest.downloader.RETRY_BACKOFF_SECONDS', 0)
+    def test_dropped_connection_retried(self):
+        self.server.dropped_range_requests = 2
+
+        self.download(retries=2)
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    @patch('pipeline.ingest.downloader.RETRY_BACKOFF_SECONDS', 0)
+    def test_file_changed_during_download_restarted(self):
+        self.server.change_after_requests = 2
+        self.server.changed_files = {'/Morticd10_part1.zip': (self.content[::-1], '"v2"')}
+
+        self.download()
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content[::-1])
+        # The file is requested again after a new HEAD request
+        self.assertEqual(self.server.requests.count(('HEAD', None)), 2)
+        with open(self.path + '.json') as f:
+            self.assertEqual(json.load(f)['etag'], '"v2"')
+
+    def test_server_without_range_requests(self):
+        self.server.accept_ranges = False
+
+        self.download()
+
+        self.assertEqual(self.get_requests(), [None])
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
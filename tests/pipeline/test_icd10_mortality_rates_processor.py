@@ -1,20 +1,39 @@
+import io
+import os
+import tempfile
+import threading
 import unittest
+import zipfile
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch
+import numpy as np
 import pandas as pd
 from definitions import TEST_RESOURCES
+from pipeline import instrumentation
+from pipeline.ingest import age_bands
 from pipeline.ingest import icd10_mortality_rates_processor
+from pipeline.parsers import icd_10_code_parsers
+from pipeline.parsers.icd_10_code_range_index import CodeRangeIndex, encode_code
+from tests.pipeline.mock_coverage import mock_coverage_index
 
 
-class ICD10IngestTestCase(unittest.TestCase):
+def mock_zipped_csv():
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w') as zip_ref:
+        zip_ref.write(TEST_RESOURCES + '/mock_icd10_input_csv.csv', arcname='Morticd10_mock')
+    zip_buffer.seek(0)
+    return zip_buffer
+
+
+def with_names(df):
+    return icd10_mortality_rates_processor.with_names(df, icd10_mortality_rates_processor.get_code_lookups())
 
-    @patch('pipeline.ingest.icd10_mortality_rates_processor.download_file')
-    @patch('pipeline.ingest.icd10_mortality_rates_processor.unzip_file')
-    def test_icd10_mortality_rates_ingest_success(self, mock_unzip_file, mock_download_file):
-        mock_unzip_file.return_value = TEST_RESOURCES + '/mock_icd10_input_csv.csv'
-        mock_download_file.return_value = 'test'
 
-        columns = ['country', 'year', 'cause', 'sex', 'deaths']
-        input_data = [['Algeria', 2001, 'Cholera', 'f', 12],
+class ICD10IngestTestCase(unittest.TestCase):
+
+    expected_columns = ['country', 'year', 'cause', 'sex', 'deaths']
+    expected_data = [['Algeria', 2001, 'Cholera', 'f', 12],
                      ['Algeria', 2001, 'Cholera', 'm', 10],
                      ['Algeria', 2002, 'Tetanus', 'f', 2],
                      ['Algeria', 2002, 'Tetanus', 'm', 4],
@@ -23,12 +42,221 @@ class ICD10IngestTestCase(unittest.TestCase):
                      ['Italy', 2002, 'Plague', 'm', 4],
                      ['Lithuania', 2002, 'Plague', 'f', 5]]
 
-        expected_output_df = pd.DataFrame(input_data, columns=columns)
+    @patch('pipeline.ingest.icd10_mortality_rates_processor.download_file')
+    def test_icd10_mortality_rates_ingest_success(self, mock_download_file):
+        mock_download_file.return_value = mock_zipped_csv()
+
+        expected_output_df = pd.DataFrame(self.expected_data, columns=self.expected_columns)
 
-        pd.testing.assert_frame_equal(icd10_mortality_rates_processor.run('test_url'),
+        output_df = icd10_mortality_rates_processor.run('test_url')
+
+        self.assertEqual(list(output_df.columns), icd10_mortality_rates_processor.AGGREGATION_KEYS + ['deaths'])
+        pd.testing.assert_frame_equal(with_names(output_df),
                                       expected_output_df,
                                       check_dtype=False)
 
+    @patch('pipeline.ingest.icd10_mortality_rates_processor.download_file')
+    def test_icd10_mortality_rates_chunked_ingest_success(self, mock_download_file):
+        expected_output_df = pd.DataFrame(self.expected_data, columns=self.expected_columns)
+
+        # Chunk boundaries split rows sharing the same key, so partial aggregates have to be merged
+        for chunksize in [1, 3, 5]:
+            mock_download_file.return_value = mock_zipped_csv()
+            pd.testing.assert_frame_equal(with_names(icd10_mortality_rates_processor.run('test_url',
+                                                                                         chunksize=chunksize)),
+                                          expected_output_df,
+                                          check_dtype=False)
+
+    def test_rows_contradicting_coverage_dropped(self):
+        with icd10_mortality_rates_processor.open_zipped_csv(mock_zipped_csv()) as csv_file:
+            mortality_df, = icd10_mortality_rates_processor.read_mortality_csv(csv_file)
+        # France reported 2001 in list 104 only, the other country-years aren't contradicted by the mock file
+        code_lookups = {**icd10_mortality_rates_processor.get_code_lookups(), 'coverage': mock_coverage_index()}
+        expected_output_df = pd.DataFrame([row for row in self.expected_data if row[0] != 'France'],
+                                          columns=self.expected_columns)
+
+        report = instrumentation.RunReport()
+        with instrumentation.recording(report):
+            output_df = icd10_mortality_rates_processor.transform(mortality_df, code_lookups)
+
+        pd.testing.assert_frame_equal(with_names(output_df), expected_output_df, check_dtype=False)
+        self.assertEqual((report.stages['coverage_pruning']['rows_in'], report.stages['coverage_pruning']['rows_out']),
+                         (8, 6))
+
+    def test_coverage_pruning_opt_in(self):
+        self.assertIsNone(icd10_mortality_rates_processor.get_code_lookups()['coverage'])
+        self.assertIsNotNone(icd10_mortality_rates_processor.get_code_lookups(coverage_pruning=True)['coverage'])
+
+
+class AgeResolvedIngestTestCase(unittest.TestCase):
+
+    def test_age_band_columns_remapped(self):
+        # Format 01 reports 1, 2, 3 and 4 year olds separately, format 02 reports 85-89, 90-94 and 95+
+        raw_df = pd.DataFrame([{'Frmat': 1.0, 'Deaths2': 3.0, 'Deaths3': 1.0, 'Deaths6': 2.0, 'Deaths7': 4.0,
+                                'Deaths25': 5.0, 'IM_Deaths1': 1.0, 'IM_Deaths2': 2.0, 'IM_Deaths4': 7.0},
+                               {'Frmat': 7.0, 'Deaths23': 6.0, 'Deaths26': 8.0}],
+                              columns=list(age_bands.AGE_COLUMN_DTYPES))
+
+        deaths_by_age, age_exact = age_bands.to_age_band_block(raw_df)
+
+        expected_deaths_by_age = np.zeros((2, len(age_bands.AGE_BANDS)), dtype=np.int32)
+        expected_deaths_by_age[0, [0, 1, 2, 18, 20, 22]] = [3, 3, 4, 5, 3, 7]
+        expected_deaths_by_age[1, [18, 19]] = [6, 8]
+        np.testing.assert_array_equal(deaths_by_age, expected_deaths_by_age)
+        np.testing.assert_array_equal(age_exact, [True, False])
+
+    @patch('pipeline.ingest.icd10_mortality_rates_processor.download_file')
+    def test_icd10_mortality_rates_age_resolved_ingest_success(self, mock_download_file):
+        expected_output_df = pd.DataFrame(ICD10IngestTestCase.expected_data,
+                                          columns=ICD10IngestTestCase.expected_columns).assign(age_exact=False)
+
+        expected_cholera_m_row = np.zeros(len(age_bands.AGE_BANDS), dtype=np.int32)
+        expected_cholera_m_row[[0, 1, 2, 4, 6, 8, 10, 12, 14, 16, 20]] = [8, 2, 1, 9, 21, 36, 39, 53, 68, 95, 8]
+
+        for chunksize in [None, 1, 3]:
+            mock_download_file.return_value = mock_zipped_csv()
+            output = icd10_mortality_rates_processor.run('test_url', chunksize=chunksize, age_resolved=True)
+
+            pd.testing.assert_frame_equal(with_names(output.mortality_df), expected_output_df, check_dtype=False)
+            self.assertEqual(output.deaths_by_age.shape, (len(expected_output_df), len(age_bands.AGE_BANDS)))
+            self.assertEqual(output.deaths_by_age.dtype, np.int32)
+            np.testing.assert_array_equal(output.deaths_by_age[1], expected_cholera_m_row)
+
+
+class ResolveCausesTestCase(unittest.TestCase):
+    condensed_cause_code_dict = {'1002': 'Cholera', '1003': 'Diarrhoea'}
+    portugal_cause_code_dict = {'UE02': 'Cholera', 'UE03': 'Typhoid'}
+    cause_code_index = CodeRangeIndex.from_ranges([(encode_code('A', '00'), encode_code('A', '09'), 'Diarrhoea'),
+                                                   (encode_code('A', '00'), encode_code('A', '00'), 'Cholera')])
+    # Cause ids number the causes in order of their names
+    cause_dimension = icd_10_code_parsers.build_cause_dimension(condensed_cause_code_dict, cause_code_index,
+                                                                portugal_cause_code_dict)
+    cause_lookup = icd_10_code_parsers.build_cause_id_lookup(
+        icd_10_code_parsers.build_cause_code_lookup(condensed_cause_code_dict, portugal_cause_code_dict),
+        cause_dimension)
+    cause_code_index_ids = icd_10_code_parsers.get_cause_ids(cause_dimension, cause_code_index.causes)
+
+    def resolve_causes(self, lists, causes):
+        return icd10_mortality_rates_processor.resolve_causes(pd.Series(lists), pd.Series(causes), self.cause_lookup,
+                                                              self.cause_code_index, self.cause_code_index_ids)
+
+    def test_cause_dimension(self):
+        self.assertEqual(self.cause_dimension.to_dict(), {1: 'Cholera', 2: 'Diarrhoea', 3: 'Typhoid'})
+
+    def test_all_lists_resolved(self):
+        resolved_causes = self.resolve_causes(['101', '103', '104', '10M', 'UE1', '101', '103', 'UE1'],
+                                              ['1002', 'A09', 'A000', 'A09X', 'UE02', '1003', 'A00', 'UE03'])
+
+        self.assertEqual(resolved_causes.dtype, np.int32)
+        self.assertEqual(list(resolved_causes), [1, 2, 1, 2, 1, 2, 1, 3])
+
+    def test_unknown_codes_and_lists(self):
+        resolved_causes = self.resolve_causes(['101', '103', 'UE1', '999', '103'], ['A00', '1002', None, 'A00', 'B99'])
+
+        self.assertEqual(list(resolved_causes), [-1] * 5)
+
+
+class GetDimensionsTestCase(unittest.TestCase):
+    def test_total_and_aggregate_causes_flagged(self):
+        code_lookups = {'country': {1010: 'Algeria'},
+                        'cause_dimension': pd.Series(['ALL CAUSES OF DEATH', 'All causes', 'Cholera', 'Neoplasms'],
+                                                     index=pd.RangeIndex(1, 5, name='cause_id')),
+                        'aggregate_causes': frozenset({'ALL CAUSES OF DEATH', 'All causes', 'Neoplasms'})}
+
+        cause_df = icd10_mortality_rates_processor.get_dimensions(code_lookups)['cause']
+
+        self.assertEqual(list(cause_df['total']), [True, True, False, False])
+        self.assertEqual(list(cause_df['aggregate']), [True, True, False, True])
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class RunAllTestCase(unittest.TestCase):
+    """
+    Serves the mock input split into two zipped parts from a local HTTP server, so the parts can be downloaded by
+    worker processes.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.serve_dir = tempfile.TemporaryDirectory()
+        with open(TEST_RESOURCES + '/mock_icd10_input_csv.csv', 'r') as f:
+            header, *rows = f.readlines()
+        # Both parts contain rows of the Algeria 2001 Cholera group, which have to be combined across parts
+        for part, part_rows in [('part1', rows[:5]), ('part2', rows[:1] + rows[5:])]:
+            with zipfile.ZipFile(os.path.join(cls.serve_dir.name, f'Morticd10_{part}.zip'), 'w') as zip_ref:
+                zip_ref.writestr(f'Morticd10_{part}', header + ''.join(part_rows))
+
+        handler = partial(QuietHTTPRequestHandler, directory=cls.serve_dir.name)
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.urls = [f'http://127.0.0.1:{cls.server.server_port}/Morticd10_{part}.zip' for part in ['part1', 'part2']]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.serve_dir.cleanup()
+
+    def expected_output_df(self):
+        expected_output_df = pd.DataFrame(ICD10IngestTestCase.expected_data,
+                                          columns=ICD10IngestTestCase.expected_columns)
+        expected_output_df.loc[1, 'deaths'] += 10
+        return expected_output_df
+
+    def test_sequential_parts_merged(self):
+        pd.testing.assert_frame_equal(with_names(icd10_mortality_rates_processor.run_all(self.urls, workers=1)),
+                                      self.expected_output_df(),
+                                      check_dtype=False)
+
+    def test_parallel_parts_merged(self):
+        pd.testing.assert_frame_equal(with_names(icd10_mortality_rates_processor.run_all(self.urls, workers=2,
+                                                                                         chunksize=2)),
+                                      self.expected_output_df(),
+                                      check_dtype=False)
+
+    def test_worker_stages_recorded(self):
+        report = instrumentation.RunReport()
+        with instrumentation.recording(report):
+            icd10_mortality_rates_processor.run_all(self.urls, workers=2)
+
+        self.assertEqual(report.stages['download']['calls'], 2)
+        self.assertEqual(report.stages['read_csv']['rows_out'], 9)
+        self.assertEqual(report.stages['code_mapping']['rows_in'], 9)
+        self.assertEqual(report.stages['merge']['rows_out'], 8)
+
+    def test_parts_kept_in_download_dir(self):
+        with tempfile.TemporaryDirectory() as download_dir:
+            for _ in range(2):
+                pd.testing.assert_frame_equal(with_names(icd10_mortality_rates_processor.run_all(
+                                                  self.urls, download_dir=download_dir)),
+                                              self.expected_output_df(),
+                                              check_dtype=False)
+            self.assertEqual(sorted(os.listdir(download_dir)), ['Morticd10_part1.zip', 'Morticd10_part1.zip.json',
+                                                                'Morticd10_part2.zip', 'Morticd10_part2.zip.json'])
+
+
+class OpenZippedCsvTestCase(unittest.TestCase):
+    def test_reads_csv_without_extracting(self):
+        with open(TEST_RESOURCES + '/mock_icd10_input_csv.csv', 'rb') as f:
+            expected_output = f.read()
+
+        with icd10_mortality_rates_processor.open_zipped_csv(mock_zipped_csv()) as csv_file:
+            self.assertEqual(csv_file.read(), expected_output)
+
+    def test_empty_zip(self):
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w'):
+            pass
+        zip_buffer.seek(0)
+
+        with self.assertRaises(ValueError):
+            with icd10_mortality_rates_processor.open_zipped_csv(zip_buffer):
+                pass
+
 
 if __name__ == '__main__':
     unittest.main()
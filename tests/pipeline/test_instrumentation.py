@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+import unittest
+from pipeline import instrumentation
+
+
+def allocate_and_sum(n):
+    return sum(list(range(n)))
+
+
+class StageTestCase(unittest.TestCase):
+    def test_stages_combined_by_name(self):
+        report = instrumentation.RunReport()
+        with instrumentation.recording(report):
+            for chunk_rows in [3, 4]:
+                with instrumentation.stage('aggregate') as rows:
+                    rows.rows_in = chunk_rows
+                    rows.rows_out = 1
+            with instrumentation.stage('write'):
+                pass
+
+        self.assertEqual(report.stages['aggregate']['calls'], 2)
+        self.assertEqual(report.stages['aggregate']['rows_in'], 7)
+        self.assertEqual(report.stages['aggregate']['rows_out'], 2)
+        self.assertIsNone(report.stages['write']['rows_in'])
+        self.assertGreaterEqual(report.stages['write']['wall_seconds'], 0)
+        self.assertIsNone(instrumentation.active_report())
+
+    def test_nothing_recorded_without_report(self):
+        with instrumentation.stage('aggregate') as rows:
+            rows.rows_out = 1
+        self.assertIsNone(instrumentation.active_report())
+
+    def test_timed_iter(self):
+        report = instrumentation.RunReport()
+        with instrumentation.recording(report):
+            chunks = list(instrumentation.timed_iter('read_csv', iter([[1, 2], [3]])))
+
+        self.assertEqual(chunks, [[1, 2], [3]])
+        self.assertEqual(report.stages['read_csv']['rows_out'], 3)
+        self.assertEqual(report.stages['read_csv']['calls'], 2)
+
+    def test_cprofile_capture_excludes_nested_stages(self):
+        report = instrumentation.RunReport(capture='cprofile')
+        with instrumentation.recording(report):
+            with instrumentation.stage('outer'):
+                with instrumentation.stage('inner'):
+                    allocate_and_sum(1000)
+
+        profiles = report.to_dict()['stages']
+        self.assertTrue(any('allocate_and_sum' in entry['function'] for entry in profiles['inner']['profile']))
+        self.assertFalse(any('allocate_and_sum' in entry['function'] for entry in profiles['outer']['profile']))
+
+    def test_tracemalloc_capture(self):
+        report = instrumentation.RunReport(capture='tracemalloc')
+        with instrumentation.recording(report):
+            with instrumentation.stage('outer'):
+                with instrumentation.stage('inner'):
+                    allocate_and_sum(100000)
+
+        # A list of 100000 ints takes at least 800KB
+        self.assertGreater(report.stages['inner']['traced_peak_bytes'], 800000)
+        self.assertGreaterEqual(report.stages['outer']['traced_peak_bytes'],
+                                report.stages['inner']['traced_peak_bytes'])
+
+    def test_merge_worker_report(self):
+        report = instrumentation.RunReport(capture='cprofile')
+        with instrumentation.recording(report):
+            with instrumentation.stage('read_csv') as rows:
+                rows.rows_out = 2
+
+        def run_part():
+            with instrumentation.stage('read_csv') as rows:
+                rows.rows_out = 3
+            return 'part'
+
+        result, summary = instrumentation.call_recorded('cprofile', run_part)
+        report.merge(summary)
+
+        self.assertEqual(result, 'part')
+        self.assertEqual(report.stages['read_csv']['calls'], 2)
+        self.assertEqual(report.stages['read_csv']['rows_out'], 5)
+
+    def test_write_json_report(self):
+        report = instrumentation.RunReport()
+        with instrumentation.recording(report):
+            with instrumentation.stage('write'):
+                pass
+
+        with tempfile.TemporaryDirectory() as report_dir:
+            report_path = os.path.join(report_dir, 'reports', 'run.json')
+            report.write(report_path, status='succeeded')
+            with open(report_path) as f:
+                written_report = json.load(f)
+
+        self.assertEqual(written_report['metadata'], {'status': 'succeeded'})
+        self.assertEqual(set(written_report['stages']['write']),
+                         {'calls', 'wall_seconds', 'cpu_seconds', 'rows_in', 'rows_out', 'peak_rss_bytes'})
+
+    def test_unknown_capture_mode(self):
+        with self.assertRaises(ValueError):
+            instrumentation.RunReport(capture='perf')
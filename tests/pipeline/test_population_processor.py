@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+import pandas as pd
+from definitions import TEST_RESOURCES
+from pipeline.ingest import age_bands
+from pipeline.ingest import population_processor
+
+
+class PopulationIngestTestCase(unittest.TestCase):
+    def test_national_rows_preferred_and_subdivisions_summed(self):
+        population = population_processor.run(TEST_RESOURCES + '/mock_population_csv.csv')
+
+        expected_population_df = pd.DataFrame([[1010, 2001, 'f', 1200000, True],
+                                               [1010, 2001, 'm', 1000000, True],
+                                               [4180, 2002, 'm', 40000, False]],
+                                              columns=['country_id', 'year', 'sex', 'population', 'age_exact'])
+        pd.testing.assert_frame_equal(population.population_df, expected_population_df, check_dtype=False)
+
+        # Format 01 reports 1, 2, 3 and 4 year olds separately, format 07 combines 5-14 under 5-9
+        np.testing.assert_array_equal(population.population_by_age[1, :3], [20000, 80000, 100000])
+        np.testing.assert_array_equal(population.population_by_age[2, :4], [1500, 5500, 8000, 0])
+        self.assertEqual(population.population_by_age[0, age_bands.AGE_BANDS.index('unknown')], 200000)
+
+
+class ComputeRatesTestCase(unittest.TestCase):
+    # Algeria 1010, France 4080 and Italy 4180
+    population = population_processor.run(TEST_RESOURCES + '/mock_population_csv.csv')
+
+    def test_crude_rates(self):
+        mortality_df = pd.DataFrame([[1010, 2001, 1, 'f', 12],
+                                     [1010, 2001, 1, 'm', 10],
+                                     [4080, 2001, 2, 'f', 14],
+                                     [4180, 2002, 3, 'm', 4]],
+                                    columns=['country_id', 'year', 'cause_id', 'sex', 'deaths'])
+
+        rates_df = population_processor.compute_rates(mortality_df, self.population)
+
+        np.testing.assert_array_equal(rates_df['population'].to_numpy(dtype=float, na_value=np.nan),
+                                      [1200000, 1000000, np.nan, 40000])
+        np.testing.assert_allclose(rates_df['crude_rate'], [1.0, 1.0, np.nan, 10.0])
+        self.assertTrue(rates_df['age_standardized_rate'].isna().all())
+
+    def test_age_standardized_rates(self):
+        mortality_df = pd.DataFrame([[1010, 2001, 1, 'f', 100, False],
+                                     [1010, 2001, 1, 'm', 100, True],
+                                     [4180, 2002, 3, 'm', 4, True]],
+                                    columns=['country_id', 'year', 'cause_id', 'sex', 'deaths', 'age_exact'])
+        deaths_by_age = np.zeros((3, len(age_bands.AGE_BANDS)), dtype=np.int32)
+        # 1 death per 1000 people in every age group of Algerian men
+        deaths_by_age[1, :19] = self.population.population_by_age[1, :19] / 1000
+        deaths_by_age[2, 2] = 4
+
+        rates_df = population_processor.compute_rates(age_bands.AgeResolvedMortality(mortality_df, deaths_by_age),
+                                                      self.population)
+
+        # Mortality of Algerian women and population of Italy are not reported in exact age groups
+        np.testing.assert_allclose(rates_df['age_standardized_rate'], [np.nan, 100.0, np.nan])
+        np.testing.assert_allclose(rates_df['crude_rate'], [100 / 12, 10.0, 10.0])